@@ -104,6 +104,16 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Use a shared backend (e.g. redis:// or memcached://) when running several
+# workers so iCARE board snapshots are invalidated for all of them.
+
+CACHES = {
+    "default": env.dj_cache_url("CACHE_URL", default="locmem://")
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -193,6 +203,12 @@ ACCOUNT_USERNAME_REQUIRED = False  # Username is not required
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Hand document PDF transfers to the front proxy after Django's permission
+# checks: "" serves from Django, "nginx" sends X-Accel-Redirect to an
+# internal location aliasing MEDIA_ROOT, "apache" sends X-Sendfile
+DOCUMENT_SENDFILE_BACKEND = env.str("DOCUMENT_SENDFILE_BACKEND", default="")
+DOCUMENT_SENDFILE_URL = env.str("DOCUMENT_SENDFILE_URL", default="/protected-media/")
+
 # allows to load iframe from same hostname
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
@@ -0,0 +1,298 @@
+import copy
+import gc
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict, deque
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from pypdf import PdfReader
+from pypdf.errors import FileNotDecryptedError, PyPdfError
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+)
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+from .models import DocumentFieldValue
+from .pdf import (
+    FINGERPRINT_VALUE_FIELDS,
+    PDF_RENDER_WAIT_TIMEOUT,
+    _write_atomically,
+    cached_pdf_path,
+    generate_pdf,
+    pdf_fingerprint,
+    single_flight,
+)
+from .serving import file_etag
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the merge itself changes; part of every chart cache key
+CHART_BUNDLE_VERSION = 2
+
+CHART_CACHE_DIR = 'documents/charts'
+
+# Source bytes merged between collections of the readers already finished
+MERGE_COLLECT_BYTES = 32 * 1024 * 1024
+
+
+class ChartBundle:
+    """The per-document PDFs that make up one patient's chart, in chart order."""
+
+    def __init__(self, patient):
+        self.patient = patient
+        self.sources = []  # [(path, cache key, document title)]
+        self.missing = []  # generated documents whose PDF is not cached yet
+
+    @property
+    def fingerprint(self):
+        # Each source key already identifies its content, so the chart is
+        # current exactly when the list of keys is
+        keys = [key for _, key, _ in self.sources]
+        payload = [CHART_BUNDLE_VERSION, str(self.patient.pk), keys]
+        encoded = json.dumps(payload, separators=(',', ':')).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    @property
+    def path(self):
+        fingerprint = self.fingerprint
+        return os.path.join(
+            settings.MEDIA_ROOT, CHART_CACHE_DIR,
+            fingerprint[:2], fingerprint[2:4], f'{fingerprint}.pdf',
+        )
+
+
+def chart_documents(patient):
+    return patient.documents.select_related(
+        'patient', 'owner', 'document_type'
+    ).order_by('creation_date', 'pk')
+
+
+def collect_chart(patient, render_missing=False):
+    """Find the cached PDF of every document of ``patient``.
+
+    Generated documents whose PDF is not cached are rendered when
+    ``render_missing`` is set and otherwise listed in ``missing``. Uploaded
+    documents whose file is gone are left out. Field values for all
+    documents are read in one query, so this is two queries in total.
+    """
+    field_values = defaultdict(list)
+    rows = DocumentFieldValue.objects.filter(
+        document__patient=patient
+    ).order_by('document_id', 'pk')
+    for document_id, *field_value in rows.values_list(
+        'document_id', *FINGERPRINT_VALUE_FIELDS
+    ):
+        field_values[document_id].append(tuple(field_value))
+
+    bundle = ChartBundle(patient)
+    for document in chart_documents(patient):
+        if document.is_uploaded_pdf:
+            if document.pdf_file and os.path.exists(document.pdf_file.path):
+                path = document.pdf_file.path
+                key = f'{document.pk}:{file_etag(os.stat(path))}'
+                bundle.sources.append((path, key, document.title))
+            continue
+
+        fingerprint = pdf_fingerprint(document, field_values[document.pk])
+        path = cached_pdf_path(fingerprint)
+        if not os.path.exists(path) and render_missing:
+            path = generate_pdf(document, fingerprint)
+        if path and os.path.exists(path):
+            bundle.sources.append((path, fingerprint, document.title))
+        else:
+            bundle.missing.append(document)
+    return bundle
+
+
+def _renumbered(value, number_of):
+    """A copy of ``value`` with every reference renumbered by ``number_of``."""
+    if isinstance(value, IndirectObject):
+        return IndirectObject(number_of(value), 0, None)
+    if isinstance(value, ArrayObject):
+        return ArrayObject(_renumbered(item, number_of) for item in value)
+    if isinstance(value, DictionaryObject):
+        # A stream's copy shares its data; only the entries are replaced
+        if isinstance(value, StreamObject):
+            renumbered = copy.copy(value)
+        else:
+            renumbered = DictionaryObject()
+        for key, item in value.items():
+            renumbered[key] = _renumbered(item, number_of)
+        return renumbered
+    return NullObject() if value is None else value
+
+
+class _ChartWriter:
+    """Writes a PDF to ``stream`` one source document at a time.
+
+    The objects a source's pages use are renumbered and written with
+    pypdf's ``write_to_stream`` as soon as the source is read, so all that
+    is kept between sources is the offset of every object written and the
+    numbers of the pages.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offsets = []  # by object number - 1
+        self.page_numbers = []
+        self.pages_number = self._reserve()
+        stream.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def _reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets)
+
+    def _write_object(self, number, value):
+        self.offsets[number - 1] = self.stream.tell()
+        self.stream.write(f'{number} 0 obj\n'.encode())
+        value.write_to_stream(self.stream)
+        self.stream.write(b'\nendobj\n')
+
+    def append(self, reader):
+        numbers = {}  # source (idnum, generation) -> object number here
+        pending = deque()
+
+        def number_of(reference):
+            key = (reference.idnum, reference.generation)
+            if key not in numbers:
+                numbers[key] = self._reserve()
+                pending.append(key)
+            return numbers[key]
+
+        # Every page is parsed before anything is written, so a source that
+        # cannot be read leaves the output untouched
+        source_pages = list(reader.pages)
+        pages = {}
+        for page in source_pages:
+            # Pages are re-parented onto this file's page tree; the reader
+            # already copied inherited attributes onto each page
+            parent = page.raw_get('/Parent')
+            if isinstance(parent, IndirectObject):
+                numbers.setdefault((parent.idnum, parent.generation), self.pages_number)
+            reference = page.indirect_reference
+            pages[(reference.idnum, reference.generation)] = page
+            self.page_numbers.append(number_of(reference))
+
+        while pending:
+            key = pending.popleft()
+            try:
+                if key in pages:
+                    value = pages[key]
+                else:
+                    value = reader.get_object(IndirectObject(*key, reader))
+            except PyPdfError:
+                value = None  # a damaged object is written as null
+            self._write_object(numbers[key], _renumbered(value, number_of))
+
+    def close(self):
+        self._write_object(self.pages_number, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(
+                IndirectObject(number, 0, None) for number in self.page_numbers
+            ),
+            NameObject('/Count'): NumberObject(len(self.page_numbers)),
+        }))
+        catalog_number = self._reserve()
+        self._write_object(catalog_number, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.pages_number, 0, None),
+        }))
+
+        xref_offset = self.stream.tell()
+        self.stream.write(
+            f'xref\n0 {len(self.offsets) + 1}\n0000000000 65535 f \n'.encode()
+        )
+        for offset in self.offsets:
+            self.stream.write(f'{offset:010d} 00000 n \n'.encode())
+        self.stream.write(
+            f'trailer\n<< /Size {len(self.offsets) + 1} /Root {catalog_number} 0 R >>\n'
+            f'startxref\n{xref_offset}\n%%EOF\n'.encode()
+        )
+
+
+def _notice_page(text):
+    """A one-page PDF saying ``text``, for sources left out of a chart."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    for i, line in enumerate(simpleSplit(text, 'Helvetica', 12, width - 144)):
+        pdf.drawString(72, height - 72 - 16 * i, line)
+    pdf.showPage()
+    pdf.save()
+    buffer.seek(0)
+    return PdfReader(buffer)
+
+
+def merge_pdfs(sources, pdf_path):
+    """Concatenate the PDFs of ``sources``, ``(path, title)`` pairs, into ``pdf_path``.
+
+    Pages are written out as each source is read and the source is closed
+    before the next is opened, so memory is bounded by the largest source
+    plus ``MERGE_COLLECT_BYTES`` rather than the whole chart. Outlines and
+    form fields of the sources are not carried over. A source that cannot
+    be read, such as a password-protected or damaged upload, is replaced by
+    a page saying so.
+    """
+
+    def write(pdf_file):
+        chart = _ChartWriter(pdf_file)
+        uncollected = 0
+        for path, title in sources:
+            try:
+                with open(path, 'rb') as source:
+                    reader = PdfReader(source)
+                    if reader.is_encrypted:
+                        reader.decrypt('')  # opens PDFs that only restrict editing
+                    chart.append(reader)
+                uncollected += os.path.getsize(path)
+            except FileNotDecryptedError:
+                logger.warning(
+                    "Left password-protected %s out of chart %s", path, pdf_path
+                )
+                chart.append(_notice_page(
+                    f'"{title}" is left out of this chart: '
+                    'its PDF is password-protected.'
+                ))
+            except (PyPdfError, OSError) as e:
+                logger.warning(
+                    "Left unreadable %s out of chart %s: %s", path, pdf_path, e
+                )
+                chart.append(_notice_page(
+                    f'"{title}" is left out of this chart: '
+                    'its file is not a readable PDF.'
+                ))
+            # A finished reader is only freed by the cycle collector, which
+            # does not count bytes; run it once enough have been read
+            if uncollected >= MERGE_COLLECT_BYTES:
+                gc.collect()
+                uncollected = 0
+        chart.close()
+        return True
+
+    return _write_atomically(pdf_path, write)
+
+
+def build_chart_pdf(bundle, timeout=PDF_RENDER_WAIT_TIMEOUT):
+    """Return the path of the merged chart PDF, merging it if not cached.
+
+    Like document PDFs, charts are content-addressed and merged at most once
+    at a time. Returns ``None`` if there is nothing to merge or merging fails.
+    """
+    if not bundle.sources:
+        return None
+    pdf_path = bundle.path
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    sources = [(path, title) for path, _, title in bundle.sources]
+    return single_flight(pdf_path, partial(merge_pdfs, sources), timeout)
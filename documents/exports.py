@@ -0,0 +1,71 @@
+from itertools import groupby
+from operator import itemgetter
+
+from django.utils.text import slugify
+
+from patients.exports import EXPORT_CHUNK_SIZE, streaming_export_response
+
+# Per-document columns written before the one-per-field columns
+DOCUMENT_EXPORT_COLUMNS = ('document_id', 'title', 'patient', 'owner', 'creation_date')
+_DOCUMENT_EXPORT_LOOKUPS = (
+    'pk', 'title', 'patient__name', 'owner__username', 'creation_date'
+)
+
+
+def field_columns(fields):
+    """Column names for ``fields``; repeated names get the field id appended."""
+    names = [field.name for field in fields]
+    return [
+        f'{field.name} ({field.pk})'
+        if names.count(field.name) > 1 or field.name in DOCUMENT_EXPORT_COLUMNS
+        else field.name
+        for field in fields
+    ]
+
+
+def pivot_rows(rows, field_ids):
+    """Turn ``(*document columns, field_id, value)`` rows into one row per document.
+
+    ``rows`` must be ordered by document, so each document's values are
+    contiguous and only one document is held at a time. Fields without a
+    value are written as empty strings.
+    """
+    position = {field_id: i for i, field_id in enumerate(field_ids)}
+    for _, group in groupby(rows, key=itemgetter(0)):
+        values = [''] * len(field_ids)
+        for row in group:
+            field_id, value = row[-2:]
+            if field_id in position:
+                values[position[field_id]] = value
+        yield (*row[:-2], *values)
+
+
+def export_documents(
+    document_type, queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE
+):
+    """Stream the ``document_type`` documents of ``queryset`` as one row each.
+
+    One query walks documents left-joined to their field values, ordered by
+    ``(document_id, field_id)`` through a server-side cursor on PostgreSQL,
+    and :func:`pivot_rows` groups it back into rows, so memory stays flat
+    however many documents there are. Raises ``ValueError`` for an unknown
+    ``export_format``.
+    """
+    fields = list(document_type.fields.order_by('pk'))
+    rows = (
+        queryset.filter(document_type=document_type)
+        .order_by('pk', 'field_values__field_id')
+        .values_list(
+            *_DOCUMENT_EXPORT_LOOKUPS,
+            'field_values__field_id',
+            'field_values__value',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    return streaming_export_response(
+        (*DOCUMENT_EXPORT_COLUMNS, *field_columns(fields)),
+        pivot_rows(rows, [field.pk for field in fields]),
+        export_format,
+        f'{slugify(document_type.name) or document_type.pk}-documents',
+        chunk_size,
+    )
@@ -5,38 +5,103 @@ from django_summernote.widgets import SummernoteWidget
 from .models import Document, DocumentField, DocumentType, Drug
 
 
+class DrugSelect2(autocomplete.ModelSelect2):
+    """ModelSelect2 that renders a preset list of choices without a query."""
+
+    def filter_choices_to_render(self, selected_choices):
+        if isinstance(self.choices, list):
+            self.choices = [c for c in self.choices if str(c[0]) in selected_choices]
+        else:
+            super().filter_choices_to_render(selected_choices)
+
+
 class DocumentForm(forms.ModelForm):
+    """Base for the per-DocumentType classes of :func:`document_form_class`."""
+
+    # The DocumentField rows the form was built from, in form order
+    document_fields = ()
+
     class Meta:
         model = Document
         fields = ['title', 'patient', 'pdf_file']
 
     def __init__(self, *args, **kwargs):
-        document_type = kwargs.pop('document_type')
-        super(DocumentForm, self).__init__(*args, **kwargs)
-
-        if document_type.id != 1001:
-            self.fields.pop('pdf_file', None)
-
-        # Add fields based on DocumentType fields
-        for field in document_type.fields.all():
-            if field.field_type == 'text':
-                self.fields[field.snake_case_name] = forms.CharField(label=field.name, required=False)
-            elif field.field_type == 'number':
-                self.fields[field.snake_case_name] = forms.IntegerField(label=field.name, required=False)
-            elif field.field_type == 'date':
-                self.fields[field.snake_case_name] = forms.DateField(label=field.name, required=False, widget=forms.DateInput(attrs={'type': 'date'}))
-            elif field.field_type == 'rich_text':
-                self.fields[field.snake_case_name] = forms.CharField(label=field.name, widget=SummernoteWidget(), required=False)
-            elif field.field_type == 'drug':
-                # Instantiate DrugModelForm and add the field
-                self.fields[field.snake_case_name] = forms.ModelChoiceField(
-                    label=field.name,
-                    queryset=Drug.objects.all(),
-                    widget=autocomplete.ModelSelect2(
-                        url='drug_autocomplete',
-                    ),
-                    required=False
-                )
+        super().__init__(*args, **kwargs)
+        if self.is_bound:
+            return
+        # Drugs the view already loaded render as the only option, instead
+        # of each widget querying its selection
+        for field in self.document_fields:
+            drug = self.initial.get(field.snake_case_name)
+            if field.field_type == 'drug' and isinstance(drug, Drug):
+                widget = self.fields[field.snake_case_name].widget
+                widget.choices = [(drug.pk, str(drug))]
+
+
+def build_form_field(field):
+    """Return the form field for a DocumentField."""
+    if field.field_type == 'text':
+        return forms.CharField(label=field.name, required=False)
+    elif field.field_type == 'number':
+        return forms.IntegerField(label=field.name, required=False)
+    elif field.field_type == 'date':
+        return forms.DateField(
+            label=field.name,
+            required=False,
+            widget=forms.DateInput(attrs={'type': 'date'}),
+        )
+    elif field.field_type == 'rich_text':
+        return forms.CharField(
+            label=field.name, widget=SummernoteWidget(), required=False
+        )
+    elif field.field_type == 'drug':
+        return forms.ModelChoiceField(
+            label=field.name,
+            queryset=Drug.objects.all(),
+            widget=DrugSelect2(
+                url='drug_autocomplete',
+            ),
+            required=False
+        )
+    return None
+
+
+# Compiled form classes keyed by (document type id, schema version). Forms
+# deep-copy their base fields per instance, so sharing a class is safe.
+_form_classes = {}
+
+
+def document_form_class(document_type):
+    """Return the form class for ``document_type``'s current fields.
+
+    The class is built on first use of each schema version, with the only
+    DocumentField query; later requests in the same process reuse it.
+    ``DocumentType.schema_version`` is bumped whenever its fields change.
+    """
+    key = (document_type.pk, document_type.schema_version)
+    form_class = _form_classes.get(key)
+    if form_class is not None:
+        return form_class
+
+    document_fields = tuple(document_type.fields.order_by('pk'))
+    attrs = {'document_fields': document_fields}
+    for field in document_fields:
+        form_field = build_form_field(field)
+        if form_field is not None:
+            attrs[field.snake_case_name] = form_field
+
+    if document_type.pk != 1001:
+        # Only the upload type takes a PDF file
+        attrs['Meta'] = type(
+            'Meta', (DocumentForm.Meta,), {'fields': ['title', 'patient']}
+        )
+
+    form_class = type(f'DocumentType{document_type.pk}Form', (DocumentForm,), attrs)
+    # Drop classes built for older versions of this type
+    for stale in [k for k in _form_classes if k[0] == document_type.pk]:
+        _form_classes.pop(stale, None)
+    _form_classes[key] = form_class
+    return form_class
 
 class DocumentTypeForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,297 @@
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from documents.models import (
+    Document,
+    DocumentField,
+    DocumentFieldValue,
+    DocumentType,
+    Drug,
+    normalize_drug_name,
+)
+from documents.pdf import (
+    PDF_ENGINES,
+    cached_pdf_path,
+    generate_pdf,
+    pdf_fingerprint,
+    render_pdf,
+)
+from documents.predicates import FieldPredicate, filter_documents, plan
+from documents.search import document_snippets, index_document, search_documents
+from documents.views import DocumentListView, document_pdf_view
+from patients.models import Patient, TreatmentRecord
+
+
+class _RollbackError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time document hot paths against seeded data. Everything is created "
+        "inside a transaction that is rolled back, and files go to a temporary "
+        "MEDIA_ROOT."
+    )
+
+    scenarios = ('pdf_cache', 'pdf_engines', 'predicates', 'document_list', 'search')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument(
+            '--iterations', type=int, default=200, help="Timed runs per measurement."
+        )
+        parser.add_argument(
+            '--documents', type=int, default=1000,
+            help="Documents seeded for every scenario but pdf_cache.",
+        )
+
+    def handle(self, *args, **options):
+        with (
+            tempfile.TemporaryDirectory() as media_root,
+            override_settings(MEDIA_ROOT=media_root),
+        ):
+            try:
+                with transaction.atomic():
+                    getattr(self, f"bench_{options['scenario']}")(options)
+                    raise _RollbackError
+            except _RollbackError:
+                pass
+
+    def time_runs(self, label, func, iterations):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        self.stdout.write(
+            f"{label}: median {statistics.median(samples):.2f} ms, "
+            f"p95 {p95:.2f} ms over {iterations} runs"
+        )
+        return samples
+
+    def seed_documents(self, count=1, fields=10):
+        owner = get_user_model().objects.create_user(
+            username='benchmark', email='benchmark@example.com', password='benchmark'
+        )
+        patient = Patient.objects.create(
+            name="Benchmark Patient", address="1 Bench St",
+            date_of_birth=date(1980, 1, 1), height=70, weight=170, blood_group="O+",
+            bed_id="BENCH", treatment_area="ICU",
+        )
+        document_type = DocumentType.objects.create(name="Benchmark Type")
+        document_fields = DocumentField.objects.bulk_create(
+            DocumentField(
+                document_type=document_type, name=f"Field {i}", field_type='text'
+            )
+            for i in range(fields)
+        )
+        documents = Document.objects.bulk_create(
+            Document(
+                title=f"Benchmark Document {n}", document_type=document_type,
+                owner=owner, patient=patient,
+            )
+            for n in range(count)
+        )
+        DocumentFieldValue.objects.bulk_create(
+            (
+                DocumentFieldValue(
+                    document=document, field=field, value=f"Value {i} of document {n}"
+                )
+                for n, document in enumerate(documents)
+                for i, field in enumerate(document_fields)
+            ),
+            batch_size=1000,
+        )
+        return documents
+
+    def seed_document(self, fields=10):
+        return self.seed_documents(1, fields)[0]
+
+    def bench_pdf_cache(self, options):
+        document = self.seed_document()
+        request = RequestFactory().get(f'/documents/{document.pk}/pdf/')
+        request.user = document.owner
+
+        def serve():
+            # The body streams lazily, so a hit is the fingerprint query and
+            # a stat
+            return document_pdf_view(request, pk=document.pk)
+
+        pdf_path = cached_pdf_path(pdf_fingerprint(document))
+
+        def render_cold():
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            generate_pdf(document)
+
+        self.time_runs(
+            "Cold render (automatic engine)", render_cold,
+            max(1, options['iterations'] // 20),
+        )
+        self.time_runs(
+            "Cache hit (fingerprint query + stat)", serve, options['iterations']
+        )
+
+        DocumentFieldValue.objects.filter(document=document).update(value="Edited")
+        status = serve().status_code
+        self.stdout.write(
+            f"After an edit the view answers {status} and queues a fresh render."
+        )
+
+    def bench_pdf_engines(self, options):
+        seeded = self.seed_documents(options['documents'])
+        documents = list(
+            Document.objects.filter(pk__in=[document.pk for document in seeded])
+            .select_related('patient', 'owner', 'document_type')
+        )
+        pdf_path = os.path.join(settings.MEDIA_ROOT, 'benchmark.pdf')
+
+        for engine in PDF_ENGINES:
+            remaining = iter(documents)
+
+            def render():
+                render_pdf(next(remaining), pdf_path, engine=engine)
+                os.remove(pdf_path)
+
+            samples = self.time_runs(f"Render ({engine})", render, len(documents))
+            self.stdout.write(
+                f"  {engine}: {sum(samples) / 1000:.1f} s "
+                f"for {len(documents)} documents"
+            )
+
+    def bench_predicates(self, options):
+        documents = self.seed_documents(options['documents'], fields=0)
+        drug_field, given_field, dose_field = DocumentField.objects.bulk_create(
+            DocumentField(
+                document_type=documents[0].document_type, name=name,
+                field_type=field_type,
+            )
+            for name, field_type in (
+                ("Drug", 'drug'), ("Given", 'date'), ("Dose", 'number')
+            )
+        )
+        drugs = Drug.objects.bulk_create(
+            Drug(
+                name=f"Benchmark Drug {i}",
+                normalized_name=normalize_drug_name(f"Benchmark Drug {i}"),
+            )
+            for i in range(50)
+        )
+        today = date.today()
+        values = []
+        for n, document in enumerate(documents):
+            drug = drugs[n % len(drugs)]
+            given = today - timedelta(days=n % 365)
+            entries = (
+                (drug_field, drug.name),
+                (given_field, given.isoformat()),
+                (dose_field, str(n % 500)),
+            )
+            for field, text in entries:
+                value = DocumentFieldValue(document=document, field=field, value=text)
+                value.set_typed_value(field.field_type, drug=drug)
+                values.append(value)
+        DocumentFieldValue.objects.bulk_create(values, batch_size=2000)
+
+        predicates = [
+            FieldPredicate(dose_field, 'range', (0, None)),
+            FieldPredicate(given_field, 'range', (today - timedelta(days=7), None)),
+            FieldPredicate(drug_field, 'drug', [drugs[0].pk]),
+        ]
+        self.stdout.write(f"{len(values)} field values; plan: {plan(predicates)}")
+        self.time_runs(
+            "Plan (row estimates)", lambda: plan(predicates), options['iterations']
+        )
+        matching = filter_documents(Document.objects.all(), predicates)
+        self.time_runs(
+            "Drug X this week with dose >= 0",
+            lambda: list(matching.values_list('pk', flat=True)),
+            options['iterations'],
+        )
+
+    def bench_document_list(self, options):
+        owner = self.seed_document(fields=0).owner
+        document_type = DocumentType.objects.get(name="Benchmark Type")
+        # A patient per 100 documents, each with a history of other workers;
+        # the listing user treats every tenth patient
+        patients = Patient.objects.bulk_create(
+            Patient(
+                name=f"Benchmark Patient {n}", address="1 Bench St",
+                date_of_birth=date(1980, 1, 1), height=70, weight=170,
+                blood_group="O+", bed_id=f"B{n}", treatment_area="ICU",
+            )
+            for n in range(max(10, options['documents'] // 100))
+        )
+        workers = get_user_model().objects.bulk_create(
+            get_user_model()(
+                username=f'worker{n}', email=f'benchmark-worker{n}@example.com'
+            )
+            for n in range(20)
+        )
+        TreatmentRecord.objects.bulk_create(
+            (
+                TreatmentRecord(patient=patient, worker=worker)
+                for n, patient in enumerate(patients)
+                for worker in (
+                    ([owner] if n % 10 == 0 else []) + workers[n % 15:n % 15 + 5]
+                )
+            ),
+            batch_size=5000,
+        )
+        for start in range(0, options['documents'], 10000):
+            Document.objects.bulk_create(
+                Document(
+                    title=f"Benchmark Document {n}", document_type=document_type,
+                    owner=owner, patient=patients[n % len(patients)],
+                )
+                for n in range(start, min(start + 10000, options['documents']))
+            )
+        self.stdout.write(
+            f"{options['documents']} documents over {len(patients)} patients"
+        )
+
+        view = DocumentListView.as_view()
+        for label, params in (
+            ("First page", {}),
+            ("Last page", {'page': 'last'}),
+            ("Sorted by patient", {'sort': 'patient'}),
+            ("Cursor page", {'pagination': 'cursor'}),
+            ("Search", {'q': "Document 4"}),
+        ):
+            request = RequestFactory().get(
+                '/documents/', {'items_per_page': 20, **params}
+            )
+            request.user = owner
+            self.time_runs(label, lambda: view(request).render(), options['iterations'])
+
+    def bench_search(self, options):
+        documents = self.seed_documents(options['documents'])
+        values = {}
+        rows = DocumentFieldValue.objects.order_by('field_id')
+        for document_id, value in rows.values_list('document_id', 'value'):
+            values.setdefault(document_id, []).append(('text', value))
+        for document in documents:
+            index_document(document, values.get(document.pk, []))
+
+        def search(query):
+            ranked = search_documents(Document.objects.all(), query)
+            page = list(ranked.order_by('-search_rank', 'title', 'pk')[:20])
+            document_snippets(page, query)
+
+        # Every seeded value has "value" and "document"; numbers pick out a few
+        for query in ("document 42", "value"):
+            self.time_runs(
+                f"Search '{query}' (ranked page + snippets)", lambda: search(query),
+                options['iterations'],
+            )
@@ -0,0 +1,45 @@
+import shutil
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.bundles import build_chart_pdf, collect_chart
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Write one PDF with all of a patient's documents. Cached document PDFs "
+        "are reused and only the missing ones are rendered."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('patient', help="Patient id.")
+        parser.add_argument('output', help="File to write, or - for stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            patient = Patient.objects.get(pk=options['patient'])
+        except (Patient.DoesNotExist, ValidationError):
+            raise CommandError(f"No patient with id {options['patient']}.")
+
+        bundle = collect_chart(patient, render_missing=True)
+        if bundle.missing:
+            raise CommandError(f"Could not render {len(bundle.missing)} documents.")
+        pdf_path = build_chart_pdf(bundle)
+        if pdf_path is None:
+            raise CommandError(f"{patient.name} has no documents with a PDF.")
+
+        # Copied in chunks rather than read whole
+        with open(pdf_path, 'rb') as chart:
+            if options['output'] == '-':
+                shutil.copyfileobj(chart, sys.stdout.buffer)
+                return
+            with open(options['output'], 'wb') as output:
+                shutil.copyfileobj(chart, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(bundle.sources)} documents for {patient.name} "
+            f"to {options['output']}."
+        ))
@@ -0,0 +1,71 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from documents.models import Document, DocumentFieldValue
+from documents.pdf import (
+    FINGERPRINT_VALUE_FIELDS,
+    evict_cached_pdfs,
+    pdf_fingerprint,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete cached document PDFs that no document renders to any more, "
+        "such as the PDFs of earlier versions of edited documents."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help="Keep files modified within this many minutes.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000, help="Documents per query."
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Count the files without deleting them.",
+        )
+
+    def iter_fingerprints(self, batch_size):
+        """Yield the current PDF fingerprint of every generated document.
+
+        Documents are read in primary key batches with their field values in
+        one query per batch, like ``collect_chart`` does for one patient.
+        """
+        documents = Document.objects.filter(is_uploaded_pdf=False).select_related(
+            'patient', 'owner', 'document_type'
+        ).order_by('pk')
+        last_pk = None
+        while True:
+            batch = documents if last_pk is None else documents.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1].pk
+
+            field_values = defaultdict(list)
+            rows = DocumentFieldValue.objects.filter(document__in=batch).order_by(
+                'document_id', 'pk'
+            )
+            for document_id, *field_value in rows.values_list(
+                'document_id', *FINGERPRINT_VALUE_FIELDS
+            ):
+                field_values[document_id].append(tuple(field_value))
+            for document in batch:
+                yield pdf_fingerprint(document, field_values[document.pk])
+
+    def handle(self, *args, **options):
+        started = time.time()
+        current = set(self.iter_fingerprints(options['batch_size']))
+        removed = evict_cached_pdfs(
+            current, started - options['min_age'] * 60, dry_run=options['dry_run']
+        )
+
+        action = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {removed} superseded PDFs; {len(current)} documents are current."
+        ))
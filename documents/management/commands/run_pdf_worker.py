@@ -0,0 +1,97 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from documents.pdf_jobs import claim_next_job, release_job, requeue_stale_jobs, run_job
+
+
+def _init_worker():
+    # Forked children must not reuse the parent's database connections
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Render queued document PDFs. Jobs are claimed from the database and "
+        "rendered in a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help="Renderer processes; 0 renders in this process.",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds between queue polls.",
+        )
+        parser.add_argument(
+            '--once', action='store_true', help="Exit once the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        requeue_stale_jobs()
+        if options['processes'] == 0:
+            rendered = self.run_inline(options)
+        else:
+            rendered = self.run_pool(options)
+        self.stdout.write(self.style.SUCCESS(f"Processed {rendered} PDF jobs."))
+
+    def report(self, job_id, status, options):
+        if options['verbosity'] >= 2:
+            self.stdout.write(f"Job {job_id}: {status}")
+
+    def run_inline(self, options):
+        rendered = 0
+        while True:
+            job_id = claim_next_job()
+            if job_id is None:
+                if options['once']:
+                    return rendered
+                time.sleep(options['poll_interval'])
+                requeue_stale_jobs()
+                continue
+            self.report(job_id, run_job(job_id), options)
+            rendered += 1
+
+    def run_pool(self, options):
+        rendered = 0
+        processes = options['processes']
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker
+        ) as pool:
+            running = {}
+            while True:
+                # Keep every process busy without claiming more than can run
+                while len(running) < processes:
+                    job_id = claim_next_job()
+                    if job_id is None:
+                        break
+                    running[pool.submit(run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        return rendered
+                    time.sleep(options['poll_interval'])
+                    requeue_stale_jobs()
+                    continue
+
+                done, _ = wait(
+                    running, timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        # The child died before recording an outcome
+                        status = release_job(job_id, str(e))
+                    self.report(job_id, status, options)
+                    rendered += 1
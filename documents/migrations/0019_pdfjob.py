@@ -0,0 +1,55 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:52
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0018_auto_20241030_2034'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfJob',
+            fields=[
+                ('id', models.UUIDField(
+                    default=uuid.uuid4, editable=False, primary_key=True,
+                    serialize=False,
+                )),
+                ('status', models.CharField(
+                    choices=[
+                        ('pending', 'Pending'),
+                        ('running', 'Running'),
+                        ('done', 'Done'),
+                        ('failed', 'Failed'),
+                    ],
+                    default='pending',
+                    max_length=10,
+                )),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('document', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='pdf_jobs',
+                    to='documents.document',
+                )),
+            ],
+            options={
+                'indexes': [models.Index(
+                    fields=['status', 'created_at'], name='pdfjob_status_created_idx'
+                )],
+                'constraints': [models.UniqueConstraint(
+                    condition=models.Q(('status__in', ['pending', 'running'])),
+                    fields=('document',),
+                    name='pdfjob_one_active_per_document',
+                )],
+            },
+        ),
+    ]
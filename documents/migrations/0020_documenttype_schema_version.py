@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0019_pdfjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documenttype',
+            name='schema_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
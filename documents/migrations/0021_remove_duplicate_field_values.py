@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_field_values(apps, schema_editor):
+    # update_or_create could race into duplicates; keep the newest value
+    DocumentFieldValue = apps.get_model('documents', 'DocumentFieldValue')
+    duplicates = (
+        DocumentFieldValue.objects.values('document_id', 'field_id')
+        .annotate(keep=Max('pk'), copies=Count('pk'))
+        .filter(copies__gt=1)
+    )
+    for row in duplicates.iterator():
+        DocumentFieldValue.objects.filter(
+            document_id=row['document_id'], field_id=row['field_id']
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0020_documenttype_schema_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_field_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0021_remove_duplicate_field_values'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='documentfieldvalue',
+            constraint=models.UniqueConstraint(
+                fields=('document', 'field'), name='documentfieldvalue_unique_field'
+            ),
+        ),
+    ]
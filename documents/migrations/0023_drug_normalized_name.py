@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_normalized_name(apps, schema_editor):
+    # Mirrors documents.models.normalize_drug_name
+    Drug = apps.get_model('documents', 'Drug')
+    batch = []
+    drugs = Drug.objects.only('pk', 'name')
+    for drug in drugs.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        drug.normalized_name = ' '.join(drug.name.split()).casefold()
+        batch.append(drug)
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            Drug.objects.bulk_update(batch, ['normalized_name'])
+            batch = []
+    Drug.objects.bulk_update(batch, ['normalized_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0022_documentfieldvalue_unique_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drug',
+            name='normalized_name',
+            field=models.CharField(
+                blank=True, default='', editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(backfill_normalized_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='drug',
+            index=models.Index(
+                fields=['normalized_name'], name='drug_normalized_name_idx'
+            ),
+        ),
+    ]
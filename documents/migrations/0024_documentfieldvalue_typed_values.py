@@ -0,0 +1,128 @@
+# Generated by Django 5.1.2 on 2026-10-18 02:17
+
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.dateparse import parse_date
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+# Mirror documents.models.parse_number_value/parse_date_value/normalize_drug_name
+def _number(text):
+    try:
+        number = Decimal(str(text).strip())
+    except (InvalidOperation, ValueError):
+        return None
+    if not number.is_finite() or abs(number) >= 10 ** 18:
+        return None
+    return number.quantize(Decimal('0.000001'))
+
+
+def _date(text):
+    try:
+        return parse_date(str(text).strip())
+    except ValueError:
+        return None
+
+
+def _drug_name(text):
+    return ' '.join(text.split()).casefold()
+
+
+def backfill_typed_values(apps, schema_editor):
+    """Fill the typed columns of existing number, date and drug values.
+
+    Walks the table in primary key order, one batch at a time, with one
+    drug lookup and one bulk update per batch.
+    """
+    DocumentFieldValue = apps.get_model('documents', 'DocumentFieldValue')
+    Drug = apps.get_model('documents', 'Drug')
+    typed = DocumentFieldValue.objects.filter(
+        field__field_type__in=['number', 'date', 'drug']
+    ).select_related('field').only('pk', 'value', 'field__field_type').order_by('pk')
+
+    last_pk = 0
+    while True:
+        batch = list(typed.filter(pk__gt=last_pk)[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+
+        names = {
+            _drug_name(v.value) for v in batch if v.field.field_type == 'drug'
+        }
+        matches = Drug.objects.filter(normalized_name__in=names).order_by('-pk')
+        drugs = {}
+        for drug_id, name in matches.values_list('pk', 'normalized_name'):
+            drugs[name] = drug_id
+
+        for value in batch:
+            field_type = value.field.field_type
+            if field_type == 'number':
+                value.number_value = _number(value.value)
+            elif field_type == 'date':
+                value.date_value = _date(value.value)
+            else:
+                value.drug_id = drugs.get(_drug_name(value.value))
+        DocumentFieldValue.objects.bulk_update(
+            batch, ['number_value', 'date_value', 'drug']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0023_drug_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentfieldvalue',
+            name='date_value',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentfieldvalue',
+            name='drug',
+            field=models.ForeignKey(
+                blank=True, editable=False, null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='field_values', to='documents.drug',
+            ),
+        ),
+        migrations.AddField(
+            model_name='documentfieldvalue',
+            name='number_value',
+            field=models.DecimalField(
+                blank=True, decimal_places=6, editable=False, max_digits=24,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_typed_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='documentfieldvalue',
+            index=models.Index(
+                condition=models.Q(('number_value__isnull', False)),
+                fields=['field', 'number_value'],
+                name='fieldvalue_field_number_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='documentfieldvalue',
+            index=models.Index(
+                condition=models.Q(('date_value__isnull', False)),
+                fields=['field', 'date_value'],
+                name='fieldvalue_field_date_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='documentfieldvalue',
+            index=models.Index(
+                condition=models.Q(('drug__isnull', False)),
+                fields=['field', 'drug'],
+                name='fieldvalue_field_drug_idx',
+            ),
+        ),
+    ]
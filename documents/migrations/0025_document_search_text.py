@@ -0,0 +1,118 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:05
+
+import html
+import re
+from itertools import groupby
+
+import bleach
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 2000
+
+_TAG_START_RE = re.compile(r'<(?=/?[A-Za-z!])')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+# Mirror documents.search.search_text
+def _search_text(values):
+    parts = []
+    for field_type, value in values:
+        if field_type == 'rich_text':
+            value = bleach.clean(
+                _TAG_START_RE.sub(' <', value or ''),
+                tags=set(), attributes={}, strip=True,
+            )
+            value = html.unescape(value)
+        elif field_type != 'text':
+            continue
+        value = _WHITESPACE_RE.sub(' ', value or '').strip()
+        if value:
+            parts.append(value)
+    return '\n'.join(parts)
+
+
+def create_search_index(apps, schema_editor):
+    # documents.search queries whichever of these the database has
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS document_search_text_gin ON documents_document '
+            "USING gin (to_tsvector('english'::regconfig, COALESCE(search_text, '')))"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS documents_document_fts '
+            'USING fts5(document_id UNINDEXED, body, '
+            "tokenize='porter unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS document_search_text_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS documents_document_fts')
+
+
+def backfill_search_text(apps, schema_editor):
+    """Index the text and rich text values of existing documents in batches."""
+    Document = apps.get_model('documents', 'Document')
+    DocumentFieldValue = apps.get_model('documents', 'DocumentFieldValue')
+    sqlite = schema_editor.connection.vendor == 'sqlite'
+
+    last_pk = None
+    while True:
+        documents = Document.objects.order_by('pk').only('pk')
+        if last_pk is not None:
+            documents = documents.filter(pk__gt=last_pk)
+        batch = list(documents[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+
+        rows = (
+            DocumentFieldValue.objects.filter(
+                document__in=batch, field__field_type__in=['text', 'rich_text']
+            )
+            .order_by('document_id', 'field_id')
+            .values_list('document_id', 'field__field_type', 'value')
+        )
+        texts = {
+            document_id: _search_text(
+                (field_type, value) for _, field_type, value in group
+            )
+            for document_id, group in groupby(rows, key=lambda row: row[0])
+        }
+        for document in batch:
+            document.search_text = texts.get(document.pk, '')
+        Document.objects.bulk_update(batch, ['search_text'])
+
+        if sqlite:
+            # Keyed like documents.search.fts_rowid
+            with schema_editor.connection.cursor() as cursor:
+                cursor.executemany(
+                    'INSERT OR REPLACE INTO documents_document_fts '
+                    '(rowid, document_id, body) VALUES (%s, %s, %s)',
+                    [
+                        (pk.int >> 65, pk.hex, text)
+                        for pk, text in texts.items() if text
+                    ],
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0024_documentfieldvalue_typed_values'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+    ]
@@ -2,17 +2,68 @@ import re
 
 # Create your models here.
 import uuid
+from decimal import Decimal, InvalidOperation
 
 from django.db import models
+from django.utils.dateparse import parse_date
+
+# Size of DocumentFieldValue.number_value; larger numbers are not indexed
+NUMBER_MAX_DIGITS = 24
+NUMBER_DECIMAL_PLACES = 6
+
+
+def normalize_drug_name(name):
+    """Case- and whitespace-insensitive key used to look drugs up by name."""
+    return ' '.join(name.split()).casefold()
+
+
+def parse_number_value(text):
+    """The number a field value holds, as stored in ``number_value``, or ``None``."""
+    try:
+        number = Decimal(str(text).strip())
+    except (InvalidOperation, ValueError):
+        return None
+    limit = 10 ** (NUMBER_MAX_DIGITS - NUMBER_DECIMAL_PLACES)
+    if not number.is_finite() or abs(number) >= limit:
+        return None
+    return number.quantize(Decimal(1).scaleb(-NUMBER_DECIMAL_PLACES))
+
+
+def parse_date_value(text):
+    """The ISO date a field value holds, or ``None``."""
+    try:
+        return parse_date(str(text).strip())
+    except ValueError:
+        return None
 
 
 class Drug(models.Model):
     name = models.CharField(max_length=255)
+    # normalize_drug_name(name)
+    normalized_name = models.CharField(
+        max_length=255, blank=True, default='', editable=False
+    )
+
+    class Meta:
+        indexes = [
+            # Document fields store drugs by name; edits resolve them in one lookup
+            models.Index(fields=['normalized_name'], name='drug_normalized_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_drug_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_name'}
+        super().save(*args, **kwargs)
+
 class DocumentType(models.Model):
     name = models.CharField(max_length=255)
+    # Bumped whenever the type's fields change; keys the compiled form class cache
+    schema_version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return self.name
@@ -46,6 +97,9 @@ class Document(models.Model):
     creation_date = models.DateTimeField(auto_now_add=True)  # Add creation date
     pdf_file = models.FileField(upload_to='documents/pdfs/', null=True, blank=True)  # New field for PDF storage
     is_uploaded_pdf = models.BooleanField(default=False)  # Flag to indicate if this is an uploaded PDF without fields
+    # Plain text of the text and rich text field values, kept by
+    # documents.search.index_document for full-text search
+    search_text = models.TextField(blank=True, default='', editable=False)
 
 
 
@@ -56,6 +110,115 @@ class DocumentFieldValue(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='field_values')
     field = models.ForeignKey(DocumentField, on_delete=models.CASCADE)
     value = models.TextField()
+    # Typed copies of value for number, date and drug fields, so they can be
+    # compared and range-scanned through an index; null for other field types
+    number_value = models.DecimalField(
+        max_digits=NUMBER_MAX_DIGITS, decimal_places=NUMBER_DECIMAL_PLACES,
+        null=True, blank=True, editable=False,
+    )
+    date_value = models.DateField(null=True, blank=True, editable=False)
+    drug = models.ForeignKey(
+        Drug, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='field_values',
+    )
+
+    TYPED_FIELDS = ['number_value', 'date_value', 'drug']
+
+    class Meta:
+        constraints = [
+            # One value per field; lets saves upsert all values in one statement
+            models.UniqueConstraint(
+                fields=['document', 'field'], name='documentfieldvalue_unique_field'
+            ),
+        ]
+        indexes = [
+            # Per-field lookups and range scans on the typed copies; partial,
+            # so each index only holds values of its own type
+            models.Index(
+                fields=['field', 'number_value'],
+                condition=models.Q(number_value__isnull=False),
+                name='fieldvalue_field_number_idx',
+            ),
+            models.Index(
+                fields=['field', 'date_value'],
+                condition=models.Q(date_value__isnull=False),
+                name='fieldvalue_field_date_idx',
+            ),
+            models.Index(
+                fields=['field', 'drug'], condition=models.Q(drug__isnull=False),
+                name='fieldvalue_field_drug_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.field.name}: {self.value}"
+
+    def set_typed_value(self, field_type, drug=None):
+        """Fill the typed column for ``field_type`` from ``value``, clearing the others.
+
+        Drug values are looked up by name unless the ``Drug`` is passed in.
+        """
+        is_number, is_date = field_type == 'number', field_type == 'date'
+        self.number_value = parse_number_value(self.value) if is_number else None
+        self.date_value = parse_date_value(self.value) if is_date else None
+        if field_type != 'drug' or not self.value:
+            self.drug = None
+        elif drug is not None:
+            self.drug = drug
+        else:
+            self.drug = Drug.objects.filter(
+                normalized_name=normalize_drug_name(self.value)
+            ).order_by('pk').first()
+
+    def save(self, *args, **kwargs):
+        self.set_typed_value(self.field.field_type)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *self.TYPED_FIELDS}
+        super().save(*args, **kwargs)
+
+
+class PdfJob(models.Model):
+    """A queued PDF render for a document, run by ``manage.py run_pdf_worker``."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    document = models.ForeignKey(
+        Document, on_delete=models.CASCADE, related_name='pdf_jobs'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest pending job
+            models.Index(
+                fields=['status', 'created_at'], name='pdfjob_status_created_idx'
+            ),
+        ]
+        constraints = [
+            # Repeated "View PDF" clicks share one queued render
+            models.UniqueConstraint(
+                fields=['document'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='pdfjob_one_active_per_document',
+            ),
+        ]
+
+    def __str__(self):
+        return f"PDF job for {self.document} ({self.status})"
@@ -0,0 +1,297 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from xml.sax.saxutils import escape
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import formats, timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+from xhtml2pdf import pisa
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever document_pdf.html or the renderer changes; it is part of
+# every cache key, so all generated PDFs are rebuilt on the next request
+PDF_TEMPLATE_VERSION = 2
+
+PDF_CACHE_DIR = 'documents/pdfs'
+
+# The columns of a document's field values that pdf_fingerprint hashes
+FINGERPRINT_VALUE_FIELDS = ('field_id', 'field__name', 'value')
+
+# How long a caller waits for another process rendering the same PDF
+PDF_RENDER_WAIT_TIMEOUT = 60
+LOCK_POLL_INTERVAL = 0.05
+
+
+def pdf_fingerprint(document, field_values=None):
+    """Hash everything the generated PDF shows.
+
+    The document id, header details, field labels and values (in the pk
+    order they are printed in) and template version go into the key, so
+    any edit, including renaming a field, yields a new key and stale files
+    are never served. Load ``document`` with ``patient``, ``owner`` and
+    ``document_type`` selected to keep this to one query, or none when the
+    caller passes ``field_values`` as ``(field_id, field name, value)``
+    tuples in pk order.
+    """
+    if field_values is None:
+        field_values = document.field_values.order_by('pk').values_list(
+            *FINGERPRINT_VALUE_FIELDS
+        )
+    payload = [
+        PDF_TEMPLATE_VERSION,
+        str(document.pk),
+        document.title,
+        document.patient.name if document.patient_id else '',
+        str(document.owner),
+        str(document.document_type),
+        document.creation_date.isoformat() if document.creation_date else '',
+        list(field_values),
+    ]
+    encoded = json.dumps(payload, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def cached_pdf_name(fingerprint):
+    """Storage name (relative to ``MEDIA_ROOT``) for a fingerprint.
+
+    Two levels of two-hex-digit shards keep directories small.
+    """
+    return f'{PDF_CACHE_DIR}/{fingerprint[:2]}/{fingerprint[2:4]}/{fingerprint}.pdf'
+
+
+def cached_pdf_path(fingerprint):
+    return os.path.join(settings.MEDIA_ROOT, cached_pdf_name(fingerprint))
+
+
+# A cached PDF or its single_flight lock file
+_CACHED_FILE_RE = re.compile(r'([0-9a-f]{64})\.pdf(\.lock)?')
+
+
+def evict_cached_pdfs(current, older_than, dry_run=False):
+    """Delete cached PDFs whose fingerprint is not in ``current``.
+
+    Only files laid out like :func:`cached_pdf_name` are considered, so
+    uploaded PDFs stored under the same directory are never touched. Files
+    modified at or after the ``older_than`` timestamp are kept, as they may
+    be for content saved after ``current`` was computed. Lock files of
+    evicted PDFs go too; a render of superseded content that still holds
+    one only rewrites the same file. Returns the number of PDFs deleted.
+    """
+    removed = 0
+    cache_dir = os.path.join(settings.MEDIA_ROOT, PDF_CACHE_DIR)
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            match = _CACHED_FILE_RE.fullmatch(filename)
+            if match is None or match[1] in current:
+                continue
+            path = os.path.join(dirpath, filename)
+            if path != cached_pdf_path(match[1]) + (match[2] or ''):
+                continue
+            try:
+                if os.stat(path).st_mtime >= older_than:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += match[2] is None
+    return removed
+
+
+@contextmanager
+def _file_lock(lock_path, timeout):
+    """Hold an exclusive lock on ``lock_path``; yields whether it was acquired.
+
+    Polls a non-blocking ``flock`` (``msvcrt.locking`` on Windows) until
+    ``timeout`` seconds pass; a timeout of 0 tries once.
+    """
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    acquired = False
+    try:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                acquired = True
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(LOCK_POLL_INTERVAL)
+        yield acquired
+    finally:
+        if acquired:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+
+def single_flight(path, render, timeout=PDF_RENDER_WAIT_TIMEOUT):
+    """Produce ``path`` by calling ``render(path)`` at most once at a time.
+
+    Concurrent callers, in any process on this host, coordinate through a
+    lock file next to ``path``: one renders while the others wait for the
+    lock and then find the finished file. Returns the path, or ``None`` if
+    rendering failed or the lock was not acquired within ``timeout``.
+    Lock files are left in place; deleting one could let two holders in.
+    """
+    if os.path.exists(path):
+        return path
+    with _file_lock(f'{path}.lock', timeout) as acquired:
+        if not acquired:
+            return None
+        # Another process may have finished while we waited
+        if os.path.exists(path):
+            return path
+        return render(path)
+
+
+def _write_atomically(pdf_path, write):
+    # Written under a temporary name and renamed into place, so readers
+    # never see a partial PDF; write(file) returns False on failure
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(pdf_path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as pdf_file:
+            if not write(pdf_file):
+                return None
+        os.replace(temp_path, pdf_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return pdf_path
+
+
+def _write_xhtml2pdf(document, field_values, pdf_file):
+    # Render the HTML content
+    html_content = render_to_string(
+        'documents/document_pdf.html',
+        {'document': document, 'field_values': field_values},
+    )
+    pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
+    return not pisa_status.err
+
+
+def _paragraph_text(value):
+    return escape(str(value)).replace('\n', '<br/>')
+
+
+def _write_reportlab(document, field_values, pdf_file):
+    """Lay out the same content as document_pdf.html directly with platypus."""
+    styles = _reportlab_styles()
+    patient = document.patient.name if document.patient_id else ''
+    created = formats.localize(timezone.localtime(document.creation_date))
+
+    def line(label, value):
+        return Paragraph(
+            f"<b>{_paragraph_text(label)}:</b> {_paragraph_text(value)}",
+            styles['body'],
+        )
+
+    story = [
+        Paragraph(_paragraph_text(document.title), styles['title']),
+        line("Patient", patient),
+        line("Owner", document.owner),
+        line("Document Type", document.document_type),
+        line("Creation Date", created),
+        Spacer(1, 15),
+        Paragraph("Content:", styles['heading']),
+    ]
+    story.extend(line(value.field.name, value.value) for value in field_values)
+    # The template's 20px body margin inside xhtml2pdf's default page margin
+    margin = 20 + 36
+    SimpleDocTemplate(
+        pdf_file, pagesize=A4, title=document.title,
+        leftMargin=margin, rightMargin=margin, topMargin=margin, bottomMargin=margin,
+    ).build(story)
+    return True
+
+
+@lru_cache(maxsize=None)
+def _reportlab_styles():
+    sample = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'DocumentTitle', parent=sample['Heading2'],
+            fontName='Helvetica-Bold', textColor='#333333',
+        ),
+        'heading': ParagraphStyle(
+            'DocumentHeading', parent=sample['Heading3'], fontName='Helvetica-Bold'
+        ),
+        'body': ParagraphStyle(
+            'DocumentBody', parent=sample['BodyText'], fontName='Helvetica',
+            spaceBefore=2.5, spaceAfter=2.5,
+        ),
+    }
+
+
+PDF_ENGINES = {
+    'reportlab': _write_reportlab,
+    'xhtml2pdf': _write_xhtml2pdf,
+}
+
+
+def choose_engine(field_values):
+    """Rich text needs xhtml2pdf's HTML layout; everything else takes the fast path."""
+    if any(value.field.field_type == 'rich_text' for value in field_values):
+        return 'xhtml2pdf'
+    return 'reportlab'
+
+
+def render_pdf(document, pdf_path, engine=None):
+    """Render ``document`` to ``pdf_path`` with ``engine`` or the automatic choice.
+
+    The reportlab fast path falls back to xhtml2pdf if it fails. Returns the
+    path, or ``None`` if rendering failed.
+    """
+    field_values = list(document.field_values.select_related('field').order_by('pk'))
+    engine = engine or choose_engine(field_values)
+    if engine not in PDF_ENGINES:
+        raise ValueError(f"Unknown PDF engine: {engine}")
+    try:
+        return _write_atomically(
+            pdf_path, partial(PDF_ENGINES[engine], document, field_values)
+        )
+    except Exception:
+        if engine == 'xhtml2pdf':
+            raise
+        logger.exception(
+            "%s rendering failed for document %s; falling back to xhtml2pdf",
+            engine, document.pk,
+        )
+    return _write_atomically(
+        pdf_path, partial(_write_xhtml2pdf, document, field_values)
+    )
+
+
+def generate_pdf(document, fingerprint=None, timeout=PDF_RENDER_WAIT_TIMEOUT):
+    """Render ``document`` to its content-addressed path and return the path.
+
+    Rendering is coalesced with :func:`single_flight`, so concurrent calls
+    for the same content render once. Returns ``None`` if rendering fails.
+    """
+    fingerprint = fingerprint or pdf_fingerprint(document)
+    pdf_path = cached_pdf_path(fingerprint)
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    return single_flight(pdf_path, partial(render_pdf, document), timeout)
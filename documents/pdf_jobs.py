@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PdfJob
+from .pdf import generate_pdf
+
+MAX_ATTEMPTS = 3
+
+# Running jobs older than this are assumed to belong to a dead worker
+STALE_JOB_TIMEOUT = timedelta(minutes=5)
+
+
+def enqueue_pdf_job(document):
+    """Return the active render job for ``document``, queueing one if needed.
+
+    The partial unique constraint on active jobs means concurrent requests
+    for the same document end up sharing a single job.
+    """
+    active = PdfJob.objects.filter(
+        document=document, status__in=PdfJob.ACTIVE_STATUSES
+    )
+    job = active.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return PdfJob.objects.create(document=document)
+    except IntegrityError:
+        # Another request queued it between our read and insert
+        return active.get()
+
+
+def failed_pdf_jobs(documents):
+    """Return ``{document id: job}`` for documents whose latest render job failed."""
+    latest = {}
+    jobs = PdfJob.objects.filter(document__in=documents).order_by(
+        'document_id', '-created_at'
+    )
+    for job in jobs.only('document_id', 'status', 'error', 'created_at'):
+        latest.setdefault(job.document_id, job)
+    return {
+        document_id: job
+        for document_id, job in latest.items()
+        if job.status == PdfJob.FAILED
+    }
+
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running and return its id.
+
+    The claim is a conditional ``UPDATE ... WHERE status = 'pending'``, so two
+    workers racing for the same row cannot both win it.
+    """
+    pending = PdfJob.objects.filter(status=PdfJob.PENDING).order_by('created_at')
+    while True:
+        job_id = pending.values_list('pk', flat=True).first()
+        if job_id is None:
+            return None
+        claimed = PdfJob.objects.filter(pk=job_id, status=PdfJob.PENDING).update(
+            status=PdfJob.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return job_id
+
+
+def release_job(job_id, error):
+    """Put a failed job back in the queue, or fail it after ``MAX_ATTEMPTS``."""
+    job = PdfJob.objects.filter(pk=job_id)
+    if job.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=PdfJob.FAILED, finished_at=timezone.now(), error=error
+    ):
+        return PdfJob.FAILED
+    job.update(status=PdfJob.PENDING, error=error)
+    return PdfJob.PENDING
+
+
+def run_job(job_id):
+    """Render the document of a claimed job and record the outcome."""
+    job = PdfJob.objects.select_related(
+        'document__document_type', 'document__owner', 'document__patient'
+    ).get(pk=job_id)
+    try:
+        # Rendered under the fingerprint of the content as it is now; an
+        # edit made meanwhile simply misses the cache and queues again
+        if generate_pdf(job.document) is None:
+            raise ValueError(
+                "Rendering failed or another renderer did not finish in time."
+            )
+    except Exception as e:
+        return release_job(job_id, str(e))
+
+    PdfJob.objects.filter(pk=job_id).update(
+        status=PdfJob.DONE, finished_at=timezone.now(), error=''
+    )
+    return PdfJob.DONE
+
+
+def requeue_stale_jobs(timeout=STALE_JOB_TIMEOUT):
+    """Return jobs stuck in ``running`` past ``timeout`` to the queue."""
+    stale = PdfJob.objects.filter(
+        status=PdfJob.RUNNING, started_at__lt=timezone.now() - timeout
+    )
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=PdfJob.FAILED,
+        finished_at=timezone.now(),
+        error="Worker stopped while rendering.",
+    )
+    requeued = stale.update(status=PdfJob.PENDING)
+    return requeued, failed
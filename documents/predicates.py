@@ -0,0 +1,216 @@
+import json
+from itertools import zip_longest
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from .models import (
+    DocumentField,
+    DocumentFieldValue,
+    Drug,
+    normalize_drug_name,
+    parse_date_value,
+    parse_number_value,
+)
+
+# Operators each field type accepts; the first is the default
+FIELD_OPERATORS = {
+    'number': ('eq', 'range'),
+    'date': ('eq', 'range'),
+    'drug': ('drug',),
+    'text': ('contains', 'eq'),
+    'rich_text': ('contains', 'eq'),
+}
+
+OPERATOR_LABELS = {
+    'eq': "equals",
+    'range': "between",
+    'contains': "contains",
+    'drug': "drug is",
+}
+
+# Typed column holding each field type's value; see DocumentFieldValue
+TYPED_COLUMNS = {'number': 'number_value', 'date': 'date_value'}
+
+# Without row estimates from the database, the planner counts at most this
+# many index entries per predicate
+PLANNER_PROBE_LIMIT = 10000
+
+# Tie-break for equal estimates: an exact match usually narrows more
+OPERATOR_RANK = {'drug': 0, 'eq': 0, 'range': 1, 'contains': 2}
+
+
+class FieldPredicate:
+    """A condition on one document field's value.
+
+    ``value`` is a number or date for ``eq``, a ``(low, high)`` pair with
+    either end ``None`` for ``range``, a list of Drug ids for ``drug`` and
+    a string for ``contains`` and text ``eq``.
+    """
+
+    def __init__(self, field, op, value):
+        if op not in FIELD_OPERATORS.get(field.field_type, ()):
+            raise ValueError(f"{field.name} cannot be filtered with '{op}'.")
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def __repr__(self):
+        return f'<FieldPredicate {self.field.name} {self.op} {self.value!r}>'
+
+    @property
+    def indexed(self):
+        """Whether a partial (field, typed value) index serves this predicate."""
+        return self.field.field_type in ('number', 'date', 'drug')
+
+    def lookups(self):
+        if self.op == 'drug':
+            return {'drug__in': self.value}
+        column = TYPED_COLUMNS.get(self.field.field_type, 'value')
+        if self.op == 'contains':
+            return {'value__icontains': self.value}
+        if self.op == 'range':
+            low, high = self.value
+            lookups = {f'{column}__isnull': False}
+            if low is not None:
+                lookups[f'{column}__gte'] = low
+            if high is not None:
+                lookups[f'{column}__lte'] = high
+            return lookups
+        return {column: self.value}
+
+    def matching_values(self):
+        return DocumentFieldValue.objects.filter(field=self.field, **self.lookups())
+
+    def exists(self):
+        """Correlated ``EXISTS`` for a Document queryset, probed per document."""
+        return Exists(self.matching_values().filter(document=OuterRef('pk')))
+
+
+def estimate_rows(queryset):
+    """Rows ``queryset`` is expected to return, without running it in full.
+
+    PostgreSQL's planner estimate comes from its column statistics; other
+    databases get a count through the index capped at ``PLANNER_PROBE_LIMIT``.
+    """
+    if connection.vendor == 'postgresql':
+        return json.loads(queryset.explain(format='json'))[0]['Plan']['Plan Rows']
+    return queryset[:PLANNER_PROBE_LIMIT].count()
+
+
+def plan(predicates):
+    """Order ``predicates`` most selective first.
+
+    Indexed predicates are ranked by their estimated matches. Text
+    predicates cannot use an index and go last, exact matches before
+    substring matches.
+    """
+    predicates = list(predicates)
+    if len(predicates) < 2:
+        return predicates
+
+    def cost(predicate):
+        rank = OPERATOR_RANK[predicate.op]
+        if predicate.indexed:
+            return (0, estimate_rows(predicate.matching_values()), rank)
+        return (1, 0, rank)
+
+    return sorted(predicates, key=cost)
+
+
+def filter_documents(queryset, predicates):
+    """Narrow a Document queryset to documents matching every predicate.
+
+    The most selective predicate drives: its matches are read from the
+    (field, typed value) index as ``pk IN (...)``. The rest become
+    ``EXISTS`` subqueries that check each remaining document through the
+    (document, field) unique index.
+    """
+    ordered = plan(predicates)
+    if not ordered:
+        return queryset
+    first, rest = ordered[0], ordered[1:]
+    queryset = queryset.filter(pk__in=first.matching_values().values('document_id'))
+    for predicate in rest:
+        queryset = queryset.filter(predicate.exists())
+    return queryset
+
+
+def _parse_range(text, parse):
+    low, sep, high = text.partition('..')
+    if not sep:
+        raise ValueError("Ranges are written low..high; either end may be left out.")
+    bounds = []
+    for bound in (low, high):
+        if not bound.strip():
+            bounds.append(None)
+            continue
+        parsed = parse(bound)
+        if parsed is None:
+            raise ValueError(f"'{bound}' is not a valid bound.")
+        bounds.append(parsed)
+    if bounds == [None, None]:
+        raise ValueError("A range needs at least one bound.")
+    return tuple(bounds)
+
+
+def _parse_drugs(text):
+    # A Drug id, or a name matched like stored drug values
+    if text.strip().isdigit():
+        return [int(text)]
+    drugs = Drug.objects.filter(normalized_name=normalize_drug_name(text))
+    drug_ids = list(drugs.values_list('pk', flat=True))
+    if not drug_ids:
+        raise ValueError(f"No drug called '{text}'.")
+    return drug_ids
+
+
+def parse_predicate(field, op, text):
+    """Build a predicate from request strings, raising ``ValueError`` if invalid."""
+    op = op or FIELD_OPERATORS.get(field.field_type, ('eq',))[0]
+    text = text.strip()
+    if not text:
+        raise ValueError(f"Enter a value for {field.name}.")
+    if op == 'drug':
+        return FieldPredicate(field, op, _parse_drugs(text))
+
+    parse = {'number': parse_number_value, 'date': parse_date_value}.get(
+        field.field_type
+    )
+    if op == 'range' and parse is not None:
+        return FieldPredicate(field, op, _parse_range(text, parse))
+    if op == 'eq' and parse is not None:
+        value = parse(text)
+        if value is None:
+            raise ValueError(
+                f"'{text}' is not a valid {field.field_type} for {field.name}."
+            )
+        return FieldPredicate(field, op, value)
+    return FieldPredicate(field, op, text)
+
+
+def parse_predicates(field_ids, ops, values):
+    """Build predicates from parallel lists of field ids, operators and values.
+
+    Returns ``(predicates, errors)``; fields are loaded in one query, blank
+    entries are skipped and invalid ones are reported instead of applied.
+    """
+    entries = [
+        (field_id, op, text)
+        for field_id, op, text in zip_longest(field_ids, ops, values, fillvalue='')
+        if field_id and text.strip()
+    ]
+    fields = DocumentField.objects.in_bulk(
+        [int(f) for f, _, _ in entries if f.isdigit()]
+    )
+    predicates, errors = [], []
+    for field_id, op, text in entries:
+        field = fields.get(int(field_id)) if field_id.isdigit() else None
+        if field is None:
+            errors.append(f"Unknown field '{field_id}'.")
+            continue
+        try:
+            predicates.append(parse_predicate(field, op, text))
+        except ValueError as e:
+            errors.append(str(e))
+    return predicates, errors
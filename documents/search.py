@@ -0,0 +1,225 @@
+import html
+import re
+
+import bleach
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Document
+
+# Field types whose values are full-text indexed
+SEARCHABLE_FIELD_TYPES = ('text', 'rich_text')
+
+# Text search configuration on PostgreSQL; the SQLite table stems with porter
+SEARCH_CONFIG = 'english'
+
+SQLITE_FTS_TABLE = 'documents_document_fts'
+
+# Snippets come back with matches between these markers, so the text can be
+# escaped before the markers become <mark> tags
+_MATCH_START = '\x02'
+_MATCH_STOP = '\x03'
+SNIPPET_WORDS = 16
+
+_TAG_START_RE = re.compile(r'<(?=/?[A-Za-z!])')
+_WHITESPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def strip_html(value):
+    """Plain text of a rich text value, with tags removed and entities decoded."""
+    # Tags separate words, so "<p>one</p><p>two</p>" does not index as "onetwo"
+    text = bleach.clean(
+        _TAG_START_RE.sub(' <', value),
+        tags=set(), attributes={}, strip=True, strip_comments=True,
+    )
+    return _WHITESPACE_RE.sub(' ', html.unescape(text)).strip()
+
+
+def search_text(values):
+    """Text indexed for a document from ``(field_type, value)`` pairs in field order."""
+    parts = []
+    for field_type, value in values:
+        if field_type not in SEARCHABLE_FIELD_TYPES:
+            continue
+        if field_type == 'rich_text':
+            value = strip_html(value or '')
+        else:
+            value = _WHITESPACE_RE.sub(' ', value or '').strip()
+        if value:
+            parts.append(value)
+    return '\n'.join(parts)
+
+
+def highlight(snippet):
+    """Escape a backend snippet and wrap its matches in ``<mark>``."""
+    marked = escape(snippet).replace(_MATCH_START, '<mark>')
+    return mark_safe(marked.replace(_MATCH_STOP, '</mark>'))
+
+
+def fts_rowid(document_id):
+    # Document keys are UUIDs; the FTS5 row is keyed by 63 of their bits so
+    # a document's entry is replaced and removed without a table scan
+    return document_id.int >> 65
+
+
+def fts_query(query):
+    """FTS5 query matching every word of ``query``, as plain words.
+
+    Quoting each word keeps user input from being read as FTS5 syntax.
+    """
+    return ' '.join(f'"{word}"' for word in _WORD_RE.findall(query))
+
+
+class PostgresFullTextBackend:
+    """Search backed by a GIN index on ``to_tsvector(search_text)``.
+
+    The index from migration 0025 is on the same expression Django compiles
+    ``SearchVector('search_text')`` to, so matching is an index scan and the
+    index follows ``search_text`` on every update.
+    """
+
+    def _vector_and_query(self, query):
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+
+        return (
+            SearchVector('search_text', config=SEARCH_CONFIG),
+            SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch'),
+        )
+
+    def index(self, document_id, text):
+        pass
+
+    def remove(self, document_id):
+        pass
+
+    def search(self, queryset, query, alternatives=Q()):
+        from django.contrib.postgres.search import SearchRank
+
+        vector, search_query = self._vector_and_query(query)
+        return queryset.alias(search_vector=vector).filter(
+            Q(search_vector=search_query) | alternatives
+        ).annotate(search_rank=SearchRank(vector, search_query))
+
+    def snippets(self, document_ids, query):
+        from django.contrib.postgres.search import SearchHeadline
+
+        _, search_query = self._vector_and_query(query)
+        headline = SearchHeadline(
+            'search_text', search_query, config=SEARCH_CONFIG,
+            start_sel=_MATCH_START, stop_sel=_MATCH_STOP,
+            max_words=SNIPPET_WORDS, min_words=SNIPPET_WORDS // 2,
+        )
+        rows = Document.objects.filter(pk__in=document_ids).annotate(
+            snippet=headline
+        ).values_list('pk', 'snippet')
+        return {pk: snippet for pk, snippet in rows if _MATCH_START in snippet}
+
+
+class SqliteFts5Backend:
+    """Search backed by an FTS5 table, for SQLite.
+
+    ``documents_document_fts`` (migration 0025) holds each document's
+    ``search_text``; rows are replaced as documents are saved and ranked
+    with FTS5's bm25.
+    """
+
+    def index(self, document_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s',
+                [fts_rowid(document_id)],
+            )
+            if text:
+                cursor.execute(
+                    f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, document_id, body) '
+                    'VALUES (%s, %s, %s)',
+                    [fts_rowid(document_id), document_id.hex, text],
+                )
+
+    def remove(self, document_id):
+        self.index(document_id, '')
+
+    def search(self, queryset, query, alternatives=Q()):
+        match = fts_query(query)
+        if not match:
+            return queryset.filter(alternatives).annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            )
+        where = f'FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s'
+        # The materialized match set is built once per query and probed per
+        # document through an automatic index; bm25 is lower for better matches
+        rank = RawSQL(
+            'WITH m AS MATERIALIZED ('
+            f'SELECT document_id, -bm25({SQLITE_FTS_TABLE}) AS rank {where}) '
+            'SELECT COALESCE((SELECT rank FROM m '
+            'WHERE m.document_id = "documents_document"."id"), 0.0)',
+            [match],
+            output_field=FloatField(),
+        )
+        return queryset.filter(
+            Q(pk__in=RawSQL(f'SELECT document_id {where}', [match])) | alternatives
+        ).annotate(search_rank=rank)
+
+    def snippets(self, document_ids, query):
+        match = fts_query(query)
+        rowids = [fts_rowid(document_id) for document_id in document_ids]
+        if not match or not rowids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(rowids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT document_id, '
+                f"snippet({SQLITE_FTS_TABLE}, 1, %s, %s, '…', %s) "
+                f'FROM {SQLITE_FTS_TABLE} '
+                f'WHERE {SQLITE_FTS_TABLE} MATCH %s AND rowid IN ({placeholders})',
+                [_MATCH_START, _MATCH_STOP, SNIPPET_WORDS, match, *rowids],
+            )
+            by_hex = {document_id.hex: document_id for document_id in document_ids}
+            return {
+                by_hex[document_id]: snippet
+                for document_id, snippet in cursor.fetchall()
+                if document_id in by_hex
+            }
+
+
+_postgres_backend = PostgresFullTextBackend()
+_sqlite_backend = SqliteFts5Backend()
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return _postgres_backend
+    return _sqlite_backend
+
+
+def index_document(document, values):
+    """Store and index the search text of ``document``.
+
+    ``values`` are the document's ``(field_type, value)`` pairs in field
+    order. Called whenever a document's field values are saved, inside the
+    same transaction, so the entry commits or rolls back with the values.
+    """
+    text = search_text(values)
+    Document.objects.filter(pk=document.pk).update(search_text=text)
+    document.search_text = text
+    get_search_backend().index(document.pk, text)
+
+
+def search_documents(queryset, query, alternatives=Q()):
+    """Filter ``queryset`` to documents whose contents match ``query``.
+
+    Documents matching ``alternatives`` are kept too, ranked after content
+    matches. Results are annotated with ``search_rank``.
+    """
+    return get_search_backend().search(queryset, query, alternatives)
+
+
+def document_snippets(documents, query):
+    """Return ``{document id: highlighted snippet}`` for contents matching ``query``."""
+    document_ids = [document.pk for document in documents]
+    snippets = get_search_backend().snippets(document_ids, query)
+    return {pk: highlight(snippet) for pk, snippet in snippets.items()}
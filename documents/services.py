@@ -0,0 +1,56 @@
+from .models import DocumentFieldValue, Drug, normalize_drug_name
+from .search import index_document
+
+
+def field_value_text(value):
+    """How a cleaned form value is stored in ``DocumentFieldValue.value``."""
+    if value is None:
+        return ''
+    if isinstance(value, Drug):
+        # Drug fields store the drug name
+        return value.name
+    return value
+
+
+def drugs_by_name(names):
+    """Map each stored drug name to its Drug, or ``None``, with one query.
+
+    Names are matched on ``Drug.normalized_name``, so case and spacing do
+    not matter; if several drugs share a name the oldest wins.
+    """
+    keys = {name: normalize_drug_name(name) for name in names if name}
+    drugs = {}
+    matches = Drug.objects.filter(normalized_name__in=set(keys.values()))
+    for drug in matches.order_by('-pk'):
+        drugs[drug.normalized_name] = drug
+    return {name: drugs.get(key) for name, key in keys.items()}
+
+
+def save_field_values(document, fields, cleaned_data):
+    """Insert or update the values of ``fields`` for ``document``.
+
+    The unique constraint on ``(document, field)`` makes this a single
+    ``INSERT ... ON CONFLICT DO UPDATE`` however many fields there are.
+    Typed columns are filled from the cleaned data without extra queries,
+    and the document's full-text entry is updated. Call it inside the
+    transaction that saves the document.
+    """
+    values = []
+    for field in fields:
+        cleaned = cleaned_data.get(field.snake_case_name)
+        value = DocumentFieldValue(
+            document=document, field=field, value=field_value_text(cleaned)
+        )
+        drug = cleaned if isinstance(cleaned, Drug) else None
+        value.set_typed_value(field.field_type, drug=drug)
+        values.append(value)
+
+    DocumentFieldValue.objects.bulk_create(
+        values,
+        update_conflicts=True,
+        unique_fields=['document', 'field'],
+        update_fields=['value', *DocumentFieldValue.TYPED_FIELDS],
+    )
+    index_document(
+        document, [(value.field.field_type, value.value) for value in values]
+    )
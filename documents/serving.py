@@ -0,0 +1,132 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    """A validator for files whose name does not already identify the content."""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` inclusive for a single byte range.
+
+    Raises ``ValueError`` for a malformed or unsatisfiable range. Returns
+    ``None`` for headers this server ignores (multiple ranges), in which
+    case the whole file is sent, as RFC 9110 allows.
+    """
+    if ',' in header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        raise ValueError(header)
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _range_applies(request, etag, last_modified):
+    # If-Range: only honor Range when the client's copy is still current
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return etag in parse_etags(if_range) and not if_range.startswith('W/')
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path):
+    backend = settings.DOCUMENT_SENDFILE_BACKEND
+    response = HttpResponse(content_type='application/pdf')
+    if backend == 'nginx':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace('\\', '/')
+        prefix = settings.DOCUMENT_SENDFILE_URL.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(relative)}'
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_pdf(request, path, etag=None):
+    """Serve a PDF on disk with validators, byte ranges and optional offload.
+
+    Callers do the permission checks first. Conditional requests get 304s
+    from ``ETag``/``Last-Modified``; a single ``Range`` gets a 206. With
+    ``DOCUMENT_SENDFILE_BACKEND`` set to ``nginx`` (``X-Accel-Redirect``) or
+    ``apache`` (``X-Sendfile``) the body transfer, including ranges, is left
+    to the front proxy.
+    """
+    stat = os.stat(path)
+    etag = etag or file_etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.DOCUMENT_SENDFILE_BACKEND:
+            response = _sendfile_response(path)
+        else:
+            response = _file_response(request, path, stat.st_size, etag, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Same URL, changing content: clients may store it but must revalidate
+    response['Cache-Control'] = 'private, no-cache'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _file_response(request, path, size, etag, last_modified):
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if (
+        range_header
+        and request.method in ('GET', 'HEAD')
+        and _range_applies(request, etag, last_modified)
+    ):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        _read_range(path, start, length),
+        status=206 if byte_range else 200,
+        content_type='application/pdf',
+    )
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,24 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Document, DocumentField, DocumentType
+from .search import get_search_backend
+
+
+def bump_schema_version(document_type_id):
+    """Retire the compiled form classes of a document type in every process."""
+    DocumentType.objects.filter(pk=document_type_id).update(
+        schema_version=F('schema_version') + 1
+    )
+
+
+@receiver(post_save, sender=DocumentField)
+@receiver(post_delete, sender=DocumentField)
+def document_field_changed(sender, instance, **kwargs):
+    bump_schema_version(instance.document_type_id)
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
@@ -1,2 +1,1210 @@
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+
+from accounts.models import Role
+from documents.bundles import collect_chart, merge_pdfs
+from documents.forms import _form_classes, document_form_class
+from documents.models import (
+    Document,
+    DocumentField,
+    DocumentFieldValue,
+    DocumentType,
+    Drug,
+    PdfJob,
+)
+from documents.pdf import (
+    PDF_ENGINES,
+    cached_pdf_name,
+    cached_pdf_path,
+    generate_pdf,
+    pdf_fingerprint,
+    render_pdf,
+    single_flight,
+)
+from documents.pdf_jobs import (
+    MAX_ATTEMPTS,
+    claim_next_job,
+    enqueue_pdf_job,
+    release_job,
+    requeue_stale_jobs,
+)
+from documents.predicates import (
+    FieldPredicate,
+    filter_documents,
+    parse_predicates,
+    plan,
+)
+from documents.search import (
+    PostgresFullTextBackend,
+    document_snippets,
+    get_search_backend,
+    search_documents,
+    search_text,
+    strip_html,
+)
+from patients.models import Geocode, Patient, TreatmentRecord
+
+CustomUser = get_user_model()
+
+
+class DocumentTestCase(TestCase):
+    """Creates a nurse, a patient and a field-based document in a temp MEDIA_ROOT."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        # Rolled-back tests reuse primary keys, so start with no compiled forms
+        _form_classes.clear()
+
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        self.user = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=nurse_role
+        )
+        self.patient = Patient.objects.create(
+            name="Wilhelmina Pratt",
+            address="123 Main St",
+            date_of_birth=date(1990, 1, 1),
+            height=70.0,
+            weight=180.0,
+            blood_group="O+",
+            bed_id="D1",
+            treatment_area="ICU"
+        )
+        self.document_type = DocumentType.objects.create(name="Handover Note")
+        self.note_field = DocumentField.objects.create(
+            document_type=self.document_type, name="Note", field_type='text'
+        )
+        self.document = self.create_document("Handover")
+        self.client.force_login(self.user)
+
+    def create_document(self, title, note="Stable overnight."):
+        document = Document.objects.create(
+            title=title, document_type=self.document_type, owner=self.user,
+            patient=self.patient,
+        )
+        DocumentFieldValue.objects.create(
+            document=document, field=self.note_field, value=note
+        )
+        return document
+
+
+class PdfJobQueueTests(DocumentTestCase):
+    def test_pdf_view_queues_one_job_and_returns_poll_url(self):
+        url = reverse('document_pdf', args=[self.document.pk])
+
+        first = self.client.get(url, HTTP_ACCEPT='application/json')
+        second = self.client.get(url)
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 202)
+        job = PdfJob.objects.get(document=self.document)
+        self.assertEqual(
+            first.json()['poll_url'], reverse('pdf_job_status', args=[job.pk])
+        )
+        self.assertEqual(second['Location'], first.json()['poll_url'])
+
+    def test_worker_renders_queued_job_and_view_serves_it(self):
+        job = enqueue_pdf_job(self.document)
+
+        out = StringIO()
+        call_command('run_pdf_worker', '--processes', '0', '--once', stdout=out)
+
+        self.assertIn("Processed 1 PDF jobs.", out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PdfJob.DONE)
+        status = self.client.get(reverse('pdf_job_status', args=[job.pk])).json()
+        self.assertEqual(
+            status['pdf_url'], reverse('document_pdf', args=[self.document.pk])
+        )
+
+        response = self.client.get(status['pdf_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content)[:5], b'%PDF-')
+
+    def test_claim_is_exclusive_and_oldest_first(self):
+        older = enqueue_pdf_job(self.document)
+        newer = enqueue_pdf_job(self.create_document("Second"))
+
+        self.assertEqual(claim_next_job(), older.pk)
+        self.assertEqual(claim_next_job(), newer.pk)
+        self.assertIsNone(claim_next_job())
+
+    def test_failed_jobs_retry_then_fail(self):
+        job = enqueue_pdf_job(self.document)
+        for _ in range(MAX_ATTEMPTS - 1):
+            claim_next_job()
+            self.assertEqual(release_job(job.pk, "boom"), PdfJob.PENDING)
+        claim_next_job()
+        self.assertEqual(release_job(job.pk, "boom"), PdfJob.FAILED)
+
+        # A failed job no longer blocks a fresh request
+        self.assertNotEqual(enqueue_pdf_job(self.document).pk, job.pk)
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = enqueue_pdf_job(self.document)
+        claim_next_job()
+        PdfJob.objects.filter(pk=job.pk).update(
+            started_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(requeue_stale_jobs(), (1, 0))
+        self.assertEqual(claim_next_job(), job.pk)
+
+
+class PdfCacheTests(DocumentTestCase):
+    def render_and_fetch(self, document):
+        url = reverse('document_pdf', args=[document.pk])
+        self.assertEqual(self.client.get(url).status_code, 202)
+        call_command('run_pdf_worker', '--processes', '0', '--once', stdout=StringIO())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        path = cached_pdf_path(pdf_fingerprint(Document.objects.get(pk=document.pk)))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        return path
+
+    def pdf_text(self, path):
+        return ''.join(page.extract_text() for page in PdfReader(path).pages)
+
+    def test_edit_produces_fresh_pdf(self):
+        original = self.render_and_fetch(self.document)
+        self.assertIn("Stable overnight.", self.pdf_text(original))
+
+        response = self.client.post(
+            reverse('document_edit', args=[self.document.pk]),
+            {
+                'title': "Handover", 'patient': self.patient.pk,
+                'note': "Transferred to ward 4.",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+
+        edited = self.render_and_fetch(self.document)
+        self.assertNotEqual(edited, original)
+        self.assertIn("Transferred to ward 4.", self.pdf_text(edited))
+
+    def test_renaming_a_field_produces_fresh_pdf(self):
+        original = self.render_and_fetch(self.document)
+
+        DocumentField.objects.filter(document_type=self.document_type).update(
+            name="Nursing Note"
+        )
+
+        renamed = self.render_and_fetch(self.document)
+        self.assertNotEqual(renamed, original)
+        self.assertIn("Nursing Note", self.pdf_text(renamed))
+
+    def test_evict_pdfs_removes_superseded_files_only(self):
+        original = self.render_and_fetch(self.document)
+        DocumentFieldValue.objects.filter(document=self.document).update(
+            value="Transferred to ward 4."
+        )
+        edited = self.render_and_fetch(self.document)
+        upload = os.path.join(self.media_root, 'documents/pdfs/scan.pdf')
+        with open(upload, 'wb') as f:
+            f.write(b"%PDF-1.4")
+        an_hour_ago = time.time() - 3600
+        for path in (original, f'{original}.lock', edited, upload):
+            os.utime(path, (an_hour_ago, an_hour_ago))
+
+        out = StringIO()
+        call_command('evict_pdfs', '--min-age', '10', stdout=out)
+
+        self.assertIn("Removed 1 superseded PDFs", out.getvalue())
+        self.assertFalse(os.path.exists(original))
+        self.assertFalse(os.path.exists(f'{original}.lock'))
+        self.assertTrue(os.path.exists(edited))
+        self.assertTrue(os.path.exists(upload))
+
+    def test_same_title_documents_do_not_collide(self):
+        twin = self.create_document("Handover", note="Different content.")
+
+        first = self.render_and_fetch(self.document)
+        second = self.render_and_fetch(twin)
+
+        self.assertNotEqual(first, second)
+        self.assertIn("Stable overnight.", self.pdf_text(first))
+
+    def test_cache_path_is_sharded_by_fingerprint(self):
+        fingerprint = pdf_fingerprint(self.document)
+        self.assertEqual(
+            cached_pdf_name(fingerprint),
+            f'documents/pdfs/{fingerprint[:2]}/{fingerprint[2:4]}/{fingerprint}.pdf',
+        )
+        self.assertEqual(
+            pdf_fingerprint(Document.objects.get(pk=self.document.pk)), fingerprint
+        )
+
+
+class PdfEngineTests(DocumentTestCase):
+    def render(self, document, engine=None):
+        pdf_path = os.path.join(self.media_root, 'engine.pdf')
+        self.assertEqual(render_pdf(document, pdf_path, engine=engine), pdf_path)
+        reader = PdfReader(pdf_path)
+        text = ''.join(page.extract_text() for page in reader.pages)
+        return reader.metadata.producer, text
+
+    def test_field_only_documents_take_reportlab_path(self):
+        producer, text = self.render(self.document)
+
+        self.assertIn("ReportLab", producer)
+        self.assertIn("Patient: Wilhelmina Pratt", text)
+        self.assertIn("Note: Stable overnight.", text)
+
+    def test_rich_text_documents_use_xhtml2pdf(self):
+        rich_field = DocumentField.objects.create(
+            document_type=self.document_type, name="Summary", field_type='rich_text'
+        )
+        DocumentFieldValue.objects.create(
+            document=self.document, field=rich_field, value="<p>Settled</p>"
+        )
+
+        producer, _ = self.render(self.document)
+        self.assertIn("xhtml2pdf", producer)
+
+    def test_engines_show_the_same_text(self):
+        document = self.create_document("Handover", note="Dose < 5 & rising")
+        _, fast = self.render(document, engine='reportlab')
+        _, html = self.render(document, engine='xhtml2pdf')
+
+        self.assertEqual(fast.split(), html.split())
+        self.assertIn("Dose < 5 & rising", fast)
+
+    def test_reportlab_failure_falls_back(self):
+        broken = mock.Mock(side_effect=RuntimeError("boom"))
+        with (
+            mock.patch.dict(PDF_ENGINES, {'reportlab': broken}),
+            self.assertLogs('documents.pdf', 'ERROR'),
+        ):
+            producer, _ = self.render(self.document)
+
+        broken.assert_called_once()
+        self.assertIn("xhtml2pdf", producer)
+        self.assertEqual(os.listdir(self.media_root), ['engine.pdf'])
+
+
+def _render_slowly(counter_path, pdf_path):
+    # Stand-in renderer: slow enough that every caller overlaps with it
+    with open(counter_path, 'a') as counter:
+        counter.write('render\n')
+    time.sleep(0.5)
+    with open(pdf_path, 'wb') as f:
+        f.write(b'%PDF-1.4 single flight')
+    return pdf_path
+
+
+def _request_pdf(barrier, pdf_path, counter_path, results):
+    barrier.wait()
+    render = partial(_render_slowly, counter_path)
+    results.put(single_flight(pdf_path, render, timeout=30))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_processes_render_once(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        pdf_path = os.path.join(workdir, 'document.pdf')
+        counter_path = os.path.join(workdir, 'renders.log')
+
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(20)
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=_request_pdf, args=(barrier, pdf_path, counter_path, results)
+            )
+            for _ in range(20)
+        ]
+        for process in processes:
+            process.start()
+        paths = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(timeout=60)
+
+        with open(counter_path) as counter:
+            self.assertEqual(counter.read().count('render'), 1)
+        self.assertEqual(paths, [pdf_path] * 20)
+
+    def test_waiter_gives_up_after_timeout(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        pdf_path = os.path.join(workdir, 'document.pdf')
+
+        def render_while_another_waits(path):
+            self.assertIsNone(
+                single_flight(path, lambda p: self.fail("rendered twice"), timeout=0)
+            )
+            return None
+
+        self.assertIsNone(single_flight(pdf_path, render_while_another_waits))
+
+
+class PdfServingTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload = Document.objects.create(
+            title="Scan", document_type=self.document_type, owner=self.user,
+            patient=self.patient, is_uploaded_pdf=True,
+            pdf_file='documents/pdfs/scan.pdf',
+        )
+        self.content = b'%PDF-1.4 ' + bytes(range(256)) * 40
+        os.makedirs(os.path.join(self.media_root, 'documents/pdfs'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'documents/pdfs/scan.pdf'), 'wb') as f:
+            f.write(self.content)
+        self.url = reverse('document_pdf', args=[self.upload.pk])
+
+    def test_full_response_carries_validators(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_conditional_get_returns_304(self):
+        first = self.client.get(self.url)
+
+        by_etag = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        by_date = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']
+        )
+
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(by_etag['ETag'], first['ETag'])
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response['Content-Range'], f'bytes 100-199/{len(self.content)}'
+        )
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-50')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-50:])
+
+        unsatisfiable = self.client.get(
+            self.url, HTTP_RANGE=f'bytes={len(self.content)}-'
+        )
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+        stale = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"'
+        )
+        self.assertEqual(stale.status_code, 200)
+
+    def test_generated_pdf_etag_is_fingerprint(self):
+        generate_pdf(self.document)
+        response = self.client.get(reverse('document_pdf', args=[self.document.pk]))
+        self.assertEqual(response['ETag'], f'"{pdf_fingerprint(self.document)}"')
+
+    @override_settings(
+        DOCUMENT_SENDFILE_BACKEND='nginx', DOCUMENT_SENDFILE_URL='/protected-media/'
+    )
+    def test_nginx_offload(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/documents/pdfs/scan.pdf'
+        )
+        self.assertEqual(response.content, b'')
+
+    @override_settings(DOCUMENT_SENDFILE_BACKEND='apache')
+    def test_sendfile_offload_still_requires_login(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(self.media_root, 'documents/pdfs/scan.pdf'),
+        )
+
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('X-Sendfile', response)
+
+
+class PatientChartTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.second = self.create_document("Ward Round", note="Mobilising with frame.")
+        self.url = reverse('patient_chart_pdf', args=[self.patient.pk])
+
+    def pdf_pages(self, content):
+        reader = PdfReader(BytesIO(content))
+        return [page.extract_text() for page in reader.pages]
+
+    def test_chart_waits_for_missing_pdfs_then_merges_them(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'status': 'pending', 'ready': 0, 'total': 2})
+        self.assertEqual(
+            PdfJob.objects.filter(document__patient=self.patient).count(), 2
+        )
+
+        call_command('run_pdf_worker', '--processes', '0', '--once', stdout=StringIO())
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        pages = self.pdf_pages(b''.join(response.streaming_content))
+        self.assertEqual(len(pages), 2)
+        self.assertIn("Stable overnight.", pages[0])
+        self.assertIn("Mobilising with frame.", pages[1])
+
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_failed_render_stops_polling_until_retried(self):
+        generate_pdf(self.document)
+        PdfJob.objects.create(
+            document=self.second, status=PdfJob.FAILED,
+            attempts=MAX_ATTEMPTS, error="Font missing.",
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 500)
+        self.assertContains(response, "Font missing.", status_code=500)
+        self.assertNotContains(response, "reload", status_code=500)
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'status': 'failed',
+            'failed': [{'document': str(self.second.pk), 'error': "Font missing."}],
+        })
+        self.assertFalse(PdfJob.objects.filter(status__in=PdfJob.ACTIVE_STATUSES).exists())
+
+        response = self.client.get(self.url, {'retry': '1'})
+        self.assertEqual(response.status_code, 202)
+        retried = PdfJob.objects.get(document=self.second, status=PdfJob.PENDING)
+        self.assertEqual(retried.attempts, 0)
+
+    def test_only_missing_documents_are_rendered(self):
+        generate_pdf(self.document)
+
+        with mock.patch('documents.bundles.generate_pdf', wraps=generate_pdf) as render:
+            bundle = collect_chart(self.patient, render_missing=True)
+
+        render.assert_called_once()
+        self.assertEqual(render.call_args.args[0], self.second)
+        self.assertEqual(len(bundle.sources), 2)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(collect_chart(self.patient).sources, bundle.sources)
+
+    def test_edit_changes_chart(self):
+        generate_pdf(self.document)
+        generate_pdf(self.second)
+        before = collect_chart(self.patient).fingerprint
+
+        DocumentFieldValue.objects.filter(document=self.second).update(value="Discharged.")
+        after = collect_chart(self.patient, render_missing=True)
+
+        self.assertNotEqual(after.fingerprint, before)
+
+    def test_command_includes_uploaded_pdfs(self):
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        os.makedirs(os.path.join(self.media_root, 'documents/pdfs'))
+        with open(os.path.join(self.media_root, 'documents/pdfs/scan.pdf'), 'wb') as f:
+            writer.write(f)
+        Document.objects.create(
+            title="Scan", document_type=self.document_type, owner=self.user,
+            patient=self.patient, is_uploaded_pdf=True,
+            pdf_file='documents/pdfs/scan.pdf',
+        )
+        output = os.path.join(self.media_root, 'chart.pdf')
+
+        out = StringIO()
+        call_command('bundle_patient_chart', str(self.patient.pk), output, stdout=out)
+
+        self.assertIn("Wrote 3 documents for Wilhelmina Pratt", out.getvalue())
+        with open(output, 'rb') as f:
+            self.assertEqual(len(self.pdf_pages(f.read())), 3)
+
+    def test_unreadable_uploads_are_replaced_by_a_notice(self):
+        generate_pdf(self.document)
+        generate_pdf(self.second)
+        locked = PdfWriter()
+        locked.add_blank_page(width=200, height=200)
+        locked.encrypt('secret')
+        os.makedirs(os.path.join(self.media_root, 'documents/pdfs'), exist_ok=True)
+        locked.write(os.path.join(self.media_root, 'documents/pdfs/locked.pdf'))
+        with open(os.path.join(self.media_root, 'documents/pdfs/scan.pdf'), 'wb') as f:
+            f.write(b"not a PDF")
+        for title, name in [("Locked Scan", 'locked.pdf'), ("Broken Scan", 'scan.pdf')]:
+            Document.objects.create(
+                title=title, document_type=self.document_type, owner=self.user,
+                patient=self.patient, is_uploaded_pdf=True,
+                pdf_file=f'documents/pdfs/{name}',
+            )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        pages = self.pdf_pages(b''.join(response.streaming_content))
+        self.assertEqual(len(pages), 4)
+        self.assertIn("Stable overnight.", pages[0])
+        self.assertIn(
+            '"Locked Scan" is left out of this chart: its PDF is password-protected.',
+            pages[2],
+        )
+        self.assertIn(
+            '"Broken Scan" is left out of this chart: its file is not a readable PDF.',
+            pages[3],
+        )
+
+    def write_source(self, name, pages, size=(200, 200), compress=True):
+        path = os.path.join(self.media_root, name)
+        pdf = canvas.Canvas(path, pagesize=size, pageCompression=compress)
+        for text in pages:
+            pdf.drawString(20, 20, text)
+            pdf.showPage()
+        pdf.save()
+        return path
+
+    def test_merged_chart_round_trips(self):
+        sources = [
+            self.write_source('first.pdf', ["Admission note", "Medication chart"]),
+            self.write_source(
+                'second.pdf', ["Discharge letter"], size=(300, 400), compress=False
+            ),
+        ]
+        output = os.path.join(self.media_root, 'chart.pdf')
+
+        merge_pdfs([(path, "Note") for path in sources], output)
+
+        merged = PdfReader(output, strict=True)
+        expected = [page for path in sources for page in PdfReader(path).pages]
+        self.assertEqual(
+            [page.extract_text() for page in merged.pages],
+            [page.extract_text() for page in expected],
+        )
+        self.assertEqual(
+            [page.mediabox for page in merged.pages],
+            [page.mediabox for page in expected],
+        )
+        # pypdf can read it back and write it out again
+        rewritten = BytesIO()
+        PdfWriter(clone_from=merged).write(rewritten)
+        self.assertEqual(len(PdfReader(rewritten).pages), 3)
+
+    def test_merge_holds_one_source_at_a_time(self):
+        # Random text on an uncompressed page, so every source is large
+        paths = [
+            self.write_source(
+                f'source-{i}.pdf', [os.urandom(100_000).hex()], compress=False
+            )
+            for i in range(20)
+        ]
+        source_size = os.path.getsize(paths[0])
+        output = os.path.join(self.media_root, 'chart.pdf')
+
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with mock.patch('documents.bundles.MERGE_COLLECT_BYTES', 2 * source_size):
+            merge_pdfs([(path, "Note") for path in paths], output)
+        _, peak = tracemalloc.get_traced_memory()
+
+        self.assertLess(peak, 5 * source_size)
+        self.assertEqual(len(PdfReader(output, strict=True).pages), 20)
+
+
+class DocumentFormCacheTests(DocumentTestCase):
+    def schema_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertIn(response.status_code, (200, 302))
+        return [
+            q['sql'] for q in queries.captured_queries
+            if 'FROM "documents_documentfield"' in q['sql']
+        ]
+
+    def test_forms_do_no_schema_queries_once_compiled(self):
+        create_url = reverse('document_create', args=[self.document_type.pk])
+        edit_url = reverse('document_edit', args=[self.document.pk])
+        self.client.get(create_url)
+
+        self.assertEqual(self.schema_queries('get', create_url), [])
+        self.assertEqual(self.schema_queries('get', edit_url), [])
+        created = {'title': "Night", 'patient': self.patient.pk, 'note': "Slept."}
+        self.assertEqual(self.schema_queries('post', create_url, created), [])
+        edited = {'title': "Handover", 'patient': self.patient.pk, 'note': "Woke."}
+        self.assertEqual(self.schema_queries('post', edit_url, edited), [])
+        self.assertTrue(DocumentFieldValue.objects.filter(
+            document=self.document, value="Woke."
+        ).exists())
+
+    def test_field_changes_through_update_view_rebuild_the_form(self):
+        def fresh_type():
+            return DocumentType.objects.get(pk=self.document_type.pk)
+
+        update_url = reverse('document_type_update', args=[self.document_type.pk])
+        version = fresh_type().schema_version
+        form_class = document_form_class(fresh_type())
+        self.assertIs(document_form_class(fresh_type()), form_class)
+
+        self.client.post(
+            update_url,
+            {'add_field': '1', 'name': "Pain Score", 'field_type': 'number'},
+        )
+
+        document_type = fresh_type()
+        self.assertEqual(document_type.schema_version, version + 1)
+        pain_score = DocumentField.objects.get(
+            document_type=self.document_type, name="Pain Score"
+        )
+        field_name = pain_score.snake_case_name
+        self.assertIn(field_name, document_form_class(document_type).base_fields)
+        response = self.client.get(
+            reverse('document_create', args=[self.document_type.pk])
+        )
+        self.assertContains(response, "Pain Score")
+
+        self.client.post(update_url, {'remove_field': pain_score.pk})
+        document_type.refresh_from_db()
+        self.assertNotIn(field_name, document_form_class(document_type).base_fields)
+
+
+class FieldValueWriteTests(DocumentTestCase):
+    def form_type(self, field_count):
+        document_type = DocumentType.objects.create(name=f"Assessment {field_count}")
+        fields = [
+            DocumentField.objects.create(
+                document_type=document_type, name=f"Item{i}", field_type='text'
+            )
+            for i in range(field_count)
+        ]
+        data = {'title': "Assessment", 'patient': self.patient.pk}
+        data.update(
+            {field.snake_case_name: f"Answer {i}" for i, field in enumerate(fields)}
+        )
+        # Compile the form class so only the writes are counted
+        self.client.get(reverse('document_create', args=[document_type.pk]))
+        return document_type, data
+
+    def count_queries(self, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+        return len(queries.captured_queries)
+
+    def test_saves_issue_constant_queries_regardless_of_field_count(self):
+        counts = {}
+        for field_count in (2, 40):
+            document_type, data = self.form_type(field_count)
+            created = self.count_queries(
+                reverse('document_create', args=[document_type.pk]), data
+            )
+            document = Document.objects.get(document_type=document_type)
+            self.assertEqual(document.field_values.count(), field_count)
+
+            data.update({key: "Revised" for key in data if key.startswith('item')})
+            edited = self.count_queries(
+                reverse('document_edit', args=[document.pk]), data
+            )
+            values = document.field_values.values_list('value', flat=True)
+            self.assertEqual(set(values), {"Revised"})
+            self.assertEqual(document.field_values.count(), field_count)
+            counts[field_count] = (created, edited)
+
+        self.assertEqual(counts[2], counts[40])
+
+    def test_edit_adds_values_for_new_fields_and_keeps_zero(self):
+        score = DocumentField.objects.create(
+            document_type=self.document_type, name="Score", field_type='number'
+        )
+        self.client.post(
+            reverse('document_edit', args=[self.document.pk]),
+            {
+                'title': "Handover", 'patient': self.patient.pk,
+                'note': "Stable.", 'score': 0,
+            },
+        )
+        value = DocumentFieldValue.objects.get(document=self.document, field=score)
+        self.assertEqual(value.value, '0')
+        self.assertEqual(self.document.field_values.count(), 2)
+
+
+class DrugPrefillTests(DocumentTestCase):
+    def medication_record(self, drug_count):
+        document_type = DocumentType.objects.create(
+            name=f"Medication Record {drug_count}"
+        )
+        document = Document.objects.create(
+            title="Medications", document_type=document_type, owner=self.user,
+            patient=self.patient,
+        )
+        for i in range(drug_count):
+            drug = Drug.objects.create(name=f"Zentrofloxin {drug_count}-{i}")
+            field = DocumentField.objects.create(
+                document_type=document_type, name=f"Drug{i}", field_type='drug'
+            )
+            DocumentFieldValue.objects.create(
+                document=document, field=field, value=drug.name
+            )
+        return document
+
+    def test_edit_form_prefill_is_constant_query(self):
+        counts = []
+        for drug_count in (1, 30):
+            url = reverse('document_edit', args=[self.medication_record(drug_count).pk])
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            drug_queries = [
+                q['sql'] for q in queries.captured_queries
+                if 'FROM "documents_drug"' in q['sql']
+            ]
+            counts.append((len(queries.captured_queries), len(drug_queries)))
+            name = f"Zentrofloxin {drug_count}-0"
+            self.assertEqual(response.context['form'].initial['drug0'].name, name)
+            self.assertContains(response, f'selected>{name}</option>')
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_drug_names_match_case_and_spacing_insensitively(self):
+        drug = Drug.objects.create(name="Quarvalin  Forte")
+        self.assertEqual(drug.normalized_name, "quarvalin forte")
+
+        document = self.medication_record(0)
+        field = DocumentField.objects.create(
+            document_type=document.document_type, name="Drug", field_type='drug'
+        )
+        DocumentFieldValue.objects.create(
+            document=document, field=field, value="QUARVALIN forte"
+        )
+
+        response = self.client.get(reverse('document_edit', args=[document.pk]))
+        self.assertEqual(response.context['form'].initial['drug'], drug)
+
+
+class TypedFieldValueTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        fields = self.document_type.fields
+        self.dose = fields.create(name="Dose", field_type='number')
+        self.given = fields.create(name="Given", field_type='date')
+        self.drug_field = fields.create(name="Medication", field_type='drug')
+        self.drug = Drug.objects.create(name="Velmorazine")
+
+    def test_form_saves_fill_typed_columns(self):
+        self.client.post(
+            reverse('document_edit', args=[self.document.pk]),
+            {
+                'title': "Handover", 'patient': self.patient.pk, 'note': "75",
+                'dose': 75, 'given': '2024-03-05', 'medication': self.drug.pk,
+            },
+        )
+
+        values = {v.field_id: v for v in self.document.field_values.all()}
+        self.assertEqual(values[self.dose.pk].number_value, Decimal(75))
+        self.assertEqual(values[self.given.pk].date_value, date(2024, 3, 5))
+        self.assertEqual(values[self.drug_field.pk].drug, self.drug)
+        # Only the column of the field's own type is set
+        self.assertIsNone(values[self.note_field.pk].number_value)
+        self.assertIsNone(values[self.dose.pk].date_value)
+
+    def test_model_saves_parse_text_values(self):
+        values = self.document.field_values
+        dose = values.create(field=self.dose, value=" 12.5 ")
+        drug = values.create(field=self.drug_field, value="velmorazine")
+        self.assertEqual(dose.number_value, Decimal('12.5'))
+        self.assertEqual(drug.drug, self.drug)
+
+        dose.value = "not recorded"
+        dose.save(update_fields=['value'])
+        dose.refresh_from_db()
+        self.assertIsNone(dose.number_value)
+
+    def test_range_queries_use_partial_index(self):
+        for value in ("10", "60", "abc"):
+            DocumentFieldValue.objects.create(
+                document=self.create_document("Dose"), field=self.dose, value=value
+            )
+
+        high = DocumentFieldValue.objects.filter(field=self.dose, number_value__gt=50)
+        self.assertEqual(list(high.values_list('value', flat=True)), ["60"])
+        if connection.vendor == 'sqlite':
+            self.assertIn('fieldvalue_field_number_idx', high.explain())
+
+
+class FieldPredicateTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.chart = DocumentType.objects.create(name="Medication Chart")
+        self.drug_field = self.chart.fields.create(name="Drug", field_type='drug')
+        self.given = self.chart.fields.create(name="Given", field_type='date')
+        self.dose = self.chart.fields.create(name="Dose", field_type='number')
+        self.drug = Drug.objects.create(name="Trelanimab")
+        self.other_drug = Drug.objects.create(name="Osperidol")
+
+    def chart_entry(self, patient, drug, given, dose):
+        document = Document.objects.create(
+            title="Medication", document_type=self.chart, owner=self.user,
+            patient=patient,
+        )
+        values = [
+            (self.drug_field, drug.name),
+            (self.given, given.isoformat()),
+            (self.dose, dose),
+        ]
+        for field, value in values:
+            document.field_values.create(field=field, value=value)
+        return document
+
+    def test_patients_in_geocode_given_drug_this_week(self):
+        ward = Geocode.objects.create(name="Ward Zeta", description="")
+        today = date.today()
+        inside = Patient.objects.create(
+            name="Ottoline Grebe", address="1 Main St",
+            date_of_birth=date(1950, 1, 1), height=60, weight=150,
+            blood_group="A+", bed_id="Z1", treatment_area="ICU", geocode=ward,
+        )
+        self.chart_entry(inside, self.drug, today, 10)
+        self.chart_entry(inside, self.other_drug, today, 10)
+        self.chart_entry(self.patient, self.drug, today, 10)  # not in the geocode
+        late = Patient.objects.create(
+            name="Barnaby Quill", address="2 Main St",
+            date_of_birth=date(1950, 1, 1), height=60, weight=150,
+            blood_group="A+", bed_id="Z2", treatment_area="ICU", geocode=ward,
+        )
+        self.chart_entry(late, self.drug, today - timedelta(days=30), 10)
+
+        predicates, errors = parse_predicates(
+            [str(self.drug_field.pk), str(self.given.pk)],
+            ['drug', 'range'],
+            ["trelanimab", f"{today - timedelta(days=7)}.."],
+        )
+        documents = filter_documents(Document.objects.all(), predicates)
+        patients = Patient.objects.filter(
+            geocode=ward, documents__in=documents
+        ).distinct()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(list(patients), [inside])
+
+    def test_planner_puts_most_selective_predicate_first(self):
+        for dose in range(20):
+            self.chart_entry(self.patient, self.other_drug, date(2024, 1, 1), dose)
+        rare = self.chart_entry(self.patient, self.drug, date(2024, 1, 1), 99)
+
+        common = FieldPredicate(self.dose, 'range', (Decimal(0), None))
+        selective = FieldPredicate(self.drug_field, 'drug', [self.drug.pk])
+        text = FieldPredicate(self.note_field, 'contains', "stable")
+
+        self.assertEqual(plan([text, common, selective]), [selective, common, text])
+        matches = filter_documents(Document.objects.all(), [common, selective])
+        self.assertEqual(list(matches), [rare])
+
+    def test_invalid_predicates_are_reported(self):
+        predicates, errors = parse_predicates(
+            [
+                str(self.dose.pk), str(self.given.pk), str(self.drug_field.pk),
+                '999999', str(self.dose.pk),
+            ],
+            ['range', 'eq', 'drug', 'eq', 'contains'],
+            ["high", "yesterday", "Unknownium", "1", "5"],
+        )
+        self.assertEqual(predicates, [])
+        self.assertEqual(len(errors), 5)
+
+    def test_list_view_filters_by_field_value(self):
+        TreatmentRecord.objects.create(patient=self.patient, worker=self.user)
+        high = self.chart_entry(self.patient, self.drug, date(2024, 1, 1), 80)
+        self.chart_entry(self.patient, self.drug, date(2024, 1, 1), 20)
+
+        response = self.client.get(reverse('document_list'), {
+            'filter': self.chart.pk, 'field': self.dose.pk,
+            'op': 'range', 'value': '50..',
+        })
+        self.assertEqual(list(response.context['documents']), [high])
+        self.assertContains(
+            response, f'<option value="{self.dose.pk}" selected>Dose</option>'
+        )
+
+        response = self.client.get(reverse('document_list'), {
+            'filter': self.chart.pk, 'field': self.dose.pk,
+            'op': 'range', 'value': 'lots',
+        })
+        self.assertEqual(len(response.context['documents']), 2)
+        self.assertEqual(
+            response.context['predicate_errors'],
+            ["Ranges are written low..high; either end may be left out."],
+        )
+
+
+class DocumentExportTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        TreatmentRecord.objects.create(patient=self.patient, worker=self.user)
+        self.vitals = DocumentType.objects.create(name="Vitals")
+        self.pulse = self.vitals.fields.create(name="Pulse", field_type='number')
+        self.taken = self.vitals.fields.create(name="Taken", field_type='date')
+        self.comment = self.vitals.fields.create(name="Comment", field_type='text')
+        self.readings = []
+        for i in range(5):
+            document = Document.objects.create(
+                title=f"Vitals {i}", document_type=self.vitals, owner=self.user,
+                patient=self.patient,
+            )
+            document.field_values.create(field=self.pulse, value=str(60 + i * 10))
+            if i % 2 == 0:
+                document.field_values.create(field=self.comment, value=f"Note, {i}")
+            self.readings.append(document)
+        # Another nurse's patient is not exported
+        other = Patient.objects.create(
+            name="Cornelius Vane", address="9 Side St",
+            date_of_birth=date(1970, 1, 1), height=60, weight=150,
+            blood_group="B+", bed_id="V9", treatment_area="ER",
+        )
+        Document.objects.create(
+            title="Hidden", document_type=self.vitals, owner=self.user, patient=other
+        )
+
+    def export(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('document_export'), {'filter': self.vitals.pk, **params}
+            )
+            content = b''.join(response.streaming_content).decode()
+        value_queries = [
+            q for q in queries.captured_queries
+            if '"documents_documentfieldvalue"' in q['sql']
+        ]
+        self.assertEqual(len(value_queries), 1)
+        return response, content
+
+    def test_csv_has_one_row_per_document_and_column_per_field(self):
+        response, content = self.export(format='csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('vitals-documents.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(list(rows[0]), [
+            'document_id', 'title', 'patient', 'owner', 'creation_date',
+            'Pulse', 'Taken', 'Comment',
+        ])
+        by_title = {row['title']: row for row in rows}
+        self.assertEqual(sorted(by_title), [f"Vitals {i}" for i in range(5)])
+        self.assertEqual(by_title["Vitals 2"]['Pulse'], '80')
+        self.assertEqual(by_title["Vitals 2"]['Comment'], "Note, 2")
+        self.assertEqual(by_title["Vitals 1"]['Comment'], '')
+        self.assertEqual(by_title["Vitals 1"]['patient'], "Wilhelmina Pratt")
+
+    def test_ndjson_applies_list_predicates(self):
+        _, content = self.export(
+            format='ndjson', field=self.pulse.pk, op='range', value='90..'
+        )
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(sorted(row['title'] for row in rows), ["Vitals 3", "Vitals 4"])
+        self.assertEqual({row['Pulse'] for row in rows}, {'90', '100'})
+
+    def test_rejects_missing_type_and_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('document_export')).status_code, 400)
+        response = self.client.get(
+            reverse('document_export'), {'filter': self.vitals.pk, 'format': 'xlsx'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class DocumentListAccessTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        TreatmentRecord.objects.create(patient=self.patient, worker=self.user)
+        self.other_patient = Patient.objects.create(
+            name="Cornelius Vane", address="9 Side St",
+            date_of_birth=date(1970, 1, 1), height=60, weight=150,
+            blood_group="B+", bed_id="V9", treatment_area="ER",
+        )
+        Document.objects.create(
+            title="Untreated Patient Note", document_type=self.document_type,
+            owner=self.user, patient=self.other_patient,
+        )
+
+    def list_titles(self, **params):
+        response = self.client.get(
+            reverse('document_list'), {'items_per_page': 50, **params}
+        )
+        return [document.title for document in response.context['documents']]
+
+    def test_lists_each_visible_document_once(self):
+        # Other workers treating the same patients add no rows
+        for i in range(3):
+            worker = CustomUser.objects.create_user(
+                username=f'worker{i}', email=f'worker{i}@example.com',
+                password='password123',
+            )
+            TreatmentRecord.objects.create(patient=self.patient, worker=worker)
+            TreatmentRecord.objects.create(patient=self.other_patient, worker=worker)
+
+        self.assertEqual(self.list_titles(q="Handover"), ["Handover"])
+        self.assertNotIn("Untreated Patient Note", self.list_titles())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('document_list'), {'items_per_page': 50})
+            return len(queries)
+
+        few = count_queries()
+        for i in range(10):
+            self.create_document(f"Handover {i}")
+        self.assertEqual(count_queries(), few)
+
+    def test_links_only_pages_near_the_current_one(self):
+        for i in range(12):
+            self.create_document(f"Handover {i}")
+
+        response = self.client.get(
+            reverse('document_list'), {'items_per_page': 1, 'page': 7}
+        )
+
+        content = response.content.decode()
+        for page in (1, 5, 6, 8, 9, 13):
+            self.assertIn(f'page={page}"', content)
+        for page in (2, 3, 4, 10, 11, 12):
+            self.assertNotIn(f'page={page}"', content)
+
+
+class DocumentSearchTests(DocumentTestCase):
+    def setUp(self):
+        super().setUp()
+        TreatmentRecord.objects.create(patient=self.patient, worker=self.user)
+        self.summary = self.document_type.fields.create(
+            name="Summary", field_type='rich_text'
+        )
+
+    def save(self, document, note, summary=''):
+        response = self.client.post(
+            reverse('document_edit', args=[document.pk]),
+            {
+                'title': document.title, 'patient': self.patient.pk, 'note': note,
+                self.summary.snake_case_name: summary,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def matches(self, query):
+        results = search_documents(Document.objects.all(), query)
+        return list(results.values_list('title', flat=True))
+
+    def test_rich_text_is_indexed_without_markup(self):
+        self.assertEqual(
+            strip_html('<p>Pain&nbsp;<b>easing</b></p><p>x &lt; y</p>'),
+            'Pain easing x < y',
+        )
+        self.assertEqual(
+            search_text([
+                ('text', ' Slept  well '),
+                ('number', '12'),
+                ('rich_text', '<p>Ate<br>toast</p>'),
+            ]),
+            'Slept well\nAte toast',
+        )
+
+        self.save(
+            self.document, "Stable overnight.",
+            '<p>Mild <strong>tachycardia</strong></p>',
+        )
+        self.document.refresh_from_db()
+        self.assertEqual(
+            self.document.search_text, "Stable overnight.\nMild tachycardia"
+        )
+        self.assertEqual(self.matches("tachycardia"), ["Handover"])
+        # Markup is not searchable content
+        self.assertEqual(self.matches("strong"), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.save(self.document, "Complained of nausea.")
+        self.assertEqual(self.matches("nausea"), ["Handover"])
+
+        self.save(self.document, "Settled after fluids.")
+        self.assertEqual(self.matches("nausea"), [])
+        # Stemmed, so other forms of a word match
+        self.assertEqual(self.matches("settle"), ["Handover"])
+
+        document_id = self.document.pk
+        self.document.delete()
+        if connection.vendor == 'sqlite':
+            snippets = get_search_backend().snippets([document_id], "settled")
+            self.assertEqual(snippets, {})
+
+    def test_list_ranks_matches_and_highlights_snippets(self):
+        other = self.create_document("Evening Round")
+        self.save(
+            other, "Wound <b>dressing</b> changed.",
+            '<p>Wound clean; wound edges dry.</p>',
+        )
+        self.save(self.document, "Reviewed wound once.")
+
+        response = self.client.get(reverse('document_list'), {'q': "wound"})
+
+        documents = list(response.context['documents'])
+        self.assertEqual(
+            [document.title for document in documents], ["Evening Round", "Handover"]
+        )
+        content = response.content.decode()
+        self.assertIn('<mark>wound</mark>', content.lower())
+        # Snippet text is escaped; only the highlighting is markup
+        self.assertIn('&lt;b&gt;dressing', content)
+        self.assertNotIn('<b>dressing', content)
+
+    def test_list_still_matches_titles_and_tolerates_search_syntax(self):
+        response = self.client.get(reverse('document_list'), {'q': "Hando"})
+        titles = [document.title for document in response.context['documents']]
+        self.assertIn("Handover", titles)
+        response = self.client.get(reverse('document_list'), {'q': 'NEAR("wound" AND'})
+        self.assertEqual(response.status_code, 200)
+
+    @skipUnless(connection.vendor == 'postgresql', "PostgreSQL full-text search")
+    def test_postgres_search_matches_through_gin_index(self):
+        self.assertIsInstance(get_search_backend(), PostgresFullTextBackend)
+        self.save(
+            self.document, "Stable overnight.",
+            '<p>Mild <strong>tachycardia</strong></p>',
+        )
+
+        self.assertEqual(self.matches("tachycardia"), ["Handover"])
+        self.assertEqual(self.matches("stable tachycardias"), ["Handover"])
+        # Markup is not searchable content
+        self.assertEqual(self.matches("strong"), [])
+        snippet = document_snippets([self.document], "tachycardia")[self.document.pk]
+        self.assertIn('<mark>tachycardia</mark>', snippet)
+        self.assertNotIn('strong', snippet)
+
+        # The query's vector must be the indexed expression from migration 0025
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        explained = search_documents(Document.objects.all(), "tachycardia").explain()
+        self.assertIn('document_search_text_gin', explained)
@@ -4,6 +4,7 @@ from .views import (
     DocumentCreateView,
     DocumentDeleteView,
     DocumentDetailView,
+    DocumentExportView,
     DocumentListView,
     DocumentTypeCreateView,
     DocumentTypeDeleteView,
@@ -13,16 +14,24 @@ from .views import (
     DocumentUpdateView,
     DrugAutocompleteView,
     document_pdf_view,
+    patient_chart_pdf_view,
+    pdf_job_status,
 )
 
 urlpatterns = [
     path('documents/', DocumentListView.as_view(), name='document_list'),  # List all documents
+    path('documents/export/', DocumentExportView.as_view(), name='document_export'),
     path('documents/type/select/', DocumentTypeSelectView.as_view(), name='document_type_select'),
     path('documents/type/<int:document_type_pk>/create/', DocumentCreateView.as_view(), name='document_create'),
     path('documents/<uuid:pk>/', DocumentDetailView.as_view(), name='document_detail'),  # View a specific document
     path('documents/<uuid:pk>/edit/', DocumentUpdateView.as_view(), name='document_edit'),  # Edit a specific document
     path('documents/<uuid:pk>/delete/', DocumentDeleteView.as_view(), name='document_delete'),  # Delete a specific document
     path('documents/<uuid:pk>/pdf/', document_pdf_view, name='document_pdf'),
+    path('documents/pdf_jobs/<uuid:pk>/', pdf_job_status, name='pdf_job_status'),
+    path(
+        'documents/charts/<uuid:patient_pk>/pdf/',
+        patient_chart_pdf_view, name='patient_chart_pdf',
+    ),
     path('document_type/create/', DocumentTypeCreateView.as_view(), name='document_type_create'),
     path('document_type/<int:pk>/update/', DocumentTypeUpdateView.as_view(), name='document_type_update'),
     path('document_type/<int:pk>/delete/', DocumentTypeDeleteView.as_view(), name='document_type_delete'),
@@ -1,73 +1,156 @@
-import os
-
 from dal import autocomplete
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q
-from django.http import FileResponse, HttpResponse, HttpResponseRedirect
-from django.shortcuts import get_object_or_404, redirect
-from django.template.loader import render_to_string
-from django.urls import reverse_lazy
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.views.generic import DeleteView, DetailView, FormView, ListView, UpdateView
-from xhtml2pdf import pisa
 
+from patients.assignments import treated_patient_ids
+from patients.models import Patient
+from patients.pagination import KeysetPaginationMixin, clamp_page_size
+
+from .bundles import build_chart_pdf, collect_chart
+from .exports import export_documents
 from .forms import (  # Import the custom form with Summernote widget
     DocumentFieldForm,
     DocumentForm,
     DocumentTypeForm,
+    document_form_class,
 )
-from .models import Document, DocumentField, DocumentFieldValue, DocumentType, Drug
-
-
-def generate_pdf(document):
-    # Render the HTML content
-    html_content = render_to_string('documents/document_pdf.html', {'document': document})
-
-    # Define a path to save the PDF file
-    pdf_directory = os.path.join(settings.MEDIA_ROOT, 'documents/pdfs')
-    pdf_path = os.path.join(pdf_directory, f'{document.title}.pdf')
+from .models import Document, DocumentField, DocumentType, Drug, PdfJob
+from .pdf import cached_pdf_path, pdf_fingerprint
+from .pdf_jobs import enqueue_pdf_job, failed_pdf_jobs
+from .predicates import OPERATOR_LABELS, filter_documents, parse_predicates
+from .search import document_snippets, search_documents
+from .services import drugs_by_name, save_field_values
+from .serving import serve_pdf
 
-    # Create the directory if it doesn't exist
-    if not os.path.exists(pdf_directory):
-        os.makedirs(pdf_directory)
-
-    # Create PDF
-    with open(pdf_path, 'wb') as pdf_file:
-        pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
-
-    # Check for errors
-    if pisa_status.err:
-        return None
-
-    return pdf_path
 
+@login_required
 def document_pdf_view(request, pk):
-    # Get the document instance
-    document = get_object_or_404(Document, pk=pk)
-
-    # Check if the document has an uploaded PDF
-    if document.is_uploaded_pdf and document.pdf_file and os.path.exists(document.pdf_file.path):
-        # Serve the existing uploaded PDF file
-        return FileResponse(open(document.pdf_file.path, 'rb'), content_type='application/pdf')
-
-    # Check if the PDF has already been generated
-    if document.pdf_file and not document.is_uploaded_pdf and os.path.exists(document.pdf_file.path):
-        # Serve the existing generated PDF file
-        return FileResponse(open(document.pdf_file.path, 'rb'), content_type='application/pdf')
-
-    # If the PDF doesn't exist and it needs to be generated, generate it
-    if not document.is_uploaded_pdf:
-        pdf_path = generate_pdf(document)
-        if pdf_path:
-            # Correctly save the relative path of the PDF file
-            document.pdf_file.name = os.path.relpath(pdf_path, settings.MEDIA_ROOT).replace('\\', '/')
-            document.save()
+    # Get the document instance with everything its PDF fingerprint needs
+    document = get_object_or_404(
+        Document.objects.select_related('patient', 'owner', 'document_type'), pk=pk
+    )
 
-            # Serve the generated PDF file
-            return FileResponse(open(pdf_path, 'rb'), content_type='application/pdf')
+    # Serve the uploaded PDF file as is
+    if document.is_uploaded_pdf:
+        try:
+            return serve_pdf(request, document.pdf_file.path)
+        except (ValueError, FileNotFoundError):
+            return HttpResponse(
+                'Error generating or retrieving PDF', content_type='text/plain'
+            )
 
-    return HttpResponse('Error generating or retrieving PDF', content_type='text/plain')
+    # Generated PDFs are content-addressed, so an existing file is current
+    # and its fingerprint is a strong ETag
+    fingerprint = pdf_fingerprint(document)
+    try:
+        return serve_pdf(request, cached_pdf_path(fingerprint), etag=f'"{fingerprint}"')
+    except FileNotFoundError:
+        pass
+
+    # Rendering happens in run_pdf_worker; tell the client where to poll
+    job = enqueue_pdf_job(document)
+    return pdf_job_pending_response(request, job)
+
+
+def pdf_job_pending_response(request, job):
+    poll_url = reverse('pdf_job_status', kwargs={'pk': job.pk})
+    if 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse(
+            {'job': str(job.pk), 'status': job.status, 'poll_url': poll_url},
+            status=202,
+        )
+    else:
+        response = render(
+            request, 'documents/document_pdf_pending.html',
+            {'job': job, 'poll_url': poll_url}, status=202,
+        )
+    response['Location'] = poll_url
+    response['Retry-After'] = '2'
+    return response
+
+
+@login_required
+def pdf_job_status(request, pk):
+    job = get_object_or_404(PdfJob, pk=pk)
+    data = {'job': str(job.pk), 'status': job.status, 'error': job.error}
+    if job.status == PdfJob.DONE:
+        data['pdf_url'] = reverse('document_pdf', kwargs={'pk': job.document_id})
+    return JsonResponse(data)
+
+
+@login_required
+def patient_chart_pdf_view(request, patient_pk):
+    patient = get_object_or_404(Patient, pk=patient_pk)
+    bundle = collect_chart(patient)
+
+    # Charts are merged from cached document PDFs only; queue whatever is
+    # missing and have the client come back
+    if bundle.missing:
+        # A failed render is only queued again on request, so the pending
+        # page does not poll a render that keeps failing
+        failed = {} if 'retry' in request.GET else failed_pdf_jobs(bundle.missing)
+        if failed:
+            return chart_failed_response(request, bundle, failed)
+        for document in bundle.missing:
+            enqueue_pdf_job(document)
+        return chart_pending_response(request, bundle)
+
+    if not bundle.sources:
+        raise Http404("This patient has no documents with a PDF.")
+    pdf_path = build_chart_pdf(bundle)
+    if pdf_path is None:
+        return HttpResponse(
+            'Error generating or retrieving PDF', content_type='text/plain', status=500
+        )
+    return serve_pdf(request, pdf_path, etag=f'"{bundle.fingerprint}"')
+
+
+def chart_pending_response(request, bundle):
+    ready = len(bundle.sources)
+    total = ready + len(bundle.missing)
+    if 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse(
+            {'status': 'pending', 'ready': ready, 'total': total}, status=202
+        )
+    else:
+        response = render(
+            request, 'documents/patient_chart_pending.html',
+            {'patient': bundle.patient, 'ready': ready, 'total': total}, status=202,
+        )
+    response['Retry-After'] = '2'
+    return response
+
+
+def chart_failed_response(request, bundle, failed):
+    failures = [
+        {'document': document, 'error': failed[document.pk].error}
+        for document in bundle.missing if document.pk in failed
+    ]
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'status': 'failed',
+            'failed': [
+                {'document': str(f['document'].pk), 'error': f['error']}
+                for f in failures
+            ],
+        }, status=500)
+    return render(
+        request, 'documents/patient_chart_failed.html',
+        {'patient': bundle.patient, 'failures': failures}, status=500,
+    )
 
 
 @method_decorator(login_required, name='dispatch')
@@ -101,33 +184,44 @@ class DrugAutocompleteView(autocomplete.Select2QuerySetView):
 
 # List View: List all documents owned or shared with the user
 @method_decorator(login_required, name='dispatch')
-class DocumentListView(ListView):
+class DocumentListView(KeysetPaginationMixin, ListView):
     model = Document
     template_name = 'documents/document_list.html'  # Template for listing documents
     context_object_name = 'documents'
+    keyset_sort_fields = {
+        'title': 'title',
+        'patient': 'patient__name',
+        'owner': 'owner__username',
+        'document_type': 'document_type__name',
+    }
+    keyset_default_sort = 'title'
+    keyset_search_param = 'q'
 
     def get_paginate_by(self, queryset):
-        items_per_page = self.request.GET.get('items_per_page', 20)
-
-        try:
-            # Convert the value to an integer, default to 6 if conversion fails
-            return int(items_per_page)
-        except ValueError:
-            # If conversion fails, use the default value of 6
-            return 20
+        return clamp_page_size(self.request.GET.get('items_per_page'), 20)
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        queryset = queryset.filter(patient__treated_by=self.request.user)
-
-        # Search functionality
+        queryset = super().get_queryset().select_related(
+            'patient', 'document_type', 'owner'
+        )
+        queryset = queryset.filter(
+            patient_id__in=treated_patient_ids(self.request.user)
+        )
+
+        # Search functionality: document contents through the full-text
+        # index, plus substring matches on what the list shows
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(patient__name__icontains=query) |
-                Q(document_type__name__icontains=query) |
-                Q(owner__username__icontains=query)
+            queryset = search_documents(
+                queryset,
+                query,
+                alternatives=(
+                    Q(title__icontains=query) |
+                    Q(patient__name__icontains=query) |
+                    Q(document_type__name__icontains=query) |
+                    Q(owner__username__icontains=query) |
+                    Q(owner__email__icontains=query)
+                ),
             )
 
         # Filter by document type
@@ -135,6 +229,15 @@ class DocumentListView(ListView):
         if document_type_id:
             queryset = queryset.filter(document_type_id=document_type_id)
 
+        # Filter by field values, e.g. ?field=12&op=range&value=50..100;
+        # the parameters repeat for several conditions
+        self.predicates, self.predicate_errors = parse_predicates(
+            self.request.GET.getlist('field'),
+            self.request.GET.getlist('op'),
+            self.request.GET.getlist('value'),
+        )
+        queryset = filter_documents(queryset, self.predicates)
+
         # Sort functionality
         sort_by = self.request.GET.get('sort')
         if sort_by == 'title':
@@ -145,6 +248,9 @@ class DocumentListView(ListView):
             queryset = queryset.order_by('owner__username')
         elif sort_by == 'document_type':
             queryset = queryset.order_by('document_type__name')
+        elif query:
+            # Searches without an explicit sort are ranked, best match first
+            queryset = queryset.order_by('-search_rank', 'title', 'pk')
 
         return queryset
 
@@ -159,8 +265,52 @@ class DocumentListView(ListView):
         context['sort'] = self.request.GET.get('sort', 'title')
         context['items_per_page'] = self.request.GET.get('items_per_page', 6)
 
+        # Fields of the selected type can be filtered on
+        document_type_id = self.request.GET.get('filter', '')
+        context['predicate_fields'] = (
+            DocumentField.objects.filter(document_type_id=document_type_id).order_by('pk')
+            if document_type_id.isdigit() else []
+        )
+        context['operator_labels'] = OPERATOR_LABELS.items()
+        context['predicate_errors'] = self.predicate_errors
+        page_query = self.request.GET.copy()
+        page_query.pop('page', None)
+        context['page_query'] = page_query.urlencode() + '&' if page_query else ''
+        query = self.request.GET.get('q')
+        if query:
+            # Highlighted matches from the contents of the documents on this page
+            snippets = document_snippets(context['documents'], query)
+            for document in context['documents']:
+                document.search_snippet = snippets.get(document.pk)
+        if not context['keyset'] and context['paginator'] is not None:
+            # Only the pages around the current one are linked, so rendering
+            # does not grow with the number of pages
+            context['page_range'] = context['paginator'].get_elided_page_range(
+                context['page_obj'].number, on_each_side=2, on_ends=1
+            )
+
         return context
 
+# Export View
+@method_decorator(login_required, name='dispatch')
+class DocumentExportView(DocumentListView):
+    """Stream the listed documents of one type as CSV or NDJSON.
+
+    Each document is one row, with one column per field of the type.
+    """
+
+    def get(self, request, *args, **kwargs):
+        document_type_id = request.GET.get('filter', '')
+        if not document_type_id.isdigit():
+            return HttpResponseBadRequest("Choose a document type to export.")
+        document_type = get_object_or_404(DocumentType, pk=document_type_id)
+        try:
+            return export_documents(
+                document_type, self.get_queryset(), request.GET.get('format', 'csv')
+            )
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
 # Detail View: View a single document
 @method_decorator(login_required, name='dispatch')
 class DocumentDetailView(DetailView):
@@ -172,24 +322,40 @@ class DocumentUpdateView(FormView):
     template_name = 'documents/document_form.html'
     success_url = reverse_lazy('document_list')
 
+    @cached_property
+    def document(self):
+        return get_object_or_404(
+            Document.objects.select_related('document_type'), pk=self.kwargs['pk']
+        )
+
+    def get_form_class(self):
+        return document_form_class(self.document.document_type)
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        document = Document.objects.get(pk=self.kwargs['pk'])
-        kwargs['document_type'] = document.document_type
+        document = self.document
 
         # Set initial values for title, patient, and document fields
         kwargs['initial'] = {'title': document.title, 'patient': document.patient}
 
-        # Populate initial values for the document fields
-        for field_value in document.field_values.all():
-            if field_value.field.field_type == 'drug':
-                try:
-                    # Set the initial value to the Drug instance if it's a drug field
-                    kwargs['initial'][field_value.field.snake_case_name] = Drug.objects.get(name=field_value.value)
-                except Drug.DoesNotExist:
-                    kwargs['initial'][field_value.field.snake_case_name] = None
+        # Populate initial values for the document fields, taking the
+        # fields from the compiled form rather than querying them
+        fields = {field.pk: field for field in self.get_form_class().document_fields}
+        stored = document.field_values.values_list('field_id', 'value')
+        values = [
+            (fields[field_id], value)
+            for field_id, value in stored
+            if field_id in fields
+        ]
+        # Drug fields get their Drug instance, all resolved in one query
+        drugs = drugs_by_name(
+            value for field, value in values if field.field_type == 'drug'
+        )
+        for field, value in values:
+            if field.field_type == 'drug':
+                kwargs['initial'][field.snake_case_name] = drugs.get(value)
             else:
-                kwargs['initial'][field_value.field.snake_case_name] = field_value.value
+                kwargs['initial'][field.snake_case_name] = value
 
         # Populate the initial value for the PDF file if it was uploaded
         if document.is_uploaded_pdf and document.pdf_file:
@@ -197,11 +363,8 @@ class DocumentUpdateView(FormView):
 
         return kwargs
 
-    def get_form(self):
-        return DocumentForm(**self.get_form_kwargs())
-
     def form_valid(self, form):
-        document = Document.objects.get(pk=self.kwargs['pk'])
+        document = self.document
         document.title = form.cleaned_data.get('title', 'Untitled Document')
         document.patient = form.cleaned_data.get('patient')  # Update the patient field
 
@@ -214,19 +377,10 @@ class DocumentUpdateView(FormView):
             document.pdf_file = None
             document.is_uploaded_pdf = False
 
-        document.save()
-
-        # Update field values
-        for field in document.document_type.fields.all():
-            value = form.cleaned_data.get(field.snake_case_name, '')
-
-            # Handle the case where the field is of type 'drug'
-            if field.field_type == 'drug' and isinstance(value, Drug):
-                value = value.name
-
-            DocumentFieldValue.objects.update_or_create(
-                document=document, field=field, defaults={'value': value}
-            )
+        # Save the document and all of its field values together
+        with transaction.atomic():
+            document.save()
+            save_field_values(document, form.document_fields, form.cleaned_data)
 
         return super().form_valid(form)
 
@@ -243,17 +397,15 @@ class DocumentCreateView(FormView):
     template_name = 'documents/document_form.html'
     success_url = reverse_lazy('document_list')
 
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        document_type = DocumentType.objects.get(pk=self.kwargs['document_type_pk'])
-        kwargs['document_type'] = document_type
-        return kwargs
+    @cached_property
+    def document_type(self):
+        return get_object_or_404(DocumentType, pk=self.kwargs['document_type_pk'])
 
-    def get_form(self):
-        return DocumentForm(**self.get_form_kwargs())
+    def get_form_class(self):
+        return document_form_class(self.document_type)
 
     def form_valid(self, form):
-        document_type = DocumentType.objects.get(pk=self.kwargs['document_type_pk'])
+        document_type = self.document_type
         owner = self.request.user  # Assuming the user is logged in
         title = form.cleaned_data.get('title', 'Untitled Document')
         patient = form.cleaned_data.get('patient')  # Get the patient from the form
@@ -291,18 +443,16 @@ class DocumentCreateView(FormView):
             # Log to confirm that no PDF was uploaded
             print("No PDF uploaded, creating document to generate PDF later.")
 
-            # Create a document without an uploaded PDF
-            document = Document.objects.create(
-                document_type=document_type,
-                owner=owner,
-                title=title,
-                patient=patient
-            )
-
-            # Create document field values based on the form data
-            for field in document_type.fields.all():
-                value = form.cleaned_data.get(field.snake_case_name)
-                DocumentFieldValue.objects.create(document=document, field=field, value=value or '')
+            # Create a document without an uploaded PDF, with its field
+            # values from the form data
+            with transaction.atomic():
+                document = Document.objects.create(
+                    document_type=document_type,
+                    owner=owner,
+                    title=title,
+                    patient=patient
+                )
+                save_field_values(document, form.document_fields, form.cleaned_data)
 
         # Log to ensure document was saved with the correct values
         print(f"Final Document State -> ID: {document.id}, is_uploaded_pdf: {document.is_uploaded_pdf}")
@@ -0,0 +1,77 @@
+from collections import defaultdict
+
+from .models import TreatmentRecord
+
+
+def treated_patient_ids(user):
+    """Subquery of the ids of the patients ``user`` treats.
+
+    Filter with ``patient_id__in=treated_patient_ids(user)`` rather than
+    joining ``treated_by``: the semi-join never repeats rows, and the
+    database can start from the user's own records through the
+    ``(worker, patient)`` index, so the cost follows what the user can
+    see rather than the size of the table.
+    """
+    return TreatmentRecord.objects.filter(worker=user).values('patient_id')
+
+
+def load_worker_summaries(patient_ids):
+    """Return ``{patient_id: [worker, ...]}`` for the given patients.
+
+    Workers and their roles are resolved with a single ``TreatmentRecord``
+    query, so the cost does not grow with the number of patients on a page.
+    """
+    records = (
+        TreatmentRecord.objects.filter(patient_id__in=patient_ids, worker__isnull=False)
+        .select_related('worker__role')
+        .order_by('pk')
+    )
+
+    workers_by_patient = defaultdict(list)
+    for record in records:
+        worker = record.worker
+        workers_by_patient[record.patient_id].append({
+            'id': worker.pk,
+            'name': worker.name,
+            'role': worker.role.name if worker.role else None,
+        })
+    return workers_by_patient
+
+
+def apply_user_flags(rows, user):
+    """Overlay the per-user assignment flags on a list of board rows.
+
+    ``rows`` are the user-agnostic dicts stored in the board snapshot; a
+    shallow copy of each row is returned with ``is_assigned_to_user``,
+    ``can_assign``, ``can_unassign`` and per-worker ``is_user`` filled in.
+    """
+    user_role = user.role.name if getattr(user, 'role', None) else None
+
+    flagged = []
+    for row in rows:
+        assigned_workers = [
+            dict(worker, is_user=worker['id'] == user.pk) for worker in row['workers']
+        ]
+        is_assigned_to_user = any(worker['is_user'] for worker in assigned_workers)
+
+        # Determine if the user can assign or unassign
+        can_assign = (
+            (
+                user_role == 'doctor'
+                and not row['doctor_assigned']
+                and row['nurse_count'] > 0
+            ) or (
+                user_role == 'nurse'
+                and row['nurse_count'] < 3
+                and not is_assigned_to_user
+            )
+        )
+
+        flagged.append(dict(
+            row,
+            assigned_workers=assigned_workers,
+            is_assigned_to_user=is_assigned_to_user,
+            can_assign=can_assign,
+            can_unassign=is_assigned_to_user,
+        ))
+    return flagged
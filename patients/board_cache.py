@@ -0,0 +1,89 @@
+from django.core.cache import cache
+
+from .assignments import load_worker_summaries
+from .models import Geocode
+
+BOARD_CACHE_TIMEOUT = 60 * 60
+
+
+def _snapshot_key(geocode_id):
+    return f'icare_board:{geocode_id}:snapshot'
+
+
+def _version_key(geocode_id):
+    return f'icare_board:{geocode_id}:version'
+
+
+def get_board_version(geocode_id):
+    return cache.get_or_set(_version_key(geocode_id), 1, timeout=None)
+
+
+def invalidate_board(geocode_id):
+    """Drop the cached snapshot for a geocode and bump its version.
+
+    Bumping the version stops a rebuild that raced with this invalidation
+    from storing a snapshot that is already stale.
+    """
+    if geocode_id is None:
+        return
+    try:
+        cache.incr(_version_key(geocode_id))
+    except ValueError:
+        cache.add(_version_key(geocode_id), 1, timeout=None)
+    cache.delete(_snapshot_key(geocode_id))
+
+
+def invalidate_all_boards():
+    for geocode_id in Geocode.objects.values_list('id', flat=True):
+        invalidate_board(geocode_id)
+
+
+def build_board_snapshot(geocode):
+    """Build the user-agnostic board for a geocode.
+
+    Rows carry only what the board renders plus the assigned workers, so the
+    per-user ``can_assign``/``can_unassign`` flags can be overlaid at render
+    time with :func:`patients.assignments.apply_user_flags`.
+    """
+    rows = list(
+        geocode.patients.order_by('name').values(
+            'id', 'name', 'treatment_area', 'bed_id', 'date_of_birth',
+            'state', 'nurse_count', 'doctor_assigned',
+        )
+    )
+    workers_by_patient = load_worker_summaries([row['id'] for row in rows])
+    for row in rows:
+        row['workers'] = workers_by_patient.get(row['id'], [])
+
+    return {
+        'geocode': {
+            'id': geocode.id, 'name': geocode.name, 'description': geocode.description,
+        },
+        'other_geocodes': list(
+            Geocode.objects.exclude(id=geocode.id).values('id', 'name')
+        ),
+        'rows': rows,
+    }
+
+
+def get_board_snapshot(geocode_id, geocode=None):
+    """Return the cached snapshot for ``geocode_id``, rebuilding it on a miss.
+
+    A hit costs a single cache read. ``geocode`` may be passed when the caller
+    already has the instance; otherwise it is looked up on a miss only.
+    Raises ``Geocode.DoesNotExist`` for an unknown geocode.
+    """
+    snapshot = cache.get(_snapshot_key(geocode_id))
+    if snapshot is not None:
+        return snapshot
+
+    version = get_board_version(geocode_id)
+    if geocode is None:
+        geocode = Geocode.objects.get(id=geocode_id)
+    snapshot = build_board_snapshot(geocode)
+    snapshot['version'] = version
+
+    # Only store the snapshot if nothing invalidated the board meanwhile
+    if get_board_version(geocode_id) == version:
+        cache.set(_snapshot_key(geocode_id), snapshot, BOARD_CACHE_TIMEOUT)
+    return snapshot
@@ -0,0 +1,53 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Fields of a board row that clients patch in place
+DELTA_FIELDS = ('nurse_count', 'doctor_assigned', 'state', 'workers')
+
+
+def row_delta(row):
+    """Compact assignment payload for one board row."""
+    delta = {'patient_id': row['id']}
+    delta.update((field, row[field]) for field in DELTA_FIELDS)
+    return delta
+
+
+def board_deltas(previous_rows, rows):
+    """Yield ``(event, payload)`` pairs describing how a board changed.
+
+    ``previous_rows`` is ``None`` when the client's state is unknown, in which
+    case every row is sent. Patients that left the board produce a
+    ``removed`` event; new or changed rows produce an ``assignment`` event.
+    """
+    previous = {row['id']: row for row in previous_rows or []}
+    current_ids = set()
+
+    for row in rows:
+        current_ids.add(row['id'])
+        old = previous.get(row['id'])
+        if (
+            previous_rows is None
+            or old is None
+            or any(old[field] != row[field] for field in DELTA_FIELDS)
+        ):
+            yield 'assignment', row_delta(row)
+
+    for patient_id in previous.keys() - current_ids:
+        yield 'removed', {'patient_id': patient_id}
+
+
+def format_sse(data=None, event=None, event_id=None, retry=None, comment=None):
+    """Encode a single server-sent event."""
+    lines = []
+    if comment is not None:
+        lines.append(f': {comment}')
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    if data is not None:
+        lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
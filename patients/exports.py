@@ -0,0 +1,95 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Columns written by patient list exports, in order
+EXPORT_FIELDS = (
+    'id',
+    'name',
+    'date_of_birth',
+    'blood_group',
+    'bed_id',
+    'treatment_area',
+    'geocode_name',
+    'state',
+    'nurse_count',
+    'doctor_assigned',
+)
+
+# Rows fetched per database round trip / joined into one response chunk
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
+
+
+def _chunked(lines, size):
+    # Join lines into larger chunks so the server is not flushing per row
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_export_response(
+    fields, rows, export_format, filename, chunk_size=EXPORT_CHUNK_SIZE
+):
+    """Stream an iterable of row tuples as a CSV or NDJSON attachment.
+
+    Raises ``ValueError`` for an unknown ``export_format``.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{export_format}'.")
+    content_type, write_lines = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        _chunked(write_lines(fields, rows), chunk_size),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{export_format}"'
+    )
+    return response
+
+
+def stream_export(
+    queryset, export_format, filename,
+    fields=EXPORT_FIELDS, chunk_size=EXPORT_CHUNK_SIZE,
+):
+    """Stream ``queryset`` as CSV or NDJSON without materializing it.
+
+    Rows come from ``values_list().iterator()`` so only one chunk of tuples
+    is held at a time (a server-side cursor on PostgreSQL); raises
+    ``ValueError`` for an unknown ``export_format``.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{export_format}'.")
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    return streaming_export_response(fields, rows, export_format, filename, chunk_size)
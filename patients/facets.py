@@ -0,0 +1,120 @@
+import hashlib
+import uuid
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+
+from .models import Patient
+from .search import search_index_version
+
+FACET_CACHE_TIMEOUT = 60
+
+# Replaced by writes that change facet columns without Patient.save(), such
+# as the conditional assignment updates in patients.services
+FACET_VERSION_KEY = 'patient_facets:version'
+
+# Facet name -> (value column, label column)
+FACETS = {
+    'state': ('state', 'state'),
+    'treatment_area': ('treatment_area', 'treatment_area'),
+    'blood_group': ('blood_group', 'blood_group'),
+    'geocode': ('geocode_id', 'geocode_name'),
+}
+
+_COLUMNS = ('state', 'treatment_area', 'blood_group', 'geocode_id', 'geocode_name')
+
+
+def _grouping_sets_counts(queryset):
+    """Count every facet in one ``GROUP BY GROUPING SETS`` query (PostgreSQL)."""
+    inner_sql, params = queryset.order_by().values(*_COLUMNS).query.sql_with_params()
+    grouping_sets = ', '.join(
+        f'({value})' if value == label else f'({value}, {label})'
+        for value, label in FACETS.values()
+    )
+    sql = (
+        f'SELECT {", ".join(_COLUMNS)}, '
+        f'{", ".join(f"GROUPING({value})" for value, _ in FACETS.values())}, COUNT(*) '
+        f'FROM ({inner_sql}) AS facet_source GROUP BY GROUPING SETS ({grouping_sets})'
+    )
+    counts = {name: Counter() for name in FACETS}
+    labels = {}
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            values = dict(zip(_COLUMNS, row))
+            grouped = row[len(_COLUMNS):-1]
+            # GROUPING(col) is 0 for the column the row was grouped by
+            for (name, (value, label)), not_grouped in zip(FACETS.items(), grouped):
+                if not not_grouped:
+                    counts[name][values[value]] += row[-1]
+                    labels[name, values[value]] = values[label]
+    return counts, labels
+
+
+def _combination_counts(queryset):
+    """Count every facet from one ``GROUP BY`` over all facet columns."""
+    counts = {name: Counter() for name in FACETS}
+    labels = {}
+    for row in queryset.order_by().values(*_COLUMNS).annotate(total=Count('pk')):
+        for name, (value, label) in FACETS.items():
+            counts[name][row[value]] += row['total']
+            labels[name, row[value]] = row[label]
+    return counts, labels
+
+
+def compute_patient_facets(queryset):
+    """Return ``{facet: [{'value', 'label', 'count'}, ...]}`` for ``queryset``.
+
+    Counts honor whatever search and filters ``queryset`` already carries and
+    are produced by a single aggregate query.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        counts, labels = _grouping_sets_counts(queryset)
+    else:
+        counts, labels = _combination_counts(queryset)
+
+    state_labels = dict(Patient.STATE_CHOICES)
+    facets = {}
+    for name, counter in counts.items():
+        entries = []
+        for value, count in counter.most_common():
+            if value in (None, ''):
+                continue
+            label = labels[name, value]
+            if name == 'state':
+                label = state_labels.get(value, value)
+            entries.append({'value': str(value), 'label': label, 'count': count})
+        facets[name] = entries
+    return facets
+
+
+def get_patient_facets(queryset, filters):
+    """Cached :func:`compute_patient_facets`, keyed by the active filter set.
+
+    The key also carries the patient search version token, which every
+    patient save/delete replaces, and the facet version, which
+    :func:`bump_patient_facets` replaces, so counts expire on writes as
+    well as after ``FACET_CACHE_TIMEOUT``.
+    """
+    facet_version = cache.get_or_set(FACET_VERSION_KEY, _new_version, timeout=None)
+    key_source = '&'.join(
+        f'{key}={value}' for key, value in sorted(filters.items()) if value
+    )
+    key_source = f'{search_index_version()}|{facet_version}|{key_source}'
+    key = 'patient_facets:' + hashlib.sha256(key_source.encode()).hexdigest()
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_patient_facets(queryset)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def bump_patient_facets():
+    """Expire every cached facet count."""
+    cache.set(FACET_VERSION_KEY, _new_version(), timeout=None)
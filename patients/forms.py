@@ -0,0 +1,17 @@
+from django import forms
+
+from .imports import IMPORT_FORMATS
+
+
+class PatientImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV with a header row, or NDJSON with one patient object per line."
+    )
+    format = forms.ChoiceField(
+        choices=[
+            ('', 'Detect from file name'),
+            *((name, name.upper()) for name in IMPORT_FORMATS),
+        ],
+        required=False,
+    )
+    dry_run = forms.BooleanField(required=False, label="Validate only")
@@ -0,0 +1,200 @@
+import csv
+import json
+from functools import partial
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .board_cache import invalidate_board
+from .models import Geocode, Patient
+from .search import bump_search_index
+
+# Columns accepted by patient imports; geocode is matched by Geocode name
+IMPORT_FIELDS = (
+    'name',
+    'address',
+    'date_of_birth',
+    'height',
+    'weight',
+    'blood_group',
+    'bed_id',
+    'treatment_area',
+    'geocode',
+)
+REQUIRED_FIELDS = tuple(field for field in IMPORT_FIELDS if field != 'geocode')
+
+# Columns that keep their model defaults or were resolved up front
+_UNCHECKED_FIELDS = [
+    field.name
+    for field in Patient._meta.concrete_fields
+    if field.name not in REQUIRED_FIELDS
+]
+
+IMPORT_BATCH_SIZE = 1000
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# How non-text NDJSON values are named in row errors
+_JSON_TYPE_NAMES = {
+    bool: 'true or false',
+    int: 'a number',
+    float: 'a number',
+    list: 'a list',
+    dict: 'an object',
+}
+
+
+def read_csv(stream):
+    """Yield ``(line, row)`` pairs from a CSV text stream with a header row.
+
+    Raises ``ValueError`` for a file the csv module cannot parse, such as an
+    oversized field, so callers report it like any other bad upload.
+    """
+    reader = csv.DictReader(stream)
+    try:
+        columns = reader.fieldnames or []
+        missing = [field for field in REQUIRED_FIELDS if field not in columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}.")
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as e:
+        raise ValueError(f"Malformed CSV at line {reader.line_num}: {e}.") from e
+
+
+def read_ndjson(stream):
+    """Yield ``(line, row)`` pairs from a newline-delimited JSON text stream."""
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        if not isinstance(row, dict):
+            # Handed to validation so the bad line lands in the error report
+            row = {'__all__': "Line is not a JSON object."}
+        yield line, row
+
+
+def read_rows(stream, import_format):
+    if import_format == 'csv':
+        return read_csv(stream)
+    if import_format == 'ndjson':
+        return read_ndjson(stream)
+    raise ValueError(f"Unsupported import format '{import_format}'.")
+
+
+def guess_format(filename):
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []  # [(line, {field: [messages]})]
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+
+def load_geocode_map():
+    """Map case-folded Geocode names to ``(id, name)`` with a single query."""
+    return {
+        name.casefold(): (pk, name)
+        for pk, name in Geocode.objects.values_list('pk', 'name')
+    }
+
+
+def build_patient(row, geocodes):
+    """Return an unsaved ``Patient`` for ``row`` or raise ``ValidationError``.
+
+    Values are converted and checked with the model's own field rules
+    (``clean_fields``). Uniqueness and the geocode foreign key are not
+    re-queried per row: the primary key is a fresh UUID and geocodes were
+    resolved from ``geocodes``.
+    """
+    if '__all__' in row:
+        raise ValidationError({'__all__': [row['__all__']]})
+
+    # NDJSON values may be any JSON type; the model fields expect text
+    wrong_types = {
+        field: [
+            f"Expected text, got "
+            f"{_JSON_TYPE_NAMES.get(type(row[field]), 'another value')}."
+        ]
+        for field in IMPORT_FIELDS
+        if row.get(field) is not None and not isinstance(row[field], str)
+    }
+    if wrong_types:
+        raise ValidationError(wrong_types)
+
+    values = {field: row.get(field) for field in REQUIRED_FIELDS}
+    for field, value in values.items():
+        if isinstance(value, str):
+            values[field] = value.strip()
+
+    geocode_id, geocode_name = None, ''
+    requested = (row.get('geocode') or '').strip()
+    if requested:
+        if requested.casefold() not in geocodes:
+            raise ValidationError({'geocode': [f"Unknown geocode '{requested}'."]})
+        geocode_id, geocode_name = geocodes[requested.casefold()]
+
+    patient = Patient(**values, geocode_id=geocode_id, geocode_name=geocode_name)
+    patient.clean_fields(exclude=_UNCHECKED_FIELDS)
+    return patient
+
+
+def _insert_batch(patients):
+    # bulk_create skips save() and the post_save signal, so board
+    # invalidation and the search index bump are done here instead
+    with transaction.atomic():
+        Patient.objects.bulk_create(patients)
+        geocode_ids = {patient.geocode_id for patient in patients if patient.geocode_id}
+        for geocode_id in geocode_ids:
+            transaction.on_commit(partial(invalidate_board, geocode_id))
+        transaction.on_commit(bump_search_index)
+
+
+def import_patients(rows, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """Validate and insert ``(line, row)`` pairs in batches of ``batch_size``.
+
+    Rows are consumed lazily, so only one batch is held in memory. Each batch
+    is inserted with ``bulk_create`` in its own transaction; invalid rows are
+    skipped and reported in the returned :class:`ImportResult`.
+
+    A ``ValueError`` from reading ``rows``, such as a malformed CSV line,
+    stops the import; its message says how many patients earlier batches
+    already inserted, since those stay in the database.
+    """
+    result = ImportResult()
+    geocodes = load_geocode_map()
+    batch = []
+
+    try:
+        for line, row in rows:
+            try:
+                batch.append(build_patient(row, geocodes))
+            except ValidationError as e:
+                result.errors.append((line, e.message_dict))
+                continue
+            if len(batch) >= batch_size:
+                if not dry_run:
+                    _insert_batch(batch)
+                result.created += len(batch)
+                batch = []
+    except ValueError as e:
+        if dry_run or not result.created:
+            raise
+        raise ValueError(
+            f"{e} {result.created} patients from the rows before it were already "
+            "imported; remove those rows before importing the file again."
+        ) from e
+
+    if batch:
+        if not dry_run:
+            _insert_batch(batch)
+        result.created += len(batch)
+    return result
@@ -0,0 +1,63 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.imports import (
+    IMPORT_BATCH_SIZE,
+    IMPORT_FORMATS,
+    guess_format,
+    import_patients,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import patients from a CSV or NDJSON file, validating each row and "
+        "inserting valid rows in batches. Geocodes are matched by name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument(
+            '--format', choices=IMPORT_FORMATS,
+            help="Defaults to the file extension, else csv.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help="Rows per bulk insert.",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', help="Validate without inserting."
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or guess_format(path)
+
+        try:
+            if path == '-':
+                result = self.run_import(sys.stdin, import_format, options)
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    result = self.run_import(stream, import_format, options)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, errors in result.errors:
+            messages = '; '.join(
+                f"{field}: {' '.join(msgs)}" for field, msgs in errors.items()
+            )
+            self.stderr.write(f"Line {line}: {messages}")
+
+        action = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {result.created} patients; skipped {result.failed} invalid rows."
+        ))
+
+    def run_import(self, stream, import_format, options):
+        return import_patients(
+            read_rows(stream, import_format),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
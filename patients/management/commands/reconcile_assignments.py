@@ -0,0 +1,137 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from patients.board_cache import invalidate_board
+from patients.facets import bump_patient_facets
+from patients.models import Patient, TreatmentRecord
+
+RECONCILED_FIELDS = ['nurse_count', 'doctor_assigned', 'state']
+
+
+def expected_state(nurses, doctors):
+    if doctors:
+        return Patient.DOCTOR_ASSIGNED
+    if nurses:
+        return Patient.NURSE_ASSIGNED
+    return Patient.UNASSIGNED
+
+
+def expected_counters(nurses, doctors):
+    return {
+        'nurse_count': nurses,
+        'doctor_assigned': doctors > 0,
+        'state': expected_state(nurses, doctors),
+    }
+
+
+def fix_patients(pks):
+    """Rewrite the counters of patients ``pks`` from TreatmentRecord.
+
+    The patients are locked with ``SELECT ... FOR UPDATE`` before their
+    records are counted, so an assignment running meanwhile either finishes
+    first and is counted, or waits and applies its relative update to the
+    fixed row. Returns the geocode ids of the patients that were changed.
+    """
+    with transaction.atomic():
+        locked = Patient.objects.select_for_update().filter(pk__in=pks)
+        rows = {
+            row['pk']: row
+            for row in locked.values('pk', 'geocode_id', *RECONCILED_FIELDS)
+        }
+        records = TreatmentRecord.objects.filter(patient_id__in=rows)
+        counts = records.values('patient_id').annotate(
+            nurses=Count('pk', filter=Q(worker__role__name='nurse')),
+            doctors=Count('pk', filter=Q(worker__role__name='doctor')),
+        )
+        counts = {
+            count['patient_id']: (count['nurses'], count['doctors']) for count in counts
+        }
+
+        fixes = []
+        for pk, row in rows.items():
+            expected = expected_counters(*counts.get(pk, (0, 0)))
+            if any(row[field] != expected[field] for field in RECONCILED_FIELDS):
+                fixes.append((row['geocode_id'], Patient(pk=pk, **expected)))
+        Patient.objects.bulk_update(
+            [patient for _, patient in fixes], RECONCILED_FIELDS
+        )
+    return {geocode_id for geocode_id, _ in fixes}
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute nurse_count, doctor_assigned and state for every patient from "
+        "TreatmentRecord and report (or fix with --fix) any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true', help="Write the recomputed values back."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000, help="Patients per aggregate query."
+        )
+
+    def iter_batches(self, batch_size):
+        """Yield patient rows with their expected counters, one query per batch.
+
+        Batches seek on the primary key rather than using OFFSET, so memory and
+        per-batch cost stay flat however large the table is.
+        """
+        queryset = Patient.objects.order_by('pk').values(
+            'pk', 'geocode_id', *RECONCILED_FIELDS
+        ).annotate(
+            expected_nurses=Count(
+                'treatmentrecord',
+                filter=Q(treatmentrecord__worker__role__name='nurse'),
+            ),
+            expected_doctors=Count(
+                'treatmentrecord',
+                filter=Q(treatmentrecord__worker__role__name='doctor'),
+            ),
+        )
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(batch[:batch_size])
+            if not rows:
+                return
+            yield rows
+            last_pk = rows[-1]['pk']
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+
+        for rows in self.iter_batches(options['batch_size']):
+            fixes = []
+            for row in rows:
+                expected = expected_counters(
+                    row['expected_nurses'], row['expected_doctors']
+                )
+                if all(row[field] == expected[field] for field in RECONCILED_FIELDS):
+                    continue
+
+                fixes.append(row['pk'])
+                if options['verbosity'] >= 2:
+                    changes = ', '.join(
+                        f"{field} {row[field]!r} -> {expected[field]!r}"
+                        for field in RECONCILED_FIELDS if row[field] != expected[field]
+                    )
+                    self.stdout.write(f"Patient {row['pk']}: {changes}")
+
+            checked += len(rows)
+            drifted += len(fixes)
+
+            if options['fix'] and fixes:
+                # Rows found here were read without a lock; they are read
+                # again under one before anything is written
+                for geocode_id in fix_patients(fixes):
+                    invalidate_board(geocode_id)
+                bump_patient_facets()
+
+        action = "fixed" if options['fix'] else "found"
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} patients; {action} {drifted} "
+            "with drifted assignment counters."
+        ))
@@ -0,0 +1,52 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+TRIGRAM_COLUMNS = ['name', 'bed_id', 'treatment_area', 'geocode_name']
+
+
+def backfill_geocode_name(apps, schema_editor):
+    Patient = apps.get_model('patients', 'Patient')
+    Geocode = apps.get_model('patients', 'Geocode')
+    Patient.objects.filter(geocode__isnull=False).update(
+        geocode_name=Subquery(Geocode.objects.filter(pk=OuterRef('geocode_id')).values('name')[:1])
+    )
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # GIN trigram indexes only exist on PostgreSQL; other databases fall back
+    # to the in-process n-gram index in patients.search
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS patients_patient_{column}_trgm '
+            f'ON patients_patient USING gin (UPPER("{column}") gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS patients_patient_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0019_sample_data_creation'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='patient',
+            name='geocode_name',
+            field=models.CharField(
+                blank=True, default='', editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(backfill_geocode_name, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
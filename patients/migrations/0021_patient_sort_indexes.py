@@ -0,0 +1,49 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0020_patient_geocode_name_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['name', 'id'], name='patient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['bed_id', 'id'], name='patient_bed_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(
+                fields=['treatment_area', 'id'], name='patient_treatment_area_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(
+                fields=['date_of_birth', 'id'], name='patient_date_of_birth_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['state', 'name'], name='patient_state_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(
+                fields=['geocode_name', 'name'], name='patient_geocode_name_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['geocode', 'name'], name='patient_geocode_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-18 02:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0021_patient_sort_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='treatmentrecord',
+            index=models.Index(
+                fields=['worker', 'patient'], name='treatmentrecord_worker_idx'
+            ),
+        ),
+    ]
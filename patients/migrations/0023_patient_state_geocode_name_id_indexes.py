@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0022_treatmentrecord_worker_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='patient',
+            name='patient_state_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='patient',
+            name='patient_geocode_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(
+                fields=['state', 'name', 'id'], name='patient_state_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(
+                fields=['geocode_name', 'name', 'id'], name='patient_geocode_name_idx'
+            ),
+        ),
+    ]
@@ -23,78 +23,65 @@ class Patient(models.Model):
     bed_id = models.CharField(max_length=50)  # Bed ID assigned to the patient
     treatment_area = models.CharField(max_length=100)  # Treatment unit or department
     geocode = models.ForeignKey('Geocode', on_delete=models.SET_NULL, null=True, blank=True, related_name='patients')
+    # Denormalized Geocode.name for search
+    geocode_name = models.CharField(
+        max_length=255, blank=True, default='', editable=False
+    )
 
 
     treated_by = models.ManyToManyField("accounts.CustomUser", through='TreatmentRecord', related_name='patients')
     state = models.CharField(max_length=15, choices=STATE_CHOICES, default=UNASSIGNED)
     nurse_count = models.PositiveIntegerField(default=0)
     doctor_assigned = models.BooleanField(default=False)
-    def __str__(self):
-        return f"{self.name}"
 
-    def assign_nurse(self, nurse_user):
-        if nurse_user.role.name != 'nurse':
-            raise ValueError("User must have role 'nurse' to be assigned as a nurse.")
+    class Meta:
+        # One index per supported sort in patients.sorting.PATIENT_SORTS, on
+        # the same columns, which also serves the seek of cursor pagination,
+        # plus (geocode, name) for the per-geocode iCARE board
+        indexes = [
+            models.Index(fields=['name', 'id'], name='patient_name_idx'),
+            models.Index(fields=['bed_id', 'id'], name='patient_bed_id_idx'),
+            models.Index(
+                fields=['treatment_area', 'id'], name='patient_treatment_area_idx'
+            ),
+            models.Index(
+                fields=['date_of_birth', 'id'], name='patient_date_of_birth_idx'
+            ),
+            models.Index(fields=['state', 'name', 'id'], name='patient_state_idx'),
+            models.Index(
+                fields=['geocode_name', 'name', 'id'], name='patient_geocode_name_idx'
+            ),
+            models.Index(fields=['geocode', 'name'], name='patient_geocode_idx'),
+        ]
 
-        if self.nurse_count >= 3:
-            raise ValueError("A patient can have no more than 3 nurses assigned.")
+    def __str__(self):
+        return f"{self.name}"
 
-        if TreatmentRecord.objects.filter(patient=self, worker=nurse_user).exists():
-            raise ValueError(f"{nurse_user.name} is already assigned as a nurse to this patient.")
+    def save(self, *args, **kwargs):
+        self.geocode_name = self.geocode.name if self.geocode_id else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'geocode' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'geocode_name'}
+        super().save(*args, **kwargs)
 
-        # Create the TreatmentRecord for the nurse
-        TreatmentRecord.objects.create(patient=self, worker=nurse_user)
-        self.nurse_count += 1
-        self.state = self.DOCTOR_ASSIGNED if self.doctor_assigned else self.NURSE_ASSIGNED
-        self.save()
+    # Assignment changes go through patients.services, which keeps
+    # nurse_count/doctor_assigned/state consistent with TreatmentRecord using
+    # conditional UPDATEs instead of read-check-save.
+    def assign_nurse(self, nurse_user):
+        from .services import assign_nurse
+        assign_nurse(self, nurse_user)
 
     def assign_doctor(self, doctor_user):
-        if doctor_user.role.name != 'doctor':
-            raise ValueError("User must have role 'doctor' to be assigned as a doctor.")
-
-        if TreatmentRecord.objects.filter(patient=self, worker=doctor_user).exists():
-            raise ValueError(f"{doctor_user.name} is already assigned as a doctor to this patient.")
-
-        if self.doctor_assigned:
-            raise ValueError("A patient can have only one doctor assigned.")
-
-        if self.nurse_count == 0:
-            raise ValueError("A doctor cannot be assigned unless at least one nurse is assigned.")
-
-        # Create the TreatmentRecord for the doctor
-        TreatmentRecord.objects.create(patient=self, worker=doctor_user)
-        self.doctor_assigned = True
-        self.state = self.DOCTOR_ASSIGNED
-        self.save()
+        from .services import assign_doctor
+        assign_doctor(self, doctor_user)
 
     def unassign_nurse(self, nurse_user):
-        if nurse_user.role.name != 'nurse':
-            raise ValueError("User must have role 'nurse' to be unassigned as a nurse.")
-
-        try:
-            record = TreatmentRecord.objects.get(patient=self, worker=nurse_user)
-            record.delete()
-            self.nurse_count -= 1
-            if self.nurse_count == 0:
-                self.state = self.UNASSIGNED if not self.doctor_assigned else self.DOCTOR_ASSIGNED
-            self.save()
-        except TreatmentRecord.DoesNotExist:
-            raise ValueError("This nurse is not assigned to the patient.")
+        from .services import unassign_nurse
+        unassign_nurse(self, nurse_user)
 
     def unassign_doctor(self, doctor_user):
-        if doctor_user.role.name != 'doctor':
-            raise ValueError("User must have role 'doctor' to be unassigned as a doctor.")
-
-        try:
-            record = TreatmentRecord.objects.get(patient=self, worker=doctor_user)
-            record.delete()
-            self.doctor_assigned = False
-            self.state = self.NURSE_ASSIGNED if self.nurse_count > 0 else self.UNASSIGNED
-            self.save()
-        except TreatmentRecord.DoesNotExist:
-            raise ValueError("This doctor is not assigned to the patient.")
-
-
+        from .services import unassign_doctor
+        unassign_doctor(self, doctor_user)
 
 
 class TreatmentRecord(models.Model):
@@ -103,6 +90,12 @@ class TreatmentRecord(models.Model):
 
     class Meta:
         unique_together = ('patient', 'worker')  # Ensure each worker is only assigned once per patient
+        indexes = [
+            # Lists scoped to the current user read their patient ids from here
+            models.Index(
+                fields=['worker', 'patient'], name='treatmentrecord_worker_idx'
+            ),
+        ]
 
 class Geocode(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
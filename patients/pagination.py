@@ -0,0 +1,280 @@
+import base64
+import binascii
+import datetime
+import json
+import uuid
+
+from django.db.models import F, Q, QuerySet, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
+
+# Hard ceiling on HTML page sizes; larger pulls go through the exports
+MAX_PAGE_SIZE = 100
+
+
+def clamp_page_size(value, default):
+    """Parse a requested page size, falling back to ``default`` and capping it."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    if size < 1:
+        return default
+    return min(size, MAX_PAGE_SIZE)
+
+
+def _cursor_value(value):
+    """Normalize a sort value to the JSON-safe form stored in cursors."""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def encode_cursor(value, pk, direction):
+    # value is a list when the sort has several columns
+    if isinstance(value, (list, tuple)):
+        value = [_cursor_value(item) for item in value]
+    else:
+        value = _cursor_value(value)
+    payload = json.dumps([direction, value, str(pk)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, value, pk)`` for an opaque cursor, or raise 404."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, value, pk = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise Http404("Invalid cursor.")
+    if direction not in ('next', 'prev'):
+        raise Http404("Invalid cursor.")
+    return direction, value, pk
+
+
+def _keyset_expression(model, path):
+    # Nullable paths (including through nullable relations) are coalesced so
+    # NULLs still compare and the seek predicate never skips them
+    opts = model._meta
+    nullable = False
+    for part in path.split('__'):
+        field = opts.get_field(part)
+        nullable = nullable or field.null
+        if field.is_relation:
+            opts = field.related_model._meta
+    return Coalesce(F(path), Value('')) if nullable else F(path)
+
+
+class KeysetPage:
+    """A page of results addressed by cursors instead of page numbers.
+
+    Exposes ``has_next``/``has_previous`` like Django's ``Page`` but carries
+    ``next_cursor``/``previous_cursor`` and never knows the total count.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _build_page(rows, page_size, cursor, backwards, value_of, pk_of):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(value_of(rows[-1]), pk_of(rows[-1]), 'next')
+        if cursor is not None and (has_more or not backwards):
+            previous_cursor = encode_cursor(value_of(rows[0]), pk_of(rows[0]), 'prev')
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def _sort_paths(path):
+    return (path,) if isinstance(path, str) else tuple(path)
+
+
+def _cursor_values(cursor, paths):
+    # A cursor holds one value per sort column, as a list when there are several
+    value = cursor[1]
+    if len(paths) == 1:
+        return [value]
+    if not isinstance(value, list) or len(value) != len(paths):
+        raise Http404("Invalid cursor.")
+    return value
+
+
+def _seek(names, values, pk, descending):
+    # key >= v AND (key > v OR <the same on the next column>), ending in pk
+    if not names:
+        return Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+    name, value = names[0], values[0]
+    inclusive, strict = ('lte', 'lt') if descending else ('gte', 'gt')
+    return Q(**{f'{name}__{inclusive}': value}) & (
+        Q(**{f'{name}__{strict}': value}) | _seek(names[1:], values[1:], pk, descending)
+    )
+
+
+def keyset_paginate_queryset(queryset, path, descending, cursor, page_size):
+    """Seek to the page after/before ``cursor`` ordered by ``path`` then pk.
+
+    ``path`` is one model path or a tuple of them. For a single column the
+    predicate is written as ``key >= v AND (key > v OR pk > id)`` so a
+    composite index on ``(key, pk)`` can serve it as a range scan, and
+    likewise for more columns; deep pages cost the same as the first one
+    and no ``COUNT(*)`` is issued.
+    """
+    paths = _sort_paths(path)
+    names = [f'keyset_value_{i}' for i in range(len(paths))]
+    backwards = cursor is not None and cursor[0] == 'prev'
+    seek_descending = descending != backwards
+    queryset = queryset.annotate(**{
+        name: _keyset_expression(queryset.model, path)
+        for name, path in zip(names, paths)
+    })
+
+    if cursor is not None:
+        values = _cursor_values(cursor, paths)
+        queryset = queryset.filter(_seek(names, values, cursor[2], seek_descending))
+
+    ordering = [*names, 'pk']
+    if seek_descending:
+        ordering = [f'-{name}' for name in ordering]
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+
+    def value_of(obj):
+        values = [getattr(obj, name) for name in names]
+        return values if len(values) > 1 else values[0]
+
+    return _build_page(
+        rows, page_size, cursor, backwards,
+        value_of=value_of,
+        pk_of=lambda obj: obj.pk,
+    )
+
+
+def keyset_paginate_list(rows, path, descending, cursor, page_size, pk_field='id'):
+    """Keyset pagination over an in-memory list of dicts or objects."""
+    def get(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    paths = _sort_paths(path)
+
+    def key(row):
+        values = (_cursor_value(get(row, path)) for path in paths)
+        return (*values, str(get(row, pk_field)))
+
+    def value_of(row):
+        values = [get(row, path) for path in paths]
+        return values if len(values) > 1 else values[0]
+
+    backwards = cursor is not None and cursor[0] == 'prev'
+    seek_descending = descending != backwards
+    rows = sorted(rows, key=key, reverse=seek_descending)
+
+    if cursor is not None:
+        position = (*_cursor_values(cursor, paths), cursor[2])
+        if seek_descending:
+            rows = [row for row in rows if key(row) < position]
+        else:
+            rows = [row for row in rows if key(row) > position]
+
+    return _build_page(
+        rows[:page_size + 1], page_size, cursor, backwards,
+        value_of=value_of,
+        pk_of=lambda row: get(row, pk_field),
+    )
+
+
+class KeysetPaginationMixin:
+    """Opt-in cursor pagination for ``ListView`` subclasses.
+
+    Enabled per request with ``?pagination=cursor`` (or any ``cursor``
+    parameter). ``keyset_sort_fields`` maps the view's ``sort`` values to
+    a model path, or a tuple of paths sorted in turn; a leading ``-`` sorts
+    descending. Offset pagination stays the default, and is also used for
+    searches without a ``sort``: those are ordered by search rank, which is
+    not a column a cursor can seek.
+    """
+
+    keyset_sort_fields = {'name': 'name'}
+    keyset_default_sort = 'name'
+    keyset_sort_param = 'sort'
+    keyset_search_param = 'search'
+    cursor_query_param = 'cursor'
+
+    def is_ranked_search(self):
+        return bool(
+            self.request.GET.get(self.keyset_search_param)
+            and not self.request.GET.get(self.keyset_sort_param)
+        )
+
+    def keyset_enabled(self):
+        if self.is_ranked_search():
+            return False
+        return (
+            self.request.GET.get('pagination') == 'cursor'
+            or self.cursor_query_param in self.request.GET
+        )
+
+    def get_keyset_ordering(self):
+        sort = self.request.GET.get(self.keyset_sort_param) or self.keyset_default_sort
+        descending = sort.startswith('-')
+        path = self.keyset_sort_fields.get(sort.lstrip('-'))
+        if path is None:
+            path, descending = self.keyset_sort_fields[self.keyset_default_sort], False
+        return path, descending
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.keyset_enabled():
+            return super().paginate_queryset(queryset, page_size)
+
+        path, descending = self.get_keyset_ordering()
+        cursor = self.request.GET.get(self.cursor_query_param)
+        cursor = decode_cursor(cursor) if cursor else None
+        if isinstance(queryset, QuerySet):
+            page = keyset_paginate_queryset(
+                queryset, path, descending, cursor, page_size
+            )
+        else:
+            page = keyset_paginate_list(queryset, path, descending, cursor, page_size)
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['keyset'] = self.keyset_enabled()
+        if context['keyset']:
+            query = self.request.GET.copy()
+            query.pop(self.cursor_query_param, None)
+            query.pop(self.page_kwarg, None)
+            query['pagination'] = 'cursor'
+            context['keyset_query'] = query.urlencode()
+        return context
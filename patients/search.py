@@ -0,0 +1,179 @@
+import re
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Patient
+
+# Columns searched by the patient search boxes; geocode_name is the
+# denormalized Geocode.name so no join is needed.
+SEARCH_FIELDS = ('name', 'bed_id', 'treatment_area', 'geocode_name')
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """Return the pg_trgm-style trigram set of ``text``.
+
+    Words are lowercased and padded with two leading spaces and one trailing
+    space, as PostgreSQL's ``pg_trgm`` does, so in-process similarity scores
+    rank results the same way as the database backend.
+    """
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(query_grams, text):
+    text_grams = trigrams(text)
+    if not query_grams or not text_grams:
+        return 0.0
+    return len(query_grams & text_grams) / len(query_grams | text_grams)
+
+
+def search_rows(rows, query, fields=SEARCH_FIELDS):
+    """Filter and rank in-memory rows (dicts) with the backend's rules.
+
+    A row matches when any field contains ``query`` case-insensitively; rows
+    are ordered by their best trigram similarity across ``fields``. Used for
+    cached board rows so they search exactly like the database.
+    """
+    needle = query.casefold()
+    query_grams = trigrams(query)
+    ranked = []
+    for row in rows:
+        values = [str(row[field]) for field in fields if row.get(field)]
+        if any(needle in value.casefold() for value in values):
+            rank = max(similarity(query_grams, value) for value in values)
+            ranked.append((-rank, row))
+    ranked.sort(key=lambda item: item[0])
+    return [row for _, row in ranked]
+
+
+def _contains_filter(query, fields):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return condition
+
+
+class PostgresTrigramBackend:
+    """Search backed by ``pg_trgm`` GIN indexes on ``UPPER(column)``.
+
+    Django compiles ``icontains`` to ``UPPER(col) LIKE UPPER(%q%)`` on
+    PostgreSQL, which the trigram indexes from migration 0020 serve without
+    a sequential scan; results are ranked by trigram word similarity.
+    """
+
+    def search(self, queryset, query, fields=SEARCH_FIELDS):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        scores = [TrigramWordSimilarity(query, field) for field in fields]
+        return queryset.filter(_contains_filter(query, fields)).annotate(
+            search_rank=Greatest(*scores) if len(scores) > 1 else scores[0]
+        )
+
+
+class NgramIndexBackend:
+    """In-process trigram index used where ``pg_trgm`` is unavailable (SQLite).
+
+    The index maps each trigram to the patients containing it and is rebuilt
+    lazily whenever the shared ``patient_search:version`` token changes,
+    which happens on every patient save/delete. Tokens are random so a
+    cache eviction can never bring back a version an old index was built at.
+    """
+
+    version_key = 'patient_search:version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._documents = {}
+        self._postings = {}
+
+    def _ensure_index(self):
+        version = search_index_version()
+        with self._lock:
+            if version == self._version:
+                return
+            documents = {}
+            postings = {}
+            rows = Patient.objects.values('pk', *SEARCH_FIELDS)
+            for row in rows.iterator(chunk_size=2000):
+                pk = row.pop('pk')
+                documents[pk] = row
+                for value in row.values():
+                    for gram in trigrams(value or ''):
+                        postings.setdefault(gram, set()).add(pk)
+            self._documents, self._postings = documents, postings
+            self._version = version
+
+    def match(self, query, fields=SEARCH_FIELDS):
+        """Return ``{pk: rank}`` for patients whose fields contain ``query``."""
+        self._ensure_index()
+        needle = query.casefold()
+        query_grams = trigrams(query)
+
+        # Interior trigrams of the query must appear in any containing text;
+        # they narrow the candidates before the exact substring check
+        interior = {gram for gram in query_grams if ' ' not in gram}
+        if interior:
+            candidates = set.intersection(
+                *(self._postings.get(gram, set()) for gram in interior)
+            )
+        else:
+            candidates = self._documents.keys()
+
+        matches = {}
+        for pk in candidates:
+            document = self._documents[pk]
+            values = [document[field] for field in fields if document[field]]
+            if any(needle in value.casefold() for value in values):
+                matches[pk] = max(similarity(query_grams, value) for value in values)
+        return matches
+
+    def search(self, queryset, query, fields=SEARCH_FIELDS):
+        matches = self.match(query, fields)
+        rank = Case(
+            *(When(pk=pk, then=Value(score)) for pk, score in matches.items()),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=list(matches)).annotate(search_rank=rank)
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def search_index_version():
+    """Token identifying the current patient data; replaced on every patient write."""
+    return cache.get_or_set(NgramIndexBackend.version_key, _new_version, timeout=None)
+
+
+def bump_search_index():
+    cache.set(NgramIndexBackend.version_key, _new_version(), timeout=None)
+
+
+_postgres_backend = PostgresTrigramBackend()
+_ngram_backend = NgramIndexBackend()
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return _postgres_backend
+    return _ngram_backend
+
+
+def search_patients(queryset, query, fields=SEARCH_FIELDS):
+    """Filter ``queryset`` to patients matching ``query``.
+
+    Results are annotated with ``search_rank``.
+    """
+    return get_search_backend().search(queryset, query, fields)
@@ -0,0 +1,164 @@
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+
+from .board_cache import invalidate_board
+from .facets import bump_patient_facets
+from .models import Patient, TreatmentRecord
+
+MAX_NURSES = 3
+
+
+def _check_role(user, role, action):
+    if user.role is None or user.role.name != role:
+        raise ValueError(f"User must have role '{role}' to be {action} as a {role}.")
+
+
+def _invalidate_on_commit(patient):
+    # The conditional updates change state without Patient.save(), so the
+    # board and the state facet counts are expired here
+    transaction.on_commit(partial(invalidate_board, patient.geocode_id))
+    transaction.on_commit(bump_patient_facets)
+
+
+def _create_record(patient, worker, role):
+    # The unique_together constraint rejects duplicates; no pre-check needed
+    try:
+        TreatmentRecord.objects.create(patient=patient, worker=worker)
+    except IntegrityError:
+        raise ValueError(
+            f"{worker.name} is already assigned as a {role} to this patient."
+        )
+
+
+def _raise_assignment_error(patient, worker, role):
+    """Explain why a conditional assignment update matched no row.
+
+    Only runs on the failure path, so the extra reads do not count against
+    the two round trips of a successful assignment.
+    """
+    current = (
+        Patient.objects.filter(pk=patient.pk)
+        .values('nurse_count', 'doctor_assigned')
+        .first()
+    )
+    if current is None:
+        raise ValueError("This patient no longer exists.")
+    if TreatmentRecord.objects.filter(patient=patient, worker=worker).exists():
+        raise ValueError(
+            f"{worker.name} is already assigned as a {role} to this patient."
+        )
+    if role == 'nurse':
+        raise ValueError(
+            f"A patient can have no more than {MAX_NURSES} nurses assigned."
+        )
+    if current['doctor_assigned']:
+        raise ValueError("A patient can have only one doctor assigned.")
+    raise ValueError(
+        "A doctor cannot be assigned unless at least one nurse is assigned."
+    )
+
+
+def assign_nurse(patient, nurse_user):
+    """Assign a nurse with a conditional ``UPDATE`` and a single insert.
+
+    The cap check and counter increment happen in one
+    ``UPDATE ... WHERE nurse_count < 3`` statement, which also row-locks the
+    patient, so concurrent assignments cannot overrun the cap.
+    """
+    _check_role(nurse_user, 'nurse', 'assigned')
+
+    with transaction.atomic():
+        has_room = Patient.objects.filter(pk=patient.pk, nurse_count__lt=MAX_NURSES)
+        updated = has_room.update(
+            nurse_count=F('nurse_count') + 1,
+            state=Case(
+                When(doctor_assigned=True, then=Value(Patient.DOCTOR_ASSIGNED)),
+                default=Value(Patient.NURSE_ASSIGNED),
+            ),
+        )
+        if not updated:
+            _raise_assignment_error(patient, nurse_user, 'nurse')
+        _create_record(patient, nurse_user, 'nurse')
+        _invalidate_on_commit(patient)
+
+    patient.nurse_count += 1
+    patient.state = (
+        Patient.DOCTOR_ASSIGNED if patient.doctor_assigned else Patient.NURSE_ASSIGNED
+    )
+
+
+def assign_doctor(patient, doctor_user):
+    _check_role(doctor_user, 'doctor', 'assigned')
+
+    with transaction.atomic():
+        needs_doctor = Patient.objects.filter(
+            pk=patient.pk, doctor_assigned=False, nurse_count__gt=0
+        )
+        updated = needs_doctor.update(
+            doctor_assigned=True,
+            state=Patient.DOCTOR_ASSIGNED,
+        )
+        if not updated:
+            _raise_assignment_error(patient, doctor_user, 'doctor')
+        _create_record(patient, doctor_user, 'doctor')
+        _invalidate_on_commit(patient)
+
+    patient.doctor_assigned = True
+    patient.state = Patient.DOCTOR_ASSIGNED
+
+
+def unassign_nurse(patient, nurse_user):
+    _check_role(nurse_user, 'nurse', 'unassigned')
+
+    with transaction.atomic():
+        records = TreatmentRecord.objects.filter(patient=patient, worker=nurse_user)
+        deleted, _ = records.delete()
+        if not deleted:
+            raise ValueError("This nurse is not assigned to the patient.")
+        # SET expressions see the pre-update row, so nurse_count=1 means the
+        # last nurse is leaving
+        Patient.objects.filter(pk=patient.pk).update(
+            nurse_count=Case(
+                When(nurse_count__gt=0, then=F('nurse_count') - 1), default=Value(0)
+            ),
+            state=Case(
+                When(
+                    nurse_count__lte=1, doctor_assigned=True,
+                    then=Value(Patient.DOCTOR_ASSIGNED),
+                ),
+                When(nurse_count__lte=1, then=Value(Patient.UNASSIGNED)),
+                default=F('state'),
+            ),
+        )
+        _invalidate_on_commit(patient)
+
+    patient.nurse_count = max(patient.nurse_count - 1, 0)
+    if patient.nurse_count == 0:
+        patient.state = (
+            Patient.DOCTOR_ASSIGNED if patient.doctor_assigned else Patient.UNASSIGNED
+        )
+
+
+def unassign_doctor(patient, doctor_user):
+    _check_role(doctor_user, 'doctor', 'unassigned')
+
+    with transaction.atomic():
+        records = TreatmentRecord.objects.filter(patient=patient, worker=doctor_user)
+        deleted, _ = records.delete()
+        if not deleted:
+            raise ValueError("This doctor is not assigned to the patient.")
+        Patient.objects.filter(pk=patient.pk).update(
+            doctor_assigned=False,
+            state=Case(
+                When(nurse_count__gt=0, then=Value(Patient.NURSE_ASSIGNED)),
+                default=Value(Patient.UNASSIGNED),
+            ),
+        )
+        _invalidate_on_commit(patient)
+
+    patient.doctor_assigned = False
+    patient.state = (
+        Patient.NURSE_ASSIGNED if patient.nurse_count > 0 else Patient.UNASSIGNED
+    )
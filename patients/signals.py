@@ -0,0 +1,61 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .board_cache import invalidate_all_boards, invalidate_board
+from .models import Geocode, Patient, TreatmentRecord
+from .search import bump_search_index
+
+
+@receiver(post_init, sender=Patient)
+def remember_patient_geocode(sender, instance, **kwargs):
+    # Keep the loaded geocode so a move between boards invalidates both
+    instance._board_geocode_id = instance.geocode_id
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_board(sender, instance, **kwargs):
+    previous_geocode_id = getattr(instance, '_board_geocode_id', None)
+    invalidate_board(instance.geocode_id)
+    if previous_geocode_id != instance.geocode_id:
+        invalidate_board(previous_geocode_id)
+    instance._board_geocode_id = instance.geocode_id
+    bump_search_index()
+
+
+@receiver(post_save, sender=TreatmentRecord)
+@receiver(post_delete, sender=TreatmentRecord)
+def invalidate_assignment_board(sender, instance, **kwargs):
+    # Covers records written outside patients.services too: the admin and
+    # cascades from deleted users or patients
+    if TreatmentRecord.patient.is_cached(instance):
+        geocode_id = instance.patient.geocode_id
+    else:
+        patients = Patient.objects.filter(pk=instance.patient_id)
+        geocode_id = patients.values_list('geocode_id', flat=True).first()
+    transaction.on_commit(partial(invalidate_board, geocode_id))
+
+
+@receiver(post_save, sender=Geocode)
+def sync_patient_geocode_names(sender, instance, created, **kwargs):
+    if not created:
+        instance.patients.exclude(geocode_name=instance.name).update(geocode_name=instance.name)
+        bump_search_index()
+
+
+@receiver(pre_delete, sender=Geocode)
+def clear_patient_geocode_names(sender, instance, **kwargs):
+    # Patients are detached with a SET_NULL update that skips Patient.save()
+    instance.patients.update(geocode_name='')
+    bump_search_index()
+
+
+@receiver(post_save, sender=Geocode)
+@receiver(post_delete, sender=Geocode)
+def invalidate_geocode_boards(sender, instance, **kwargs):
+    # Every board lists the other geocodes in its region dropdown
+    invalidate_all_boards()
+    invalidate_board(instance.id)
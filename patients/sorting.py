@@ -0,0 +1,28 @@
+# Supported patient list orderings. Every entry is backed by a composite
+# index on Patient (see Patient.Meta.indexes), with the primary key as
+# tiebreaker so ordering is deterministic. Patients sharing a state or ward
+# are listed by name.
+PATIENT_SORTS = {
+    'name': ('name', 'id'),
+    'bed_id': ('bed_id', 'id'),
+    'treatment_area': ('treatment_area', 'id'),
+    'date_of_birth': ('date_of_birth', 'id'),
+    'state': ('state', 'name', 'id'),
+    'geocode': ('geocode_name', 'name', 'id'),
+}
+
+
+def resolve_patient_sort(value, default='name', allowed=PATIENT_SORTS):
+    """Translate a ``sort`` query value into an ``order_by`` tuple.
+
+    A leading ``-`` reverses every column. Unknown keys (including raw column
+    or join paths) fall back to ``default`` instead of reaching ``order_by``.
+    """
+    value = value or default
+    descending = value.startswith('-')
+    ordering = allowed.get(value.lstrip('-'))
+    if ordering is None:
+        descending, ordering = False, allowed[default]
+    if descending:
+        return tuple(f'-{field}' for field in ordering)
+    return ordering
@@ -0,0 +1,111 @@
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from accounts.models import Role
+from patients.facets import FACET_VERSION_KEY
+from patients.management.commands import reconcile_assignments
+from patients.models import Patient
+
+CustomUser = get_user_model()
+
+class ReconcileAssignmentsTests(TestCase):
+    def setUp(self):
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        self.nurse = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=nurse_role
+        )
+        self.doctor = CustomUser.objects.create_user(
+            username='doctor_who',
+            email='doctor@example.com',
+            password='password123',
+            first_name='Doctor',
+            last_name='Who',
+            role=doctor_role
+        )
+        self.patient = Patient.objects.create(
+            name="John Doe",
+            address="123 Main St",
+            date_of_birth=date(1990, 1, 1),
+            height=70.0,
+            weight=180.0,
+            blood_group="O+",
+            bed_id="B1",
+            treatment_area="ICU"
+        )
+        self.patient.assign_nurse(self.nurse)
+        self.patient.assign_doctor(self.doctor)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command(
+            'reconcile_assignments', *args, '--batch-size', '2', '--verbosity', '2',
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_reports_drift_without_fixing(self):
+        Patient.objects.filter(pk=self.patient.pk).update(
+            nurse_count=3, state=Patient.NURSE_ASSIGNED
+        )
+
+        output = self.reconcile()
+
+        self.assertIn(f"Patient {self.patient.pk}: nurse_count 3 -> 1", output)
+        self.assertIn("found 1 with drifted", output)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.nurse_count, 3)
+
+    def test_fix_restores_counters(self):
+        Patient.objects.filter(pk=self.patient.pk).update(
+            nurse_count=0, doctor_assigned=False, state=Patient.UNASSIGNED
+        )
+
+        output = self.reconcile('--fix')
+
+        self.assertIn("fixed 1 with drifted", output)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.nurse_count, 1)
+        self.assertTrue(self.patient.doctor_assigned)
+        self.assertEqual(self.patient.state, Patient.DOCTOR_ASSIGNED)
+        self.assertIn("found 0 with drifted", self.reconcile())
+
+    def test_fix_keeps_assignments_made_after_the_scan(self):
+        Patient.objects.filter(pk=self.patient.pk).update(nurse_count=0)
+        second_nurse = CustomUser.objects.create_user(
+            username='nurse_ratched', email='ratched@example.com',
+            password='password123', first_name='Nurse', last_name='Ratched',
+            role=self.nurse.role,
+        )
+        fix_patients = reconcile_assignments.fix_patients
+
+        def assign_then_fix(pks):
+            # Lands between the unlocked scan and the locked rewrite
+            Patient.objects.get(pk=self.patient.pk).assign_nurse(second_nurse)
+            return fix_patients(pks)
+
+        with mock.patch.object(reconcile_assignments, 'fix_patients', assign_then_fix):
+            self.reconcile('--fix')
+
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.nurse_count, 2)
+        self.assertIn("found 0 with drifted", self.reconcile())
+
+    def test_fix_expires_cached_facets(self):
+        Patient.objects.filter(pk=self.patient.pk).update(state=Patient.UNASSIGNED)
+        version = cache.get(FACET_VERSION_KEY)
+
+        self.reconcile('--fix')
+
+        self.assertNotEqual(cache.get(FACET_VERSION_KEY), version)
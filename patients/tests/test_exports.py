@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import Role
+from patients.exports import EXPORT_FIELDS
+from patients.models import Geocode, Patient
+from patients.pagination import MAX_PAGE_SIZE
+
+CustomUser = get_user_model()
+
+class PatientExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.geocode = Geocode.objects.create(
+            name="Quasar Wing", description="Test ward"
+        )
+        Patient.objects.bulk_create([
+            Patient(
+                name=f"Exportee {i:03d}",
+                address="123 Main St",
+                date_of_birth=date(1990, 1, 1),
+                height=70.0,
+                weight=180.0,
+                blood_group="B+" if i % 2 else "A-",
+                bed_id=f"EX-{i:03d}",
+                treatment_area="Ortho",
+                geocode=self.geocode,
+                geocode_name=self.geocode.name,
+            )
+            for i in range(150)
+        ])
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        self.user = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=nurse_role
+        )
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(
+            reverse('patient_export'), {'geocode': self.geocode.pk, **params}
+        )
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_export_applies_list_filters_and_sort(self):
+        response, content = self.export(format='csv', blood_group='B+', sort='-name')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('patients.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(tuple(rows[0]), EXPORT_FIELDS)
+        self.assertEqual(len(rows) - 1, 75)
+        self.assertEqual(rows[1][1], "Exportee 149")
+        self.assertEqual({row[3] for row in rows[1:]}, {"B+"})
+
+    def test_ndjson_export_ranks_search_results(self):
+        response, content = self.export(format='ndjson', search='exportee 01')
+
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [r['name'] for r in records],
+            [f"Exportee {i:03d}" for i in range(10, 20)],
+        )
+        self.assertEqual(records[0]['geocode_name'], "Quasar Wing")
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(reverse('patient_export'), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_html_page_size_is_capped(self):
+        params = {'geocode': self.geocode.pk}
+        response = self.client.get(
+            reverse('patient_list'), dict(params, items_per_page=100000)
+        )
+        self.assertEqual(len(response.context['patients']), MAX_PAGE_SIZE)
+
+        response = self.client.get(
+            reverse('patient_list'), dict(params, items_per_page=-5)
+        )
+        self.assertEqual(len(response.context['patients']), 20)
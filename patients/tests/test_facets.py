@@ -0,0 +1,128 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import Role
+from patients.facets import compute_patient_facets, get_patient_facets
+from patients.models import Geocode, Patient
+from patients.services import assign_nurse
+
+CustomUser = get_user_model()
+
+class PatientFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.geocode = Geocode.objects.create(
+            name="Zanzibar Annex", description="Test ward"
+        )
+        self.other_geocode = Geocode.objects.create(
+            name="Zephyr Annex", description="Test ward"
+        )
+        for name, area, blood_group, geocode, state in [
+            ("Ottoline Vask", "Neuro", "AB-", self.geocode, Patient.UNASSIGNED),
+            ("Ottavio Brisk", "Neuro", "O+", self.geocode, Patient.NURSE_ASSIGNED),
+            ("Ottilie Crane", "Cardiac", "AB-", self.other_geocode, Patient.UNASSIGNED),
+        ]:
+            Patient.objects.create(
+                name=name,
+                address="123 Main St",
+                date_of_birth=date(1990, 1, 1),
+                height=70.0,
+                weight=180.0,
+                blood_group=blood_group,
+                bed_id="ZF-1",
+                treatment_area=area,
+                geocode=geocode,
+                state=state,
+            )
+        self.queryset = Patient.objects.filter(name__startswith="Ott")
+
+    def counts(self, facets, facet):
+        return {entry['label']: entry['count'] for entry in facets[facet]}
+
+    def test_counts_every_facet_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = compute_patient_facets(self.queryset)
+
+        self.assertEqual(
+            self.counts(facets, 'state'), {'Unassigned': 2, 'Nurse Assigned': 1}
+        )
+        self.assertEqual(
+            self.counts(facets, 'treatment_area'), {'Neuro': 2, 'Cardiac': 1}
+        )
+        self.assertEqual(self.counts(facets, 'blood_group'), {'AB-': 2, 'O+': 1})
+        self.assertEqual(
+            self.counts(facets, 'geocode'), {'Zanzibar Annex': 2, 'Zephyr Annex': 1}
+        )
+        self.assertEqual(facets['geocode'][0]['value'], str(self.geocode.pk))
+
+    def test_cached_per_filter_set_until_a_patient_changes(self):
+        get_patient_facets(self.queryset, {'search': 'ott'})
+        with self.assertNumQueries(0):
+            get_patient_facets(self.queryset, {'search': 'ott'})
+        with self.assertNumQueries(1):
+            get_patient_facets(
+                self.queryset.filter(blood_group='AB-'),
+                {'search': 'ott', 'blood_group': 'AB-'},
+            )
+
+        Patient.objects.filter(name="Ottilie Crane").get().delete()
+        facets = get_patient_facets(self.queryset, {'search': 'ott'})
+        self.assertEqual(self.counts(facets, 'treatment_area'), {'Neuro': 2})
+
+    def test_assignment_expires_cached_state_counts(self):
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        nurse = CustomUser.objects.create_user(
+            username='nurse_ida', email='ida@example.com', password='password123',
+            role=nurse_role,
+        )
+        get_patient_facets(self.queryset, {'search': 'ott'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            assign_nurse(Patient.objects.get(name="Ottoline Vask"), nurse)
+
+        facets = get_patient_facets(self.queryset, {'search': 'ott'})
+        self.assertEqual(
+            self.counts(facets, 'state'), {'Nurse Assigned': 2, 'Unassigned': 1}
+        )
+
+    def test_patient_list_facets_honor_search_and_filters(self):
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        user = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=nurse_role
+        )
+        self.client.force_login(user)
+
+        response = self.client.get(
+            reverse('patient_list'), {'search': 'annex', 'blood_group': 'AB-'}
+        )
+
+        self.assertEqual(
+            [p.name for p in response.context['patients']],
+            ["Ottilie Crane", "Ottoline Vask"],
+        )
+        facets = response.context['facets']
+        self.assertEqual(
+            self.counts(facets, 'geocode'), {'Zanzibar Annex': 1, 'Zephyr Annex': 1}
+        )
+        selected = facets['blood_group'][0]
+        self.assertTrue(selected['selected'])
+        self.assertNotIn('blood_group', selected['query'])
+
+        geocode_entry = next(
+            e for e in facets['geocode'] if e['label'] == "Zephyr Annex"
+        )
+        response = self.client.get(
+            reverse('patient_list') + '?' + geocode_entry['query']
+        )
+        self.assertEqual(
+            [p.name for p in response.context['patients']], ["Ottilie Crane"]
+        )
@@ -0,0 +1,171 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import Role
+from patients.board_cache import get_board_version
+from patients.imports import import_patients, read_rows
+from patients.models import Geocode, Patient
+from patients.search import search_patients
+
+CustomUser = get_user_model()
+
+CSV_HEADER = (
+    "name,address,date_of_birth,height,weight,blood_group,bed_id,treatment_area,"
+    "geocode\n"
+)
+
+
+class PatientImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.geocode = Geocode.objects.create(
+            name="Umbra Ward", description="Test ward"
+        )
+
+    def create_admin(self):
+        return CustomUser.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password123'
+        )
+
+    def test_valid_rows_inserted_in_batches_and_invalid_rows_reported(self):
+        content = CSV_HEADER + (
+            "Imogen Fairweather,1 Elm St,1980-02-03,65.5,140,A+,IM-1,Neuro,umbra ward\n"
+            "Ignatius Bell,2 Elm St,not-a-date,70,180,O-,IM-2,Neuro,Umbra Ward\n"
+            "Isolde Marsh,3 Elm St,1975-07-08,62,130,B+,IM-3,Cardiac,Nowhere Ward\n"
+            "Ingram Pike,4 Elm St,1990-01-01,71,185,AB+,IM-4,Ortho,\n"
+            "Idris Vane,5 Elm St,1991-01-01,72,190,O+,IM-5,Ortho,Umbra Ward\n"
+        )
+        version = get_board_version(self.geocode.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_patients(read_rows(StringIO(content), 'csv'), batch_size=2)
+
+        self.assertEqual(result.created, 3)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertIn('date_of_birth', result.errors[0][1])
+        self.assertIn('geocode', result.errors[1][1])
+
+        imported = Patient.objects.get(bed_id="IM-1")
+        self.assertEqual(imported.geocode, self.geocode)
+        self.assertEqual(imported.geocode_name, "Umbra Ward")
+        self.assertIsNone(Patient.objects.get(bed_id="IM-4").geocode)
+        self.assertNotEqual(get_board_version(self.geocode.pk), version)
+        self.assertEqual(
+            search_patients(Patient.objects.all(), "idris vane").count(), 1
+        )
+
+    def test_ndjson_rows_and_dry_run(self):
+        content = (
+            '{"name": "Ysolde Crane", "address": "9 Oak St", '
+            '"date_of_birth": "1985-05-05", "height": "60", "weight": "120", '
+            '"blood_group": "A-", "bed_id": "IM-9", "treatment_area": "ICU", '
+            '"geocode": "Umbra Ward"}\n'
+            '\n'
+            'not json\n'
+            '{"name": "", "address": "9 Oak St"}\n'
+        )
+
+        result = import_patients(read_rows(StringIO(content), 'ndjson'), dry_run=True)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertIn('name', result.errors[1][1])
+        self.assertFalse(Patient.objects.filter(bed_id="IM-9").exists())
+
+    def test_ndjson_values_of_other_types_reported(self):
+        content = (
+            '{"name": ["Yann Moss"], "address": "9 Oak St", '
+            '"date_of_birth": 19900101, "height": "60", "weight": "120", '
+            '"blood_group": "A-", "bed_id": "IM-9", "treatment_area": "ICU", '
+            '"geocode": null}\n'
+        )
+
+        result = import_patients(read_rows(StringIO(content), 'ndjson'))
+
+        self.assertEqual(result.created, 0)
+        self.assertEqual(result.errors, [(1, {
+            'name': ["Expected text, got a list."],
+            'date_of_birth': ["Expected text, got a number."],
+        })])
+        self.assertFalse(Patient.objects.filter(bed_id="IM-9").exists())
+
+    def test_csv_missing_columns_rejected(self):
+        with self.assertRaisesMessage(ValueError, "Missing required columns: address"):
+            import_patients(read_rows(StringIO("name,date_of_birth\n"), 'csv'))
+
+    def test_malformed_csv_reported_on_the_form(self):
+        self.client.force_login(self.create_admin())
+        oversized = 'x' * 200_000
+        row = f"{oversized},8 Pine St,1988-08-08,64,130,B-,IM-8,ICU,Umbra Ward\n"
+        upload = SimpleUploadedFile('cohort.csv', (CSV_HEADER + row).encode())
+
+        response = self.client.post(reverse('patient_import'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "Malformed CSV at line", response.context['form'].errors['file'][0]
+        )
+        self.assertFalse(Patient.objects.filter(bed_id="IM-8").exists())
+
+    def test_malformed_csv_error_counts_rows_already_imported(self):
+        rows = "".join(
+            f"Patient {i},{i} Pine St,1988-08-08,64,130,B-,IM-{i},ICU,Umbra Ward\n"
+            for i in range(3)
+        )
+        oversized = 'x' * 200_000
+        malformed = f"{oversized},8 Pine St,1988-08-08,64,130,B-,IM-8,ICU,Umbra Ward\n"
+        content = CSV_HEADER + rows + malformed
+
+        message = "2 patients from the rows before it were already imported"
+        with self.assertRaisesMessage(ValueError, message):
+            import_patients(read_rows(StringIO(content), 'csv'), batch_size=2)
+        self.assertEqual(Patient.objects.filter(bed_id__startswith="IM-").count(), 2)
+
+    def test_import_command(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as f:
+            f.write(
+                CSV_HEADER
+                + "Ulysses Grant,7 Pine St,1970-04-27,70,170,O+,IM-7,ICU,Umbra Ward\n"
+            )
+        self.addCleanup(os.remove, path)
+
+        out = StringIO()
+        call_command('import_patients', path, stdout=out, stderr=StringIO())
+
+        self.assertIn("Imported 1 patients; skipped 0 invalid rows.", out.getvalue())
+        self.assertTrue(
+            Patient.objects.filter(bed_id="IM-7", geocode=self.geocode).exists()
+        )
+
+    def test_upload_endpoint_is_superuser_only(self):
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        nurse = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=nurse_role
+        )
+        admin = self.create_admin()
+        row = "Uma Thorn,8 Pine St,1988-08-08,64,130,B-,IM-8,ICU,Umbra Ward\n"
+        upload = SimpleUploadedFile('cohort.csv', (CSV_HEADER + row).encode())
+
+        self.client.force_login(nurse)
+        self.assertEqual(self.client.get(reverse('patient_import')).status_code, 403)
+
+        self.client.force_login(admin)
+        response = self.client.post(reverse('patient_import'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertTrue(Patient.objects.filter(bed_id="IM-8").exists())
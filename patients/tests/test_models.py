@@ -1,8 +1,13 @@
-from django.test import TestCase
+import threading
+from datetime import date
+
 from django.contrib.auth import get_user_model
-from patients.models import Patient, TreatmentRecord
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
 from accounts.models import Role
-from datetime import date
+from patients.models import Patient, TreatmentRecord
 
 CustomUser = get_user_model()
 
@@ -68,3 +73,84 @@ class PatientModelTests(TestCase):
         # Try to assign doctor as nurse
         with self.assertRaises(ValueError):
             self.patient.assign_nurse(self.doctor)
+
+    def test_assign_nurse_round_trips(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.patient.assign_nurse(self.nurse)
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[0].startswith('UPDATE'))
+        self.assertTrue(statements[1].startswith('INSERT'))
+
+    def test_assign_nurse_twice_fails_without_drift(self):
+        self.patient.assign_nurse(self.nurse)
+        with self.assertRaises(ValueError) as cm:
+            self.patient.assign_nurse(self.nurse)
+        self.assertIn("already assigned", str(cm.exception))
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.nurse_count, 1)
+
+    def test_unassign_doctor_keeps_nurse_state(self):
+        self.patient.assign_nurse(self.nurse)
+        self.patient.assign_doctor(self.doctor)
+        self.patient.unassign_doctor(self.doctor)
+        self.patient.refresh_from_db()
+        self.assertFalse(self.patient.doctor_assigned)
+        self.assertEqual(self.patient.nurse_count, 1)
+        self.assertEqual(self.patient.state, Patient.NURSE_ASSIGNED)
+
+
+class ConcurrentAssignmentTests(TransactionTestCase):
+    def setUp(self):
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        self.nurses = [
+            CustomUser.objects.create_user(
+                username=f'nurse_{i}',
+                email=f'nurse{i}@example.com',
+                password='password123',
+                first_name='Nurse',
+                last_name=str(i),
+                role=nurse_role
+            )
+            for i in range(8)
+        ]
+        self.patient = Patient.objects.create(
+            name="John Doe",
+            address="123 Main St",
+            date_of_birth=date(1990, 1, 1),
+            height=70.0,
+            weight=180.0,
+            blood_group="O+",
+            bed_id="B1",
+            treatment_area="ICU"
+        )
+
+    def test_concurrent_assignments_respect_cap(self):
+        barrier = threading.Barrier(len(self.nurses))
+
+        def assign(nurse):
+            # Each thread works on its own stale copy, like separate requests
+            patient = Patient.objects.get(pk=self.patient.pk)
+            barrier.wait()
+            try:
+                patient.assign_nurse(nurse)
+            except (ValueError, OperationalError):
+                pass
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=assign, args=(nurse,)) for nurse in self.nurses
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.patient.refresh_from_db()
+        records = TreatmentRecord.objects.filter(patient=self.patient).count()
+        self.assertLessEqual(self.patient.nurse_count, 3)
+        self.assertEqual(self.patient.nurse_count, records)
@@ -0,0 +1,165 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Role
+from patients.models import Geocode, Patient, TreatmentRecord
+
+CustomUser = get_user_model()
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        self.user = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=self.nurse_role
+        )
+        self.client.force_login(self.user)
+        self.geocode = Geocode.objects.create(name="Ward A", description="Test ward")
+        # Duplicate names exercise the UUID tiebreaker
+        for i in range(25):
+            Patient.objects.create(
+                name=f"Keyset {i // 2:02d}",
+                address="123 Main St",
+                date_of_birth=date(1990, 1, 1 + i),
+                height=70.0,
+                weight=180.0,
+                blood_group="O+",
+                bed_id=f"B{i}",
+                treatment_area="ICU",
+                geocode=self.geocode
+            )
+
+    def walk(self, url, params):
+        """Follow next cursors to the end, returning every page's patient ids."""
+        pages = []
+        params = dict(params, pagination='cursor')
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page_obj']
+            pages.append([
+                str(patient['id'] if isinstance(patient, dict) else patient.pk)
+                for patient in page
+            ])
+            if not page.has_next():
+                return pages, response
+            params['cursor'] = page.next_cursor
+
+    def expected_ids(self, *ordering):
+        patients = Patient.objects.filter(name__startswith='Keyset').order_by(*ordering)
+        return [str(pk) for pk in patients.values_list('pk', flat=True)]
+
+    def test_patient_list_walks_every_row_once_in_order(self):
+        url = reverse('patient_list')
+        params = {'search': 'Keyset', 'sort': 'name', 'items_per_page': 10}
+        pages, _ = self.walk(url, params)
+
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, self.expected_ids('name', 'pk'))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+    def test_descending_sort(self):
+        url = reverse('patient_list')
+        params = {'search': 'Keyset', 'sort': '-date_of_birth', 'items_per_page': 10}
+        pages, _ = self.walk(url, params)
+
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, self.expected_ids('-date_of_birth', '-pk'))
+
+    def test_state_sort_lists_each_state_by_name(self):
+        url = reverse('patient_list')
+        patients = Patient.objects.filter(name__startswith='Keyset').order_by('-name')
+        for i, patient in enumerate(patients):
+            state = Patient.STATE_CHOICES[i % 2][0]
+            Patient.objects.filter(pk=patient.pk).update(state=state)
+        params = {'search': 'Keyset', 'sort': 'state', 'items_per_page': 10}
+        pages, _ = self.walk(url, params)
+
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, self.expected_ids('state', 'name', 'pk'))
+
+        offset = self.client.get(url, dict(params, items_per_page=25))
+        self.assertEqual(
+            [str(patient.pk) for patient in offset.context['page_obj']], ids
+        )
+
+    def test_previous_cursor_returns_previous_page(self):
+        url = reverse('patient_list')
+        params = {
+            'search': 'Keyset', 'sort': 'name', 'items_per_page': 10,
+            'pagination': 'cursor',
+        }
+
+        def page(cursor=None):
+            query = dict(params, cursor=cursor) if cursor else params
+            return self.client.get(url, query).context['page_obj']
+
+        first = page()
+        second = page(first.next_cursor)
+
+        back = page(second.previous_cursor)
+
+        self.assertEqual([p.pk for p in back], [p.pk for p in first])
+        self.assertTrue(back.has_next())
+
+    def test_ranked_search_pages_by_offset(self):
+        # An exact bed match ranks first though its name sorts last
+        best = Patient.objects.create(
+            name="Zz Keyset",
+            address="123 Main St",
+            date_of_birth=date(1990, 2, 1),
+            height=70.0,
+            weight=180.0,
+            blood_group="O+",
+            bed_id="Keyset",
+            treatment_area="ICU",
+            geocode=self.geocode
+        )
+        TreatmentRecord.objects.bulk_create(
+            TreatmentRecord(patient=patient, worker=self.user)
+            for patient in Patient.objects.all()
+        )
+        url = reverse('my_board')
+        params = {'search': 'Keyset', 'paginate_by': 10, 'pagination': 'cursor'}
+
+        ids = []
+        for page in (1, 2, 3):
+            response = self.client.get(url, dict(params, page=page))
+            self.assertFalse(response.context['keyset'])
+            ids += [patient.pk for patient in response.context['patients']]
+
+        self.assertEqual(ids[0], best.pk)
+        self.assertEqual(len(set(ids)), 26)
+
+    def test_cursor_pages_do_not_count(self):
+        url = reverse('patient_list')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'pagination': 'cursor'})
+        # Grouped facet counts are expected; a paginator total is not
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] and 'GROUP BY' not in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_icare_board_cursor_pages(self):
+        url = reverse('icare_board', args=[self.geocode.id])
+        pages, response = self.walk(url, {'paginate_by': 10})
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(len({pk for page in pages for pk in page}), 25)
+        self.assertTrue(response.context['keyset'])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(reverse('patient_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
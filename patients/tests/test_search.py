@@ -0,0 +1,105 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import Role
+from patients.models import Geocode, Patient
+from patients.search import search_patients, search_rows, trigrams
+
+CustomUser = get_user_model()
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.geocode = Geocode.objects.create(
+            name="Xylophage West", description="Test ward"
+        )
+        self.patients = {}
+        for name, bed_id, area in [
+            ("Quillon Harker", "ZQ-101", "Neuro"),
+            ("Quill Snow", "ZQ-102", "Trauma"),
+            ("Mina Murray", "ZQ-201", "Cardiac"),
+        ]:
+            self.patients[name] = Patient.objects.create(
+                name=name,
+                address="123 Main St",
+                date_of_birth=date(1990, 1, 1),
+                height=70.0,
+                weight=180.0,
+                blood_group="O+",
+                bed_id=bed_id,
+                treatment_area=area,
+                geocode=self.geocode
+            )
+
+    def names(self, queryset):
+        ranked = queryset.order_by('-search_rank', 'name')
+        return list(ranked.values_list('name', flat=True))
+
+    def search(self, query):
+        return self.names(search_patients(Patient.objects.all(), query))
+
+    def test_trigrams_match_pg_trgm_padding(self):
+        self.assertEqual(trigrams("Cat"), {'  c', ' ca', 'cat', 'at '})
+
+    def test_substring_match_ranked_by_similarity(self):
+        self.assertEqual(self.search("quill"), ["Quill Snow", "Quillon Harker"])
+
+    def test_matches_bed_id_and_denormalized_geocode_name(self):
+        self.assertEqual(self.search("zq-20"), ["Mina Murray"])
+        self.assertEqual(len(self.search("xylophage w")), 3)
+
+    def test_geocode_rename_updates_search(self):
+        self.geocode.name = "Yttrium East"
+        self.geocode.save()
+
+        patient = Patient.objects.get(pk=self.patients["Quill Snow"].pk)
+        self.assertEqual(patient.geocode_name, "Yttrium East")
+        self.assertEqual(len(self.search("yttrium")), 3)
+        self.assertEqual(self.search("xylophage w"), [])
+
+    def test_new_patient_is_searchable(self):
+        self.search("quillon harker")
+        Patient.objects.create(
+            name="Lucy Quillon Harker",
+            address="1 Hill St",
+            date_of_birth=date(1990, 1, 1),
+            height=70.0,
+            weight=180.0,
+            blood_group="O+",
+            bed_id="ZQ-301",
+            treatment_area="ICU",
+        )
+        self.assertEqual(len(self.search("quillon harker")), 2)
+
+    def test_search_rows_uses_same_rules(self):
+        rows = list(
+            Patient.objects.filter(geocode=self.geocode)
+            .values('name', 'bed_id', 'treatment_area')
+        )
+        self.assertEqual(
+            [row['name'] for row in search_rows(rows, "quill")],
+            ["Quill Snow", "Quillon Harker"],
+        )
+
+    def test_patient_list_view_search(self):
+        nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        user = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=nurse_role
+        )
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('patient_list'), {'search': 'quill'})
+
+        self.assertEqual(
+            [p.name for p in response.context['patients']],
+            ["Quill Snow", "Quillon Harker"],
+        )
@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from patients.models import Geocode, Patient
+from patients.pagination import keyset_paginate_queryset
+from patients.sorting import PATIENT_SORTS, resolve_patient_sort
+
+
+class PatientSortTests(TestCase):
+    def test_unknown_sort_falls_back_to_name(self):
+        self.assertEqual(resolve_patient_sort('geocode__description'), ('name', 'id'))
+        self.assertEqual(resolve_patient_sort('-address'), ('name', 'id'))
+
+    def test_descending_sort(self):
+        self.assertEqual(resolve_patient_sort('-state'), ('-state', '-name', '-id'))
+
+
+class PatientSortIndexTests(TestCase):
+    """Every supported sort is served by an index on a seeded 100k-row table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        geocodes = [
+            Geocode.objects.create(name=f"Ward {i}", description="") for i in range(20)
+        ]
+        states = [state for state, _ in Patient.STATE_CHOICES]
+        Patient.objects.bulk_create(
+            (
+                Patient(
+                    name=f"Patient {i:06d}",
+                    address="",
+                    date_of_birth=date(1940, 1, 1) + timedelta(days=i % 20000),
+                    height=70,
+                    weight=180,
+                    blood_group="O+",
+                    bed_id=f"B{i % 5000}",
+                    treatment_area=f"Area {i % 40}",
+                    geocode=geocodes[i % 20],
+                    geocode_name=geocodes[i % 20].name,
+                    state=states[i % 3],
+                )
+                for i in range(100_000)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            sqlite = connection.vendor == 'sqlite'
+            cursor.execute('ANALYZE' if sqlite else 'ANALYZE patients_patient')
+
+    def assert_uses_index(self, queryset):
+        self.assert_plan_uses_index(queryset.explain())
+
+    def assert_plan_uses_index(self, plan):
+        if connection.vendor == 'postgresql':
+            self.assertRegex(plan, r'Index (Only )?Scan')
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            self.assertIn('USING INDEX', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_supported_sorts_use_index_scan(self):
+        for key in PATIENT_SORTS:
+            for value in (key, f'-{key}'):
+                with self.subTest(sort=value):
+                    self.assert_uses_index(Patient.objects.order_by(*resolve_patient_sort(value))[:20])
+
+    def test_cursor_page_seeks_use_index_scan(self):
+        # keyset_paginate_queryset seeks on the sort columns and pk; deep
+        # pages must not sort
+        middle = Patient.objects.order_by('pk')[50_000]
+        for key, ordering in PATIENT_SORTS.items():
+            paths = ordering[:-1]
+            for descending in (False, True):
+                with self.subTest(sort=key, descending=descending):
+                    values = [getattr(middle, path) for path in paths]
+                    value = values if len(values) > 1 else values[0]
+                    cursor = ('next', value, middle.pk)
+                    with CaptureQueriesContext(connection) as queries:
+                        keyset_paginate_queryset(
+                            Patient.objects.all(), paths, descending, cursor, 20
+                        )
+                    sqlite = connection.vendor == 'sqlite'
+                    explain = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+                    with connection.cursor() as cursor:
+                        cursor.execute(explain + queries.captured_queries[-1]['sql'])
+                        plan = '\n'.join(
+                            ' '.join(str(column) for column in row)
+                            for row in cursor.fetchall()
+                        )
+                    self.assert_plan_uses_index(plan)
+
+    def test_board_query_uses_geocode_index(self):
+        geocode = Geocode.objects.get(name="Ward 3")
+        self.assert_uses_index(geocode.patients.order_by('name')[:20])
@@ -1,9 +1,13 @@
 from django.test import TestCase, Client
+from django.core.cache import cache
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from patients.models import Patient
+from patients.board_cache import get_board_snapshot
+from patients.events import board_deltas
+from patients.models import Geocode, Patient, TreatmentRecord
 from accounts.models import Role
 from datetime import date
+import warnings
 
 CustomUser = get_user_model()
 
@@ -44,3 +48,201 @@ class PatientViewTests(TestCase):
     #     response = self.client.get(url)
     #     self.assertEqual(response.status_code, 200)
     #     self.assertContains(response, "John Doe")
+
+
+class ICareBoardTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.nurse_role, _ = Role.objects.get_or_create(name='nurse')
+        self.doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        self.geocode = Geocode.objects.create(name="Ward A", description="Test ward")
+        self.nurse = CustomUser.objects.create_user(
+            username='nurse_joy',
+            email='nurse@example.com',
+            password='password123',
+            first_name='Nurse',
+            last_name='Joy',
+            role=self.nurse_role
+        )
+        self.doctor = CustomUser.objects.create_user(
+            username='doctor_who',
+            email='doctor@example.com',
+            password='password123',
+            first_name='Doctor',
+            last_name='Who',
+            role=self.doctor_role
+        )
+        self.client.force_login(self.nurse)
+
+    def create_patients(self, count):
+        for i in range(count):
+            patient = Patient.objects.create(
+                name=f"Patient {i:03d}",
+                address="123 Main St",
+                date_of_birth=date(1990, 1, 1),
+                height=70.0,
+                weight=180.0,
+                blood_group="O+",
+                bed_id=f"B{i}",
+                treatment_area="ICU",
+                geocode=self.geocode
+            )
+            patient.assign_nurse(self.nurse)
+            patient.assign_doctor(self.doctor)
+
+    def get_board(self, paginate_by):
+        url = reverse('icare_board', args=[self.geocode.id])
+        return self.client.get(url, {'paginate_by': paginate_by})
+
+
+class ICareBoardQueryTests(ICareBoardTestCase):
+    def test_cold_board_query_count_is_constant_in_page_size(self):
+        self.create_patients(50)
+
+        # session, user, geocode, patients, treatment records, other
+        # geocodes, role
+        with self.assertNumQueries(7):
+            self.get_board(5)
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.get_board(50)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['patients']), 50)
+
+    def test_warm_board_is_served_from_cache(self):
+        self.create_patients(50)
+        self.get_board(50)
+
+        # session, user, role
+        with self.assertNumQueries(3):
+            response = self.get_board(50)
+        self.assertEqual(len(response.context['patients']), 50)
+
+    def test_assignment_flags(self):
+        self.create_patients(1)
+        response = self.get_board(10)
+
+        patient = response.context['patients'][0]
+        self.assertTrue(patient['is_assigned_to_user'])
+        self.assertTrue(patient['can_unassign'])
+        self.assertFalse(patient['can_assign'])
+        self.assertEqual(
+            sorted(worker['role'] for worker in patient['assigned_workers']),
+            ['doctor', 'nurse']
+        )
+
+    def test_assignment_invalidates_board(self):
+        self.create_patients(1)
+        self.get_board(10)
+
+        patient = Patient.objects.get(geocode=self.geocode)
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.unassign_doctor(self.doctor)
+
+        row = self.get_board(10).context['patients'][0]
+        self.assertFalse(row['doctor_assigned'])
+        self.assertEqual(
+            [worker['role'] for worker in row['assigned_workers']], ['nurse']
+        )
+
+    def test_records_written_outside_the_service_invalidate_board(self):
+        self.create_patients(1)
+        patient = Patient.objects.get(geocode=self.geocode)
+        other_nurse = CustomUser.objects.create_user(
+            username='nurse_ida', email='ida@example.com', password='password123',
+            first_name='Nurse', last_name='Ida', role=self.nurse_role,
+        )
+        self.get_board(10)
+
+        # As the admin would, then a cascade from deleting the user
+        with self.captureOnCommitCallbacks(execute=True):
+            TreatmentRecord.objects.create(patient=patient, worker=other_nurse)
+        workers = self.get_board(10).context['patients'][0]['assigned_workers']
+        self.assertIn('Nurse Ida', [worker['name'] for worker in workers])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.delete()
+        workers = self.get_board(10).context['patients'][0]['assigned_workers']
+        self.assertEqual(
+            sorted(worker['role'] for worker in workers), ['nurse', 'nurse']
+        )
+
+    def test_moving_patient_invalidates_both_boards(self):
+        self.create_patients(1)
+        other = Geocode.objects.create(name="Ward B", description="Other ward")
+        self.get_board(10)
+        self.client.get(reverse('icare_board', args=[other.id]))
+
+        patient = Patient.objects.get(geocode=self.geocode)
+        patient.geocode = other
+        patient.save()
+
+        self.assertEqual(len(self.get_board(10).context['patients']), 0)
+        response = self.client.get(reverse('icare_board', args=[other.id]))
+        self.assertEqual(len(response.context['patients']), 1)
+
+    def test_unknown_geocode_returns_404(self):
+        response = self.client.get(reverse('icare_board', args=['not-a-uuid']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_json_post_returns_patched_row(self):
+        self.create_patients(1)
+        patient = Patient.objects.get(geocode=self.geocode)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('icare_board', args=[self.geocode.id]),
+                {'patient_id': patient.id, 'action': 'unassign'},
+                HTTP_ACCEPT='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        row = response.json()['patient']
+        self.assertEqual(row['nurse_count'], 0)
+        self.assertFalse(row['can_unassign'])
+
+
+class ICareBoardEventsTests(ICareBoardTestCase):
+    def get_events(self, **params):
+        url = reverse('icare_board_events', args=[self.geocode.id])
+        response = self.client.get(url, params)
+        # The test client is WSGI, so the stream closes after one batch
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            content = b''.join(response).decode()
+        return response, content
+
+    def test_stream_sends_rows_for_unknown_version(self):
+        self.create_patients(2)
+
+        response, content = self.get_events()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(content.count('event: assignment'), 2)
+        self.assertIn('"nurse_count": 1', content)
+
+    def test_stream_is_quiet_for_current_version(self):
+        self.create_patients(2)
+        version = self.get_board(10).context['board_version']
+
+        _, content = self.get_events(version=version)
+
+        self.assertNotIn('event:', content)
+
+    def test_board_deltas_only_include_changed_rows(self):
+        self.create_patients(2)
+        before = get_board_snapshot(self.geocode.id)['rows']
+        patient = Patient.objects.get(geocode=self.geocode, name="Patient 000")
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.unassign_doctor(self.doctor)
+        after = get_board_snapshot(self.geocode.id)['rows']
+
+        deltas = list(board_deltas(before, after))
+
+        self.assertEqual(len(deltas), 1)
+        event, payload = deltas[0]
+        self.assertEqual(event, 'assignment')
+        self.assertEqual(payload['patient_id'], patient.id)
+        self.assertFalse(payload['doctor_assigned'])
+        self.assertEqual(payload['state'], Patient.NURSE_ASSIGNED)
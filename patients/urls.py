@@ -6,16 +6,25 @@ from .views import (
     PatientCreateView,
     PatientDeleteView,
     PatientDetailView,
+    PatientExportView,
+    PatientImportView,
     PatientListView,
     PatientUpdateView,
+    icare_board_events,
 )
 
 urlpatterns = [
     path('list/', PatientListView.as_view(), name='patient_list'),
+    path('list/export/', PatientExportView.as_view(), name='patient_export'),
     path('add/', PatientCreateView.as_view(), name='patient_add'),
+    path('import/', PatientImportView.as_view(), name='patient_import'),
     path('my_board/', MyBoardView.as_view(), name='my_board'),
     path('icare_board/', ICareBoardView.as_view(), name='icare_board'),
     path('icare_board/<str:geocode_id>/', ICareBoardView.as_view(), name='icare_board'),
+    path(
+        'icare_board/<str:geocode_id>/events/', icare_board_events,
+        name='icare_board_events',
+    ),
     path('<str:pk>/', PatientDetailView.as_view(), name='patient_detail'),
     path('<str:pk>/edit/', PatientUpdateView.as_view(), name='patient_edit'),
     path('<str:pk>/delete/', PatientDeleteView.as_view(), name='patient_delete'),
@@ -1,7 +1,19 @@
+import asyncio
+import io
+import uuid
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
@@ -9,14 +21,46 @@ from django.views.generic import (
     CreateView,
     DeleteView,
     DetailView,
+    FormView,
     ListView,
     UpdateView,
 )
 
-from .models import Geocode, Patient, TreatmentRecord
+from .assignments import apply_user_flags
+from .board_cache import get_board_snapshot
+from .events import board_deltas, format_sse
+from .exports import stream_export
+from .facets import get_patient_facets
+from .forms import PatientImportForm
+from .imports import guess_format, import_patients, read_rows
+from .models import Geocode, Patient
+from .pagination import KeysetPaginationMixin, clamp_page_size
+from .search import search_patients, search_rows
+from .sorting import resolve_patient_sort
 
 CustomUser = get_user_model()
 
+BOARD_KEYSET_SORT_FIELDS = {
+    'name': 'name',
+    'treatment_area': 'treatment_area',
+    'bed_id': 'bed_id',
+    'date_of_birth': 'date_of_birth',
+}
+
+# Patient list facet -> the query parameter that filters by it
+PATIENT_FACET_PARAMS = {
+    'state': 'treatment_state',
+    'treatment_area': 'treatment_area',
+    'blood_group': 'blood_group',
+    'geocode': 'geocode',
+}
+PATIENT_FACET_TITLES = {
+    'state': 'Treatment State',
+    'treatment_area': 'Treatment Area',
+    'blood_group': 'Blood Group',
+    'geocode': 'Geocode',
+}
+
 #Create View
 @method_decorator(login_required, name='dispatch')
 class PatientCreateView(CreateView):
@@ -25,56 +69,145 @@ class PatientCreateView(CreateView):
     template_name = 'patients/patient_form.html'
     success_url = reverse_lazy('patient_list')
 
+# Bulk import View
+class PatientImportView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+    form_class = PatientImportForm
+    template_name = 'patients/patient_import.html'
+    # The error report is capped on the page; the total is always shown
+    max_reported_errors = 200
+
+    def test_func(self):
+        # Only allow superusers to import patients
+        return self.request.user.is_superuser
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        upload.seek(0)
+        import_format = form.cleaned_data['format'] or guess_format(upload.name)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            result = import_patients(
+                read_rows(stream, import_format), dry_run=form.cleaned_data['dry_run']
+            )
+        except ValueError as e:
+            form.add_error('file', str(e))
+            return self.form_invalid(form)
+        finally:
+            stream.detach()
+
+        return self.render_to_response(self.get_context_data(
+            form=form,
+            result=result,
+            dry_run=form.cleaned_data['dry_run'],
+            reported_errors=result.errors[:self.max_reported_errors],
+        ))
+
+
 # Read/List View with pagination, search, filter, and sort
 @method_decorator(login_required, name='dispatch')
-class PatientListView(ListView):
+class PatientListView(KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'patients/patient_list.html'
     context_object_name = 'patients'
+    keyset_sort_fields = {
+        'name': 'name',
+        'date_of_birth': 'date_of_birth',
+        'bed_id': 'bed_id',
+        'treatment_area': 'treatment_area',
+        'state': ('state', 'name'),
+        'geocode': ('geocode_name', 'name'),
+    }
 
     def get_paginate_by(self, queryset):
         # Get the pagination setting from the request, default to 10 if not specified
-        items_per_page = self.request.GET.get('items_per_page', '20')
+        return clamp_page_size(self.request.GET.get('items_per_page'), 20)
+
+    def get_filters(self):
+        """Return the active filters keyed by their query parameter."""
+        filters = {
+            param: self.request.GET.get(param, '')
+            for param in ['search', *PATIENT_FACET_PARAMS.values()]
+        }
         try:
-            return int(items_per_page)
+            if filters['geocode']:
+                uuid.UUID(filters['geocode'])
         except ValueError:
-            return 20
+            filters['geocode'] = ''
+        return filters
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        search_query = self.request.GET.get('search', '')
+        self.filters = filters = self.get_filters()
+        search_query = filters['search']
         sort_by = self.request.GET.get('sort', 'name')
-        treatment_state = self.request.GET.get('treatment_state', '')
-
 
         # Search functionality
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(bed_id__icontains=search_query) |
-                Q(treatment_area__icontains=search_query) |
-                Q(geocode__name__icontains=search_query)
-            )
-
-        # Filter by treatment state if selected
-        if treatment_state:
-            queryset = queryset.filter(state=treatment_state)
-
-        # Apply sorting
-        if sort_by:
-            queryset = queryset.order_by(sort_by)
+            queryset = search_patients(queryset, search_query)
+
+        # Filter by treatment state, area, blood group and geocode if selected
+        if filters['treatment_state']:
+            queryset = queryset.filter(state=filters['treatment_state'])
+        if filters['treatment_area']:
+            queryset = queryset.filter(treatment_area=filters['treatment_area'])
+        if filters['blood_group']:
+            queryset = queryset.filter(blood_group=filters['blood_group'])
+        if filters['geocode']:
+            queryset = queryset.filter(geocode_id=filters['geocode'])
+        self.filtered_queryset = queryset
+
+        # Apply sorting; searches without an explicit sort are ranked by similarity
+        if search_query and 'sort' not in self.request.GET:
+            queryset = queryset.order_by('-search_rank', 'name')
+        else:
+            queryset = queryset.order_by(*resolve_patient_sort(sort_by))
 
         return queryset
 
+    def get_facets(self):
+        """Facet counts for the filtered list, each with a toggle link query."""
+        facets = get_patient_facets(self.filtered_queryset, self.filters)
+        for facet, param in PATIENT_FACET_PARAMS.items():
+            for entry in facets[facet]:
+                query = self.request.GET.copy()
+                for key in (param, 'page', 'cursor'):
+                    query.pop(key, None)
+                entry['selected'] = self.filters[param] == entry['value']
+                if not entry['selected']:
+                    query[param] = entry['value']
+                entry['query'] = query.urlencode()
+        return facets
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_query'] = self.request.GET.get('search', '')
         context['treatment_area_filter'] = self.request.GET.get('treatment_area', '')
         context['sort_by'] = self.request.GET.get('sort', 'name')
         context['items_per_page'] = self.request.GET.get('items_per_page', '10')
+        context['facets'] = facets = self.get_facets()
+        context['facet_groups'] = [
+            (title, facets[facet]) for facet, title in PATIENT_FACET_TITLES.items()
+        ]
+        page_query = self.request.GET.copy()
+        page_query.pop('page', None)
+        context['page_query'] = page_query.urlencode() + '&' if page_query else ''
         return context
 
 
+# Export View
+@method_decorator(login_required, name='dispatch')
+class PatientExportView(PatientListView):
+    """Stream the patient list, with its search, filters and sort, as CSV or NDJSON."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return stream_export(
+                self.get_queryset(), request.GET.get('format', 'csv'), 'patients'
+            )
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+
 # Detail View
 @method_decorator(login_required, name='dispatch')
 class PatientDetailView(DetailView):
@@ -99,87 +232,72 @@ class PatientDeleteView(DeleteView):
 
 #Icare View aka View Patient by geocode
 @method_decorator(login_required, name='dispatch')
-class ICareBoardView(ListView):
+class ICareBoardView(KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'patients/icare_board.html'
     context_object_name = 'patients'
     paginate_by = 10  # Default pagination value
+    keyset_sort_fields = BOARD_KEYSET_SORT_FIELDS
 
     def get_paginate_by(self, queryset):
         # Get the pagination setting from the request, default to 10 if not specified or invalid
-        items_per_page = self.request.GET.get('paginate_by', '10')
-        try:
-            return int(items_per_page)
-        except (ValueError, TypeError):
-            return self.paginate_by
+        return clamp_page_size(self.request.GET.get('paginate_by'), self.paginate_by)
 
-    def get_queryset(self):
+    def get_geocode_id(self):
         geocode_id = self.kwargs.get('geocode_id')
         if geocode_id:
-            geocode = get_object_or_404(Geocode, id=geocode_id)
-        elif self.request.user.is_authenticated and self.request.user.primary_geocode:
-            geocode = self.request.user.primary_geocode
-        else:
-            geocode = None
+            try:
+                return uuid.UUID(geocode_id)
+            except ValueError:
+                raise Http404("No Geocode matches the given query.")
+        elif self.request.user.is_authenticated:
+            return self.request.user.primary_geocode_id
+        return None
 
-        self.geocode = geocode  # Store geocode for use in context
+    def get_queryset(self):
+        geocode_id = self.get_geocode_id()
+        if not geocode_id:
+            self.snapshot = None
+            return []
 
-        if geocode:
-            patients_queryset = geocode.patients.prefetch_related('treated_by').all()
+        try:
+            self.snapshot = get_board_snapshot(geocode_id)
+        except Geocode.DoesNotExist:
+            raise Http404("No Geocode matches the given query.")
+        rows = self.snapshot['rows']
 
-            # Apply search filter if a query is provided
-            search_query = self.request.GET.get('search', '')
-            if search_query:
-                patients_queryset = patients_queryset.filter(
-                    Q(name__icontains=search_query) |
-                    Q(treatment_area__icontains=search_query)
-                )
+        # Apply search filter if a query is provided; matches come back ranked
+        search_query = self.request.GET.get('search', '')
+        if search_query:
+            rows = search_rows(rows, search_query)
 
-            # Apply sorting
-            sort_by = self.request.GET.get('sort', 'name')
-            if sort_by in ['name', 'treatment_area', 'bed_id', 'date_of_birth']:
-                patients_queryset = patients_queryset.order_by(sort_by)
+        # Apply sorting; snapshot rows are already ordered by name
+        sort_by = self.request.GET.get('sort', 'name')
+        if sort_by in ['treatment_area', 'bed_id', 'date_of_birth']:
+            rows = sorted(rows, key=lambda row: row[sort_by])
+        elif search_query and sort_by == 'name' and 'sort' in self.request.GET:
+            rows = sorted(rows, key=lambda row: row['name'])
 
-            return patients_queryset
-        else:
-            return Patient.objects.none()
+        return rows
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-
-        # Ensure each patient has full context with treatment details
-        for patient in context['patients']:
-            # Check if the current user is assigned to the patient
-            treatment_records = TreatmentRecord.objects.filter(patient=patient)
-
-            patient.is_assigned_to_user = False
-            patient.assigned_workers = []
-
-            for record in treatment_records:
-                worker = record.worker
-                if worker == user:
-                    patient.is_assigned_to_user = True
-
-                # Append worker details to assigned_workers
-                patient.assigned_workers.append({
-                    'name': worker.name,
-                    'role': worker.role.name,
-                    'is_user': worker == user
-                })
-
-            # Determine if the user can assign or unassign
-            patient.can_assign = (
-                (user.role.name == 'doctor' and not patient.doctor_assigned and patient.nurse_count > 0) or
-                (user.role.name == 'nurse' and patient.nurse_count < 3 and not patient.is_assigned_to_user)
-            )
-            patient.can_unassign = patient.is_assigned_to_user
 
-        context['geocode'] = self.geocode
-        context['other_geocodes'] = Geocode.objects.exclude(id=self.geocode.id) if self.geocode else Geocode.objects.all()
+        # Overlay the current user's assign/unassign flags on the cached rows
+        context['patients'] = apply_user_flags(context['patients'], self.request.user)
+
+        if self.snapshot:
+            context['geocode'] = self.snapshot['geocode']
+            context['other_geocodes'] = self.snapshot['other_geocodes']
+            context['board_version'] = self.snapshot['version']
+        else:
+            context['geocode'] = None
+            context['board_version'] = None
+            context['other_geocodes'] = Geocode.objects.all()
         context['search_query'] = self.request.GET.get('search', '')
         context['sort_by'] = self.request.GET.get('sort', 'name')
-        context['paginate_by'] = self.get_paginate_by(self.get_queryset())  # Add paginate_by to the context
+        # Add paginate_by to the context
+        context['paginate_by'] = self.get_paginate_by(self.object_list)
         return context
 
     def post(self, request, *args, **kwargs):
@@ -213,22 +331,107 @@ class ICareBoardView(ListView):
         except ValueError as e:
             messages.error(request, f"Failed to assign/unassign: {str(e)}")
 
+        # Boards patch the row in place instead of reloading the whole page
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({
+                'patient': self.get_board_row(patient),
+                'messages': [
+                    str(message) for message in messages.get_messages(request)
+                ],
+            })
+
         referer = request.META.get('HTTP_REFERER', request.path)
         return redirect(referer)
 
+    def get_board_row(self, patient):
+        if not patient.geocode_id:
+            return None
+        snapshot = get_board_snapshot(patient.geocode_id)
+        for row in snapshot['rows']:
+            if row['id'] == patient.id:
+                return apply_user_flags([row], self.request.user)[0]
+        return None
+
+
+BOARD_EVENTS_POLL_INTERVAL = 2  # seconds between snapshot version checks
+BOARD_EVENTS_HEARTBEAT = 15  # seconds of silence before a keep-alive comment
+BOARD_EVENTS_MAX_AGE = 300  # seconds before the client is asked to reconnect
+BOARD_EVENTS_RETRY = 3000  # milliseconds the browser waits before reconnecting
+
+
+@login_required
+async def icare_board_events(request, geocode_id):
+    """Stream assignment changes for a geocode's board as server-sent events.
+
+    Each ``assignment`` event carries the patient id, ``nurse_count``,
+    ``doctor_assigned``, ``state`` and assigned ``workers`` of a changed row;
+    a ``removed`` event is sent when a patient leaves the board. The event id
+    is the snapshot version, so a reconnecting client only receives rows
+    when the board changed since the version it last saw (``Last-Event-ID``
+    or the ``version`` query parameter).
+
+    Changes are detected by polling the cached board version, so every worker
+    must share the cache backend. Under WSGI the response cannot be held
+    open; the stream then closes after one batch and the browser reconnects
+    after ``BOARD_EVENTS_RETRY`` milliseconds.
+    """
+    try:
+        geocode_id = uuid.UUID(geocode_id)
+    except ValueError:
+        raise Http404("No Geocode matches the given query.")
+
+    get_snapshot = sync_to_async(get_board_snapshot)
+    try:
+        snapshot = await get_snapshot(geocode_id)
+    except Geocode.DoesNotExist:
+        raise Http404("No Geocode matches the given query.")
+
+    client_version = request.headers.get('Last-Event-ID') or request.GET.get('version')
+    max_age = BOARD_EVENTS_MAX_AGE if isinstance(request, ASGIRequest) else 0
+
+    async def stream(snapshot):
+        loop = asyncio.get_running_loop()
+        started = last_sent = loop.time()
+        if str(snapshot['version']) == client_version:
+            previous_rows, version = snapshot['rows'], snapshot['version']
+        else:
+            previous_rows, version = None, None
+
+        yield format_sse(retry=BOARD_EVENTS_RETRY, comment='connected')
+        while True:
+            if snapshot['version'] != version:
+                for event, payload in board_deltas(previous_rows, snapshot['rows']):
+                    yield format_sse(payload, event=event)
+                yield format_sse(event_id=snapshot['version'])
+                previous_rows, version = snapshot['rows'], snapshot['version']
+                last_sent = loop.time()
+            elif loop.time() - last_sent >= BOARD_EVENTS_HEARTBEAT:
+                yield format_sse(comment='heartbeat')
+                last_sent = loop.time()
+
+            if loop.time() - started >= max_age:
+                return
+            await asyncio.sleep(BOARD_EVENTS_POLL_INTERVAL)
+            try:
+                snapshot = await get_snapshot(geocode_id)
+            except Geocode.DoesNotExist:
+                return
+
+    response = StreamingHttpResponse(stream(snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @method_decorator(login_required, name='dispatch')
-class MyBoardView(ListView):
+class MyBoardView(KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'patients/my_board.html'
     context_object_name = 'patients'
+    keyset_sort_fields = BOARD_KEYSET_SORT_FIELDS
 
     def get_paginate_by(self, queryset):
         # Get the pagination setting from the request, default to 10 if not specified or invalid
-        items_per_page = self.request.GET.get('paginate_by', '10')
-        try:
-            return int(items_per_page)
-        except (ValueError, TypeError):
-            return 10
+        return clamp_page_size(self.request.GET.get('paginate_by'), 10)
 
     def get_queryset(self):
             user = self.request.user  # Access the current user
@@ -240,15 +443,19 @@ class MyBoardView(ListView):
                 # Apply search filter if a query is provided
                 search_query = self.request.GET.get('search', '')
                 if search_query:
-                    assigned_patients = assigned_patients.filter(
-                        Q(name__icontains=search_query) |
-                        Q(treatment_area__icontains=search_query)
-                    )
+                    assigned_patients = search_patients(assigned_patients, search_query)
 
-                # Apply sorting
+                # Apply sorting; searches without an explicit sort are ranked
+                # by similarity
                 sort_by = self.request.GET.get('sort', 'name')
-                if sort_by in ['name', 'treatment_area', 'bed_id', 'date_of_birth']:
-                    assigned_patients = assigned_patients.order_by(sort_by)
+                if search_query and 'sort' not in self.request.GET:
+                    assigned_patients = assigned_patients.order_by(
+                        '-search_rank', 'name'
+                    )
+                else:
+                    assigned_patients = assigned_patients.order_by(
+                        *resolve_patient_sort(sort_by)
+                    )
 
                 return assigned_patients.distinct()  # Use distinct() to avoid duplicates
             else: